@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Benchmark the packaging pipeline with synthetic layers (and no network).
+
+Run it from the project directory.  Save a baseline first...
+
+.. code-block:: sh
+
+    python benchmarks/bench.py --save
+
+...and, from then on, each run is compared with it (and fails if anything
+got slower than the tolerance allows).
+
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import base64
+from contextlib import redirect_stdout
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+import zipfile
+import click
+
+# The benchmarks run against the code in this working tree.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from lambda_layer.config import Config, LayerConfig  # noqa: E402
+from lambda_layer.package import bash  # noqa: E402
+
+#: where the baseline is kept (by default)
+DEFAULT_BASELINE = Path('.benchmarks') / 'baseline.json'
+
+_SEED = 20200119  #: the seed for the synthetic files (so every run matches)
+_WORDS = (
+    'import', 'def', 'return', 'self', 'class', 'lambda', 'layer', 'for',
+    'in', 'if', 'else', 'None', 'True', 'False', 'with', 'as', 'yield'
+)  #: the words the synthetic modules are made of
+
+
+class Result(NamedTuple):
+    """The result of a benchmark."""
+
+    name: str  #: the name of the benchmark
+    runs: List[float]  #: the number of seconds each run took
+    size: int = 0  #: the number of bytes each run processed (if that matters)
+
+    @property
+    def seconds(self) -> float:
+        """Get the time the fastest run took (which is the least noisy)."""
+        return min(self.runs)
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Get the throughput of the fastest run (in MB per second)."""
+        if not self.size:
+            return None
+        return self.size / 1024 / 1024 / self.seconds
+
+    def to_dict(self) -> Dict:
+        """Get the result as a mapping of simple types."""
+        return {
+            'seconds': self.seconds,
+            'mb_per_s': self.throughput,
+            'runs': self.runs,
+            'size': self.size
+        }
+
+
+def _text(rnd: random.Random, size: int) -> bytes:
+    """Make up some source code (which compresses like source code)."""
+    words = []
+    length = 0
+    while length < size:
+        word = rnd.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).encode('utf-8')[:size]
+
+
+def _binary(rnd: random.Random, size: int) -> bytes:
+    """Make up a native extension (which compresses like one, roughly)."""
+    block = bytes(rnd.getrandbits(8) for _ in range(64 * 1024))
+    padding = bytes(64 * 1024)
+    data = bytearray()
+    while len(data) < size:
+        data.extend(block if rnd.random() < 0.6 else padding)
+    return bytes(data[:size])
+
+
+def _many_small(root: Path):
+    """Lots of small modules (like a big pure-Python library)."""
+    rnd = random.Random(_SEED)
+    for pkg in range(40):
+        pkg_dir = root / f"pkg{pkg}"
+        pkg_dir.mkdir(parents=True)
+        for module in range(100):
+            (pkg_dir / f"module{module}.py").write_bytes(
+                _text(rnd, rnd.randint(512, 4096))
+            )
+
+
+def _huge_so(root: Path):
+    """A few huge native extensions (like a numerical library)."""
+    rnd = random.Random(_SEED)
+    pkg_dir = root / 'native'
+    pkg_dir.mkdir(parents=True)
+    for lib in range(3):
+        (pkg_dir / f"_lib{lib}.cpython-38-x86_64-linux-gnu.so").write_bytes(
+            _binary(rnd, 24 * 1024 * 1024)
+        )
+
+
+def _deep(root: Path):
+    """Modules nested very deeply."""
+    rnd = random.Random(_SEED)
+    path = root
+    for depth in range(48):
+        path = path / f"level{depth}"
+        path.mkdir(parents=True)
+        for module in range(12):
+            (path / f"module{module}.py").write_bytes(
+                _text(rnd, rnd.randint(256, 2048))
+            )
+
+
+#: the shapes of the synthetic layers
+SHAPES: Dict[str, Callable[[Path], None]] = {
+    'many_small': _many_small,
+    'huge_so': _huge_so,
+    'deep': _deep
+}
+
+
+def _size(root: Path) -> int:
+    """Get the total size of the files in a directory tree."""
+    return sum(
+        path.stat().st_size for path in root.rglob('*') if path.is_file()
+    )
+
+
+def _time(func: Callable[[], None], repeat: int) -> List[float]:
+    """Time a function a few times."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def bench_archive(tmp_path: Path, repeat: int) -> List[Result]:
+    """
+    Benchmark archiving each shape of layer (compressing everything, and
+    then with every file already in the compressed entry cache).
+    """
+    results = []
+    for name, shape in SHAPES.items():
+        root = tmp_path / name
+        shape(root)
+        archive = tmp_path / f"{name}.zip"
+
+        def _archive():
+            bash._archive(  # pylint: disable=protected-access
+                dir_path=root, archive=archive, reproducible=True
+            )
+
+        os.environ['LAMBDA_LAYER_ENTRY_CACHE_SIZE'] = '0'
+        results.append(Result(
+            name=f"archive_{name}",
+            runs=_time(_archive, repeat),
+            size=_size(root)
+        ))
+        del os.environ['LAMBDA_LAYER_ENTRY_CACHE_SIZE']
+        # (Warm up the cache first.)
+        _archive()
+        results.append(Result(
+            name=f"archive_{name}_cached",
+            runs=_time(_archive, repeat),
+            size=_size(root)
+        ))
+    return results
+
+
+def bench_config(tmp_path: Path, repeat: int) -> List[Result]:
+    """Benchmark loading a configuration with hundreds of layers."""
+    config = Config(environment={}, layers=tuple(
+        LayerConfig(
+            name=f"layer-{idx}",
+            version='1.0.0',
+            packages=tuple(f"package-{idx}-{pkg}>=1.0" for pkg in range(20)),
+            reproducible=True,
+            bases=('base-1', 'base-2')
+        )
+        for idx in range(500)
+    ))
+    path = tmp_path / '.lambda-layer.toml'
+    path.write_text(config.dumps())
+    return [Result(
+        name='config_loadf_500',
+        runs=_time(lambda: Config.loadf(path), repeat),
+        size=path.stat().st_size
+    )]
+
+
+def _digest(data: bytes) -> str:
+    """Get a file's digest the way a wheel's ``RECORD`` has it."""
+    return base64.urlsafe_b64encode(
+        hashlib.sha256(data).digest()
+    ).decode('ascii').rstrip('=')
+
+
+def _wheel(wheelhouse: Path, name: str, modules: int):
+    """Build a wheel of made-up modules (without needing a build backend)."""
+    rnd = random.Random(_SEED)
+    dist_info = f"{name}-1.0.dist-info"
+    files = {
+        f"{name}/__init__.py": b'',
+        **{
+            f"{name}/module{module}.py": _text(rnd, rnd.randint(512, 4096))
+            for module in range(modules)
+        },
+        f"{dist_info}/METADATA": (
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n"
+        ).encode('utf-8'),
+        f"{dist_info}/WHEEL": (
+            b"Wheel-Version: 1.0\nGenerator: bench\nRoot-Is-Purelib: true\n"
+            b"Tag: py3-none-any\n"
+        ),
+    }
+    record = [
+        f"{path},sha256={_digest(data)},{len(data)}"
+        for path, data in files.items()
+    ]
+    record.append(f"{dist_info}/RECORD,,")
+    files[f"{dist_info}/RECORD"] = '\n'.join(record).encode('utf-8')
+    wheel = wheelhouse / f"{name}-1.0-py3-none-any.whl"
+    with zipfile.ZipFile(str(wheel), 'w', zipfile.ZIP_DEFLATED) as _zip:
+        for path, data in files.items():
+            _zip.writestr(path, data)
+
+
+def bench_make(tmp_path: Path, repeat: int) -> List[Result]:
+    """Benchmark building a whole layer from a local wheelhouse."""
+    wheelhouse = tmp_path / 'wheelhouse'
+    wheelhouse.mkdir()
+    for idx in range(4):
+        _wheel(wheelhouse, f"benchpkg{idx}", modules=250)
+    layer = LayerConfig(
+        name='bench',
+        version='1.0.0',
+        packages=tuple(f"benchpkg{idx}" for idx in range(4)),
+        venv=False,
+        reproducible=True,
+        precompile=True,
+        prune=None
+    )
+
+    def _make():
+        # (Even a silent build has a little to say.)
+        with redirect_stdout(io.StringIO()):
+            bash.make(
+                dist_dir=tmp_path / 'dist',
+                layer=layer,
+                silent=True,
+                wheelhouse=wheelhouse
+            )
+
+    return [Result(name='make_wheelhouse', runs=_time(_make, repeat))]
+
+
+#: the benchmarks
+BENCHMARKS = (bench_archive, bench_config, bench_make)
+
+
+def _meta() -> Dict[str, str]:
+    """Describe the machine the benchmarks ran on."""
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'cpus': str(os.cpu_count())
+    }
+
+
+def compare(
+        results: List[Result],
+        baseline: Dict,
+        tolerance: float
+) -> List[str]:
+    """
+    Compare results with a baseline.
+
+    :param results: the results
+    :param baseline: the baseline
+    :param tolerance: how much slower (as a fraction) a benchmark may get
+    :return: the names of the benchmarks that got too much slower
+    """
+    regressions = []
+    for result in results:
+        base = baseline['results'].get(result.name)
+        if base and result.seconds > base['seconds'] * (1 + tolerance):
+            regressions.append(result.name)
+    return regressions
+
+
+def table(results: List[Result], baseline: Optional[Dict]) -> str:
+    """
+    Create a table of results (and how they compare with the baseline).
+
+    :param results: the results
+    :param baseline: the baseline (if there is one)
+    :return: the table
+    """
+    headers = ('benchmark', 'seconds', 'MB/s', 'baseline', 'change')
+    rows = []
+    for result in results:
+        base = (baseline or {}).get('results', {}).get(result.name)
+        rows.append((
+            result.name,
+            f"{result.seconds:.3f}",
+            f"{result.throughput:.1f}" if result.throughput else '',
+            f"{base['seconds']:.3f}" if base else '',
+            f"{(result.seconds / base['seconds'] - 1) * 100:+.1f}%" if base
+            else ''
+        ))
+    widths = [
+        max(len(row[col]) for row in [headers, *rows])
+        for col in range(len(headers))
+    ]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+        .rstrip()
+        for row in [headers, tuple('-' * width for width in widths), *rows]
+    )
+
+
+@click.command()
+@click.option(
+    'repeat', '-n', '--repeat',
+    type=click.IntRange(min=1),
+    default=3,
+    help='The number of times to run each benchmark.')
+@click.option(
+    'select', '-k',
+    default=None,
+    help='Only run the benchmarks with this in their names (like archive, '
+         'config or make).')
+@click.option(
+    'baseline', '-b', '--baseline',
+    type=click.Path(dir_okay=False),
+    default=str(DEFAULT_BASELINE),
+    help='The baseline file.')
+@click.option(
+    '--save',
+    is_flag=True,
+    help='Save the results as the new baseline.')
+@click.option(
+    'tolerance', '-t', '--tolerance',
+    type=click.FloatRange(min=0),
+    default=0.25,
+    help='How much slower (as a fraction) a benchmark may get.')
+def main(
+        repeat: int,
+        select: str,
+        baseline: str,
+        save: bool,
+        tolerance: float
+):
+    """Benchmark the packaging pipeline."""
+    # Nothing the benchmarks do should depend on (or touch) the user's own
+    # settings, caches or the network.
+    os.environ['PIP_CONFIG_FILE'] = os.devnull
+    os.environ['PIP_NO_INDEX'] = '1'
+    os.environ['PIP_ROOT_USER_ACTION'] = 'ignore'
+    results: List[Result] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['LAMBDA_LAYER_CACHE_DIR'] = str(Path(tmp_dir) / 'cache')
+        for benchmark in BENCHMARKS:
+            if select and select not in benchmark.__name__:
+                continue
+            bench_dir = Path(tmp_dir) / benchmark.__name__
+            bench_dir.mkdir()
+            results.extend(benchmark(bench_dir, repeat))
+    _baseline = Path(baseline)
+    saved = (
+        json.loads(_baseline.read_text()) if _baseline.is_file() else None
+    )
+    click.echo(table(results, None if save else saved))
+    if save:
+        _baseline.parent.mkdir(parents=True, exist_ok=True)
+        _baseline.write_text(json.dumps({
+            'meta': _meta(),
+            'results': {result.name: result.to_dict() for result in results}
+        }, indent=2))
+        click.echo(f"Saved the baseline to {_baseline}")
+        return
+    if saved is None:
+        click.echo(f"There's no baseline to compare with ({_baseline}).")
+        return
+    if saved.get('meta') != _meta():
+        click.echo(click.style(
+            "The baseline was saved on a different machine (or Python).",
+            fg='yellow'
+        ))
+    regressions = compare(results, saved, tolerance)
+    if regressions:
+        click.echo(click.style(
+            f"Slower than the baseline allows: {', '.join(regressions)}",
+            fg='red'
+        ))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=no-value-for-parameter
@@ -18,12 +18,28 @@ It can be used as a handy facility for running the task from a command line.
 .. currentmodule:: lambda_layer.cli
 .. moduleauthor:: Pat Daburu <pat@daburu.net>
 """
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+import json
 import logging
+import os
+from pathlib import Path
+import sys
+from typing import Tuple
 import click
 from .__init__ import __version__
 from . import env
-from .package import make
-from .config import Config
+from .package import make_all, summary
+from .package import (
+    aio, factor, importtime, lock, server, size, targets, trace, watch
+)
+from .package.cache import BuildCache
+from .package.sinks import StreamSink, sink
+from .package.store import PackageStore
+from .package.wheelhouse import fill
+from .config import Config, ProfileConfig
 
 LOGGING_LEVELS = {
     0: logging.NOTSET,
@@ -71,16 +87,130 @@ def cli(info: Info, verbose: int):
     info.verbose = verbose
 
 
+def _load(configf: str, locked: bool = False) -> Config:
+    """
+    Load a configuration, with a layer for each target (and their locks
+    applied).
+
+    :param configf: the path to the configuration file
+    :param locked: ``True`` to fail if a layer's lock is missing or stale
+    :return: the configuration
+    """
+    config = Config.loadf(configf)
+    # If there's a lockfile, the layers it covers install exactly what's in
+    # it (so they don't have to be resolved again).
+    _lock = lock.Lock.loadf(lock.path(configf))
+    layers = []
+    for layer in (
+            _layer for layer in config.layers
+            for _layer in targets.expand(layer)
+    ):
+        _locked = _lock.get(layer)
+        if _locked:
+            layers.append(_locked.apply(layer))
+            continue
+        name = targets.label(layer)
+        problem = (
+            f"The lock for {name} is stale." if name in _lock.layers
+            else f"{name} isn't locked."
+        )
+        if locked:
+            raise click.ClickException(
+                f"{problem}  (Run `lambda-layer lock` to update it.)"
+            )
+        if _lock.layers:
+            click.echo(click.style(
+                f"{problem}  Its requirements will be resolved again.",
+                fg='yellow'
+            ), err=True)
+        layers.append(layer)
+    return config._replace(layers=tuple(layers))
+
+
 @cli.command()
 @click.option(
     'config', '-c', '--config',
     envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
     default=None,
     type=click.Path(exists=True))
+@click.option(
+    'jobs', '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='The number of layers to build at once. (Defaults to the CPU count.)')
+@click.option(
+    '--cache/--no-cache',
+    default=True,
+    help='Reuse layers that have been built before.')
+@click.option(
+    'wheelhouse', '-w', '--wheelhouse',
+    envvar=env.Vars.LAMBDA_LAYER_WHEELHOUSE.name,
+    type=click.Path(file_okay=False),
+    default=None,
+    help='Install the layers from wheels collected in this directory.')
+@click.option(
+    '--offline',
+    is_flag=True,
+    help="Use the wheelhouse as it is (don't download anything).")
+@click.option(
+    'output', '-o', '--output',
+    default=None,
+    help='Write the archives to this directory, an s3://bucket/prefix URL, '
+         'or - for standard output. (Defaults to the distribution '
+         'directory.)')
+@click.option(
+    '--locked',
+    is_flag=True,
+    help="Fail if a layer's lock is missing or stale.")
+@click.option(
+    'trace_', '--trace',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help='Write a Chrome trace of the builds to this file.')
+@click.option(
+    'trace_summary', '--trace-summary',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the time each layer spent in each stage to this JSON file.")
+@click.option(
+    '--engine',
+    type=click.Choice(['process', 'async']),
+    default='process',
+    help='Build each layer in a process of its own, or all of them in this '
+         'one on an event loop.')
+@click.option(
+    'max_processes', '--max-processes',
+    type=click.IntRange(min=1),
+    default=None,
+    help='With the async engine, the most processes (like pip) to run at '
+         'once. (Defaults to the CPU count.)')
+@click.option(
+    'max_compression', '--max-compression',
+    type=click.IntRange(min=1),
+    default=None,
+    help='With the async engine, the most files to compress at once. '
+         '(Defaults to the CPU count.)')
+@click.option(
+    'use_server', '--server/--no-server',
+    default=True,
+    help='Send the builds to `lambda-layer serve` (if it is running, and '
+         'the engine is process).')
 @pass_info
 def package(
         _: Info,
-        config: str
+        config: str,
+        jobs: int,
+        cache: bool,
+        wheelhouse: str,
+        offline: bool,
+        output: str,
+        locked: bool,
+        trace_: str,
+        trace_summary: str,
+        engine: str,
+        max_processes: int,
+        max_compression: int,
+        use_server: bool
 ):
     """Create configured packages."""
     # Figure out where the configuration file is.
@@ -89,15 +219,533 @@ def package(
         else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
     )
     # Load the configuration.
-    config = Config.loadf(_configf)
-    # Iterate the layers in the configuration and create each one.
-    for layer in config.layers:
-        click.echo(f"name:    {layer.name}")
-        click.echo(f"version: {layer.version}")
-        make(
-            dist_dir=env.get(env.Vars.LAMBDA_LAYER_DIST_DIR),
-            layer=layer
+    config = _load(_configf, locked=locked)
+    dist_dir = env.get(env.Vars.LAMBDA_LAYER_DIST_DIR)
+    _sink = sink(output if output else dist_dir)
+    # If the archive is going to standard output, everything else has to go
+    # somewhere else.
+    streaming = isinstance(_sink, StreamSink)
+    if streaming and len(config.layers) != 1:
+        raise click.UsageError(
+            'Only one layer can be written to standard output.'
+        )
+    with redirect_stdout(sys.stderr if streaming else sys.stdout):
+        # Build the layers in the configuration.
+        options = dict(
+            dist_dir=dist_dir,
+            layers=config.layers,
+            jobs=jobs,
+            cache=cache,
+            wheelhouse=wheelhouse,
+            offline=offline,
+            sink=_sink
+        )
+        # If there's a build server running (that builds layers the way we
+        # would), it does the work.  (It has limits of its own, so it's only
+        # used with the process engine.)
+        client = (
+            server.Client() if use_server and engine == 'process' else None
         )
+        if client and not client.available():
+            client = None
+        problem = client.problem() if client else None
+        if problem:
+            click.echo(click.style(
+                f"{problem}  The layers will be built here instead.",
+                fg='yellow'
+            ), err=True)
+            client = None
+        if client:
+            click.echo(f"Building with the server at {client.socket_path}")
+            results = server.make_all(
+                client,
+                layers=config.layers,
+                sink=_sink,
+                jobs=jobs,
+                cache=cache,
+                wheelhouse=wheelhouse,
+                offline=offline
+            )
+        elif engine == 'async':
+            results = asyncio.run(aio.make_all(
+                processes=max_processes,
+                compression=max_compression,
+                **options
+            ))
+        else:
+            results = make_all(**options)
+        # Let 'em know how it all went.
+        click.echo(summary(results))
+    # If we're supposed to, write down where the time went.
+    spans = {result.name: result.spans for result in results}
+    if trace_:
+        Path(trace_).write_text(json.dumps(trace.chrome(spans)))
+    if trace_summary:
+        Path(trace_summary).write_text(
+            json.dumps(trace.summary(spans), indent=2)
+        )
+    # If any of the layers failed, so do we.
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+
+@cli.command('watch')
+@click.option(
+    'config', '-c', '--config',
+    envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
+    default=None,
+    type=click.Path(exists=True))
+@click.option(
+    'jobs', '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='The number of layers to build at once. (Defaults to the CPU count.)')
+@click.option(
+    '--cache/--no-cache',
+    default=True,
+    help='Reuse layers that have been built before.')
+@click.option(
+    'wheelhouse', '-w', '--wheelhouse',
+    envvar=env.Vars.LAMBDA_LAYER_WHEELHOUSE.name,
+    type=click.Path(file_okay=False),
+    default=None,
+    help='Install the layers from wheels collected in this directory.')
+@click.option(
+    '--offline',
+    is_flag=True,
+    help="Use the wheelhouse as it is (don't download anything).")
+@click.option(
+    '--locked',
+    is_flag=True,
+    help="Don't build while a layer's lock is missing or stale.")
+@click.option(
+    '--incremental/--no-incremental',
+    default=True,
+    help="Patch each layer's last build, installing only the distributions "
+         "that changed.")
+@click.option(
+    'interval', '-i', '--interval',
+    type=click.FloatRange(min=0.1),
+    default=0.5,
+    help='The seconds between checks for changes.')
+def watch_(
+        config: str,
+        jobs: int,
+        cache: bool,
+        wheelhouse: str,
+        offline: bool,
+        locked: bool,
+        incremental: bool,
+        interval: float
+):
+    """Build the configured packages, then rebuild the ones that change."""
+    _configf = (
+        config if config
+        else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
+    )
+    dist_dir = env.get(env.Vars.LAMBDA_LAYER_DIST_DIR)
+
+    def _layers():
+        layers = _load(_configf, locked=locked).layers
+        return [
+            layer._replace(incremental=True) for layer in layers
+        ] if incremental else layers
+
+    def _failed(ex: Exception):
+        click.echo(click.style(
+            f"Couldn't load {_configf}: {ex}  (Waiting for the next change.)",
+            fg='red'
+        ), err=True)
+
+    # The same workers build the layers every time (so they only start up
+    # once).
+    with ProcessPoolExecutor(
+            max_workers=jobs if jobs else (os.cpu_count() or 1)
+    ) as pool:
+        def _build(layers):
+            names = ', '.join(targets.label(layer) for layer in layers)
+            click.echo(click.style(f"Building {names}", bold=True))
+            try:
+                results = make_all(
+                    dist_dir=dist_dir,
+                    layers=layers,
+                    jobs=jobs,
+                    cache=cache,
+                    wheelhouse=wheelhouse,
+                    offline=offline,
+                    pool=pool
+                )
+            except SystemExit as sex:
+                # (Filling the wheelhouse can fail, too.)
+                click.echo(click.style(
+                    f"The build exited with code {sex.code}", fg='red'
+                ))
+            else:
+                click.echo(summary(results))
+            click.echo(f"Watching {_configf} for changes...")
+
+        try:
+            watch.Watcher(
+                _configf, load=_layers, interval=interval
+            ).watch(build=_build, failed=_failed)
+        except KeyboardInterrupt:
+            click.echo("Stopped watching.")
+
+
+@cli.command('serve')
+@click.option(
+    'socket_path', '-s', '--socket',
+    envvar=env.Vars.LAMBDA_LAYER_SERVER.name,
+    type=click.Path(dir_okay=False),
+    default=None,
+    help='The socket to listen on. (Defaults to server.sock in the build '
+         'cache directory.)')
+@click.option(
+    'jobs', '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='The number of layers to build at once. (Defaults to the CPU count.)')
+def serve(socket_path: str, jobs: int):
+    """Build layers for other lambda-layer processes on this machine."""
+    try:
+        _server = server.BuildServer(
+            socket_path=socket_path if socket_path else server.path(),
+            dist_dir=Path(env.get(env.Vars.LAMBDA_LAYER_CACHE_DIR)) / 'server',
+            jobs=jobs
+        )
+    except FileExistsError as fee:
+        raise click.ClickException(str(fee))
+    click.echo(
+        f"Building up to {_server.jobs} layers at once for clients of "
+        f"{_server.socket_path}"
+    )
+    try:
+        _server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo("Stopped serving.")
+    finally:
+        _server.server_close()
+
+
+@cli.command()
+@click.option(
+    'config', '-c', '--config',
+    envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
+    default=None,
+    type=click.Path(exists=True))
+@click.option(
+    'wheelhouse', '-w', '--wheelhouse',
+    envvar=env.Vars.LAMBDA_LAYER_WHEELHOUSE.name,
+    type=click.Path(file_okay=False),
+    required=True,
+    help='The wheelhouse directory.')
+@click.option(
+    'jobs', '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='The number of downloads (or builds) to run at once.')
+def wheelhouse(config: str, wheelhouse: str, jobs: int):
+    """Collect wheels for every configured package."""
+    _configf = (
+        config if config
+        else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
+    )
+    _wheelhouse = fill(
+        wheelhouse=wheelhouse,
+        layers=Config.loadf(_configf).layers,
+        jobs=jobs
+    )
+    click.echo(
+        f"{len(list(_wheelhouse.glob('*.whl')))} wheels in {_wheelhouse}"
+    )
+
+
+@cli.command('lock')
+@click.option(
+    'config', '-c', '--config',
+    envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
+    default=None,
+    type=click.Path(exists=True))
+@click.option(
+    'wheelhouse', '-w', '--wheelhouse',
+    envvar=env.Vars.LAMBDA_LAYER_WHEELHOUSE.name,
+    type=click.Path(file_okay=False, exists=True),
+    default=None,
+    help='Resolve the layers from wheels collected in this directory.')
+@click.option(
+    'jobs', '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='The number of layers to resolve at once.')
+@click.argument('names', nargs=-1)
+def lock_(
+        config: str,
+        wheelhouse: str,
+        jobs: int,
+        names: Tuple[str, ...]
+):
+    """Resolve the layers' requirements and write them to a lockfile."""
+    _configf = (
+        config if config
+        else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
+    )
+    lockf = lock.path(_configf)
+    layers = [
+        _layer for layer in Config.loadf(_configf).layers
+        if not names or layer.name in names
+        for _layer in targets.expand(layer)
+    ]
+    try:
+        locked = lock.lock(
+            layers=layers,
+            wheelhouse=Path(wheelhouse).resolve() if wheelhouse else None,
+            jobs=jobs
+        )
+    except ValueError as vex:
+        raise click.ClickException(str(vex))
+    for layer in locked:
+        click.echo(
+            f"Locked   {layer.name}: "
+            f"{len(layer.distributions)} distributions"
+        )
+    # The layers we didn't resolve keep the locks they had.
+    lockf.write_text(lock.Lock.loadf(lockf).update(locked).dumps())
+    click.echo(f"Wrote    {lockf}")
+
+
+@cli.command('size')
+@click.option(
+    'config', '-c', '--config',
+    envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
+    default=None,
+    type=click.Path(exists=True))
+@click.argument('names', nargs=-1)
+def size_(config: str, names: Tuple[str, ...]):
+    """Break down the size of built layers by package."""
+    _configf = (
+        config if config
+        else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
+    )
+    dist_dir = Path(env.get(env.Vars.LAMBDA_LAYER_DIST_DIR))
+    for layer in Config.loadf(_configf).layers:
+        if names and layer.name not in names:
+            continue
+        for _layer in targets.expand(layer):
+            archive = dist_dir / targets.archive_name(_layer)
+            click.echo(click.style(f"{archive.name}", bold=True))
+            if not archive.is_file():
+                click.echo(
+                    click.style(f"{archive} hasn't been built.", fg='red')
+                )
+                continue
+            click.echo(size.table(
+                size.analyze_archive(archive),
+                limit=layer.max_size * 1024 * 1024
+            ))
+
+
+@cli.command('factor')
+@click.option(
+    'config', '-c', '--config',
+    envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
+    default=None,
+    type=click.Path(exists=True))
+@click.option(
+    'wheelhouse', '-w', '--wheelhouse',
+    envvar=env.Vars.LAMBDA_LAYER_WHEELHOUSE.name,
+    type=click.Path(file_okay=False, exists=True),
+    default=None,
+    help='Resolve the layers from wheels collected in this directory.')
+@click.option(
+    'jobs', '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='The number of layers to resolve at once.')
+@click.option(
+    'min_layers', '--min-layers',
+    type=click.IntRange(min=2),
+    default=2,
+    help='The fewest layers that must share a distribution.')
+@click.option(
+    'max_layers', '--max-layers',
+    type=click.IntRange(min=2),
+    default=factor.MAX_LAYERS,
+    help='The most layers a function may use.')
+@click.option(
+    'write', '--write',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help='Write the factored configuration to this file.')
+def factor_(
+        config: str,
+        wheelhouse: str,
+        jobs: int,
+        min_layers: int,
+        max_layers: int,
+        write: str
+):
+    """Find the distributions layers share, and factor them out."""
+    _configf = (
+        config if config
+        else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
+    )
+    _config = Config.loadf(_configf)
+    try:
+        resolved = factor.resolve(
+            layers=_config.layers,
+            wheelhouse=Path(wheelhouse).resolve() if wheelhouse else None,
+            jobs=jobs
+        )
+    except ValueError as vex:
+        raise click.ClickException(str(vex))
+    bases = factor.plan(
+        resolved, min_layers=min_layers, max_layers=max_layers
+    )
+    click.echo(factor.table(resolved, bases))
+    # If we're supposed to, write out the new configuration.
+    if write:
+        Path(write).write_text(factor.factor(_config, resolved, bases).dumps())
+        click.echo(f"Wrote    {write}")
+
+
+@cli.command('profile')
+@click.option(
+    'config', '-c', '--config',
+    envvar=env.Vars.LAMBDA_LAYER_CONFIG.name,
+    default=None,
+    type=click.Path(exists=True))
+@click.option(
+    'runs', '-n', '--runs',
+    type=click.IntRange(min=1),
+    default=5,
+    help='The number of times to import the modules.')
+@click.option(
+    'output', '-o', '--output',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help='Write the results to this JSON file.')
+@click.option(
+    'depth', '-d', '--depth',
+    type=click.IntRange(min=1),
+    default=3,
+    help='The deepest imports to show.')
+@click.argument('names', nargs=-1)
+def profile_(
+        config: str,
+        runs: int,
+        output: str,
+        depth: int,
+        names: Tuple[str, ...]
+):
+    """Profile the cold-start import time of built layers."""
+    _configf = (
+        config if config
+        else env.get(env.Vars.LAMBDA_LAYER_CONFIG)
+    )
+    dist_dir = Path(env.get(env.Vars.LAMBDA_LAYER_DIST_DIR))
+    results = {}
+    ok = True
+    for layer in (
+            _layer for layer in Config.loadf(_configf).layers
+            if not names or layer.name in names
+            for _layer in targets.expand(layer)
+    ):
+        archive = dist_dir / targets.archive_name(layer)
+        click.echo(click.style(f"{archive.name}", bold=True))
+        if not archive.is_file():
+            click.echo(click.style(f"{archive} hasn't been built.", fg='red'))
+            ok = False
+            continue
+        # We can only import what was built for the interpreter we're
+        # running.
+        if targets.target(layer) not in (None, targets.host()):
+            click.echo(click.style(
+                f"{archive.name} is for another platform (or Python), so "
+                f"it can't be profiled here.",
+                fg='yellow'
+            ))
+            continue
+        settings = layer.profile if layer.profile else ProfileConfig()
+        result = importtime.profile(
+            archive=archive,
+            modules=settings.modules,
+            runs=runs
+        )
+        click.echo(importtime.tree(result, depth=depth))
+        # Let's see if the layer is within its budget.
+        over = (
+            settings.budget
+            and result.total_us / 1000 > settings.budget
+        )
+        if result.error or over:
+            ok = False
+            click.echo(click.style(
+                result.error if result.error
+                else f"That's over the {settings.budget} ms budget.",
+                fg='red'
+            ))
+        results[layer.name] = {
+            'archive': str(archive),
+            'budget_ms': settings.budget or None,
+            'ok': not (result.error or over),
+            **result.to_dict()
+        }
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2))
+    # If anything went wrong (or took too long), so do we.
+    if not ok:
+        sys.exit(1)
+
+
+@cli.group()
+def cache():
+    """Inspect and prune the build cache."""
+
+
+@cache.command('list')
+def cache_list():
+    """List the cached layers."""
+    _cache = BuildCache()
+    entries = _cache.entries()
+    for entry in entries:
+        last_used = datetime.fromtimestamp(entry.last_used)
+        click.echo(
+            f"{entry.key[:12]}  {entry.name}-{entry.version}  "
+            f"{entry.size / 1024 / 1024:.1f} MB  "
+            f"(last used {last_used:%Y-%m-%d %H:%M})"
+        )
+    click.echo(
+        f"{len(entries)} entries, {_cache.size() / 1024 / 1024:.1f} MB "
+        f"of {_cache.max_size / 1024 / 1024:.0f} MB in {_cache.path}"
+    )
+
+
+@cache.command('prune')
+@click.option(
+    'max_size', '-s', '--max-size',
+    type=click.IntRange(min=0),
+    default=None,
+    help='Shrink the cache to this many megabytes. (Defaults to the limit.)')
+@click.option('--all', 'all_', is_flag=True, help='Empty the cache.')
+def cache_prune(max_size: int, all_: bool):
+    """Remove the least-recently used layers from the cache."""
+    _cache = BuildCache()
+    evicted = _cache.prune(
+        max_size=0 if all_
+        else max_size * 1024 * 1024 if max_size is not None
+        else None
+    )
+    for entry in evicted:
+        click.echo(f"removed {entry.key[:12]}  {entry.name}-{entry.version}")
+    click.echo(
+        f"Removed {len(evicted)} entries "
+        f"({sum(entry.size for entry in evicted) / 1024 / 1024:.1f} MB)."
+    )
+    # Emptying the cache empties the package store, too.  (Otherwise, the
+    # store is trimmed to its own limit.)
+    _store = PackageStore()
+    removed = _store.clear() if all_ else _store.prune()
+    click.echo(f"Removed {removed} distributions from the package store.")
 
 
 @cli.command()
@@ -9,16 +9,129 @@ Configuration objects.
 .. moduleauthor:: Pat Daburu <pat@daburu.net>
 """
 from pathlib import Path
-from typing import Any, Mapping, NamedTuple, Tuple, Union
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple, Union
 import toml
 
 
+class PruneConfig(NamedTuple):
+    """Rules for removing files a layer doesn't need."""
+
+    exclude: Tuple[str, ...] = ()  #: glob patterns for files to remove
+    include: Tuple[str, ...] = ()  #: glob patterns for files to keep anyway
+    defaults: bool = True  #: ``False`` to skip the built-in exclusions
+
+    @classmethod
+    def load(cls, data: Union[bool, Mapping[str, Any]]) -> 'PruneConfig':
+        """
+        Load prune rules from a mapping of simple types.
+
+        :param data: the mapping (or just ``True`` for the default rules)
+        :return: the prune rules
+        """
+        if data is True:
+            return PruneConfig()
+        return PruneConfig(**{
+            **data,
+            'exclude': tuple(data.get('exclude', [])),
+            'include': tuple(data.get('include', []))
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the prune rules as a mapping of simple types."""
+        return {
+            'exclude': list(self.exclude),
+            'include': list(self.include),
+            'defaults': self.defaults
+        }
+
+
+class CompressionConfig(NamedTuple):
+    """Rules for how each file in a layer is compressed."""
+
+    store: Tuple[str, ...] = ()  #: glob patterns for files to store as-is
+    fast: Tuple[str, ...] = ()  #: glob patterns for files to compress fast
+    max: Tuple[str, ...] = ()  #: glob patterns for files to compress best
+    sample: int = 64 * 1024  #: the bytes of each file to try compressing
+    defaults: bool = True  #: ``False`` to skip the built-in store patterns
+
+    @classmethod
+    def load(
+            cls,
+            data: Union[bool, Mapping[str, Any]]
+    ) -> 'CompressionConfig':
+        """
+        Load compression rules from a mapping of simple types.
+
+        :param data: the mapping (or just ``True`` for the default rules)
+        :return: the compression rules
+        """
+        if data is True:
+            return CompressionConfig()
+        return CompressionConfig(**{
+            **data,
+            'store': tuple(data.get('store', [])),
+            'fast': tuple(data.get('fast', [])),
+            'max': tuple(data.get('max', []))
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the compression rules as a mapping of simple types."""
+        return {
+            'store': list(self.store),
+            'fast': list(self.fast),
+            'max': list(self.max),
+            'sample': self.sample,
+            'defaults': self.defaults
+        }
+
+
+class ProfileConfig(NamedTuple):
+    """Settings for profiling a layer's import time."""
+
+    modules: Tuple[str, ...] = ()  #: the modules a function would import
+    budget: float = 0  #: the longest the imports may take (in milliseconds)
+
+    @classmethod
+    def load(cls, data: Mapping[str, Any]) -> 'ProfileConfig':
+        """
+        Load profile settings from a mapping of simple types.
+
+        :param data: the mapping
+        :return: the profile settings
+        """
+        return ProfileConfig(**{
+            **data,
+            'modules': tuple(data.get('modules', []))
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the profile settings as a mapping of simple types."""
+        return {'modules': list(self.modules), 'budget': self.budget}
+
+
 class LayerConfig(NamedTuple):
     """A layer configuration."""
 
     name: str  #: the name of the layer
     version: str  #: the layer version
     packages: Tuple[str]  #: the installed packages
+    venv: bool = True  #: ``False`` to install without a virtual environment
+    compression_level: int = 6  #: the archive compression level (``0``-``9``)
+    reproducible: bool = False  #: ``True`` for reproducible archives
+    prune: Optional[PruneConfig] = None  #: rules for removing unneeded files
+    strip: bool = False  #: ``True`` to strip native extensions' debug symbols
+    precompile: bool = False  #: ``True`` to compile modules ahead of time
+    drop_sources: bool = False  #: ``True`` to remove precompiled sources
+    max_size: int = 250  #: the largest the layer may be unzipped (in MB)
+    profile: Optional[ProfileConfig] = None  #: import-time profile settings
+    incremental: bool = False  #: ``True`` to patch the previous build
+    deps: bool = True  #: ``False`` to install just the listed packages
+    bases: Tuple[str, ...] = ()  #: the shared layers it's used with
+    platforms: Tuple[str, ...] = ()  #: the Lambda architectures to build for
+    pythons: Tuple[str, ...] = ()  #: the Python versions to build for
+    store: bool = False  #: ``True`` to link packages from the package store
+    #: rules for how each file is compressed
+    compression: Optional[CompressionConfig] = None
 
     @classmethod
     def load(cls, data: Mapping[str, Any]) -> 'LayerConfig':
@@ -28,11 +141,49 @@ class LayerConfig(NamedTuple):
         :param data: the mapping
         :return: the layer configuration object
         """
+        prune = data.get('prune')
+        profile = data.get('profile')
+        compression = data.get('compression')
         return LayerConfig(**{
             **data,
-            'packages': tuple(data.get('packages', []))
+            'packages': tuple(data.get('packages', [])),
+            'prune': (
+                PruneConfig.load(prune) if prune not in (None, False)
+                else None
+            ),
+            'profile': ProfileConfig.load(profile) if profile else None,
+            'compression': (
+                CompressionConfig.load(compression)
+                if compression not in (None, False) else None
+            ),
+            'bases': tuple(data.get('bases', [])),
+            'platforms': tuple(data.get('platforms', [])),
+            'pythons': tuple(
+                str(python) for python in data.get('pythons', [])
+            )
         })
 
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the layer configuration as a mapping of simple types (leaving out
+        the settings that have their default values).
+        """
+        data = {
+            'name': self.name,
+            'version': self.version,
+            'packages': list(self.packages)
+        }
+        for field, value in self._asdict().items():
+            if field in data or value == self._field_defaults.get(field):
+                continue
+            if isinstance(value, tuple) and hasattr(value, 'to_dict'):
+                data[field] = value.to_dict()
+            elif isinstance(value, tuple):
+                data[field] = list(value)
+            else:
+                data[field] = value
+        return data
+
 
 class Config(NamedTuple):
     """A lambda layer configuration."""
@@ -55,6 +206,19 @@ class Config(NamedTuple):
             ])
         })
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the configuration as a mapping of simple types."""
+        data: Dict[str, Any] = {
+            'layers': [layer.to_dict() for layer in self.layers]
+        }
+        if self.environment:
+            data['environment'] = dict(self.environment)
+        return data
+
+    def dumps(self) -> str:
+        """Write the configuration as TOML."""
+        return toml.dumps(self.to_dict())
+
     @classmethod
     def loadf(
             cls,
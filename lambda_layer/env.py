@@ -23,6 +23,26 @@ class Vars(Enum):
     LAMBDA_LAYER_DIST_DIR = 'LAMBDA_LAYER_DIST_DIR'
     #: the path to the shell executable
     LAMBDA_LAYER_SHELL = 'LAMBDA_LAYER_SHELL'
+    #: the build cache directory
+    LAMBDA_LAYER_CACHE_DIR = 'LAMBDA_LAYER_CACHE_DIR'
+    #: the maximum size of the build cache (in megabytes)
+    LAMBDA_LAYER_CACHE_SIZE = 'LAMBDA_LAYER_CACHE_SIZE'
+    #: the shared wheelhouse directory
+    LAMBDA_LAYER_WHEELHOUSE = 'LAMBDA_LAYER_WHEELHOUSE'
+    #: the number of threads that compress archive files
+    LAMBDA_LAYER_ARCHIVE_JOBS = 'LAMBDA_LAYER_ARCHIVE_JOBS'
+    #: the maximum size of the compressed entry cache (in megabytes)
+    LAMBDA_LAYER_ENTRY_CACHE_SIZE = 'LAMBDA_LAYER_ENTRY_CACHE_SIZE'
+    #: the maximum size of the package store (in megabytes)
+    LAMBDA_LAYER_STORE_SIZE = 'LAMBDA_LAYER_STORE_SIZE'
+    #: the ``strip`` executable
+    LAMBDA_LAYER_STRIP = 'LAMBDA_LAYER_STRIP'
+    #: the number of lines of process output kept for error reports
+    LAMBDA_LAYER_OUTPUT_LINES = 'LAMBDA_LAYER_OUTPUT_LINES'
+    #: the path to the build server's socket
+    LAMBDA_LAYER_SERVER = 'LAMBDA_LAYER_SERVER'
+    #: the endpoint URL of an S3-compatible object store
+    LAMBDA_LAYER_S3_ENDPOINT_URL = 'LAMBDA_LAYER_S3_ENDPOINT_URL'
 
 
 class VarDef(NamedTuple):
@@ -44,6 +64,30 @@ _VARS = {
     Vars.LAMBDA_LAYER_SHELL: VarDef(
         default='/bin/bash',
         help='path to the shell executable'
+    ),
+    Vars.LAMBDA_LAYER_CACHE_DIR: VarDef(
+        default=str(Path('~/.cache/lambda-layer').expanduser()),
+        help='path to the build cache directory'
+    ),
+    Vars.LAMBDA_LAYER_CACHE_SIZE: VarDef(
+        default='2048',
+        help='the maximum size of the build cache (in megabytes)'
+    ),
+    Vars.LAMBDA_LAYER_ENTRY_CACHE_SIZE: VarDef(
+        default='1024',
+        help='the maximum size of the compressed entry cache (in megabytes)'
+    ),
+    Vars.LAMBDA_LAYER_STORE_SIZE: VarDef(
+        default='4096',
+        help='the maximum size of the package store (in megabytes)'
+    ),
+    Vars.LAMBDA_LAYER_STRIP: VarDef(
+        default='strip',
+        help='the strip executable'
+    ),
+    Vars.LAMBDA_LAYER_OUTPUT_LINES: VarDef(
+        default='100',
+        help='the number of lines of process output kept for error reports'
     )
 }  #: environment variable definitions
 
@@ -9,5 +9,6 @@ Packaging function.
 .. moduleauthor:: Pat Daburu <pat@daburu.net>
 """
 from .main import make
+from .parallel import LayerResult, make_all, summary
 
-__all__ = ['make']
+__all__ = ['make', 'make_all', 'LayerResult', 'summary']
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Build lots of layers at once on an event loop, within a single process.
+
+Each layer's build goes through its stages on a thread of its own, but the
+processes it starts (``pip`` and the rest) run on the event loop, which
+caps how many of them run at once.  Compressing archives is capped
+separately, so a few big layers can't starve everything else of CPUs.
+
+.. currentmodule:: lambda_layer.package.aio
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from contextvars import ContextVar, copy_context
+from functools import partial
+import io
+import os
+from pathlib import Path
+from queue import Queue
+import sys
+from typing import Callable, Iterable, List, Optional, TextIO, Tuple, Union
+from ..config import LayerConfig
+from . import archive, stream, trace
+from .common import ProcOutput, interpreter
+from .parallel import LayerResult, build, echo_output, prepare
+
+#: the buffer that the current context's output goes to (if it has one)
+_OUTPUT: ContextVar[Optional[io.StringIO]] = ContextVar(
+    'output', default=None
+)
+
+
+class _Router(io.TextIOBase):
+    """
+    A text stream that writes to the current context's buffer (if it has
+    one) or else to the stream it stands in for.
+    """
+
+    def __init__(self, _stream: TextIO):
+        """
+        Create a new instance.
+
+        :param _stream: the stream to write to outside of a build
+        """
+        super().__init__()
+        self._stream = _stream
+
+    @property
+    def encoding(self) -> str:
+        """Get the encoding of the stream we stand in for."""
+        return getattr(self._stream, 'encoding', None) or 'utf-8'
+
+    def _target(self) -> TextIO:
+        """Get the stream to write to."""
+        buffer = _OUTPUT.get()
+        return self._stream if buffer is None else buffer
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return self._target().isatty()
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+
+class Engine:
+    """Runs the processes that builds start on an event loop."""
+
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            processes: int
+    ):
+        """
+        Create a new instance.
+
+        :param loop: the event loop
+        :param processes: the most processes to run at once
+        """
+        self._loop = loop
+        self._processes = asyncio.Semaphore(max(1, processes))
+
+    async def run(
+            self,
+            cmd: Iterable[str],
+            forward: Callable[[stream.Line], None],
+            tail: int = 100,
+            **kwargs
+    ) -> Tuple[int, ProcOutput]:
+        """
+        Run a process (once there's room for it), forwarding its output line
+        by line.
+
+        :param cmd: the command
+        :param forward: called (on the event loop) with each line
+        :param tail: the number of lines to keep from each stream
+        :param kwargs: any other arguments for
+            :py:func:`stream.run_async`
+        :return: the process's return code, and the last lines it wrote
+        """
+        async with self._processes:
+            return await stream.run_async(cmd, forward, tail=tail, **kwargs)
+
+    def run_threadsafe(
+            self,
+            cmd: Iterable[str],
+            forward: Callable[[stream.Line], None],
+            tail: int = 100,
+            **kwargs
+    ) -> Tuple[int, ProcOutput]:
+        """
+        Run a process on the event loop from another thread, waiting for it
+        to finish.
+
+        The lines are forwarded on the calling thread (so they end up
+        wherever that thread's output goes).
+
+        :param cmd: the command
+        :param forward: called with each line
+        :param tail: the number of lines to keep from each stream
+        :param kwargs: any other arguments for
+            :py:func:`stream.run_async`
+        :return: the process's return code, and the last lines it wrote
+        """
+        # The event loop can't wait on us, so the queue can't be bounded.
+        # (The process still waits on the event loop to read its output.)
+        lines: Queue = Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self.run(cmd, lines.put_nowait, tail=tail, **kwargs),
+            self._loop
+        )
+        future.add_done_callback(lambda _: lines.put_nowait(None))
+        try:
+            for line in iter(lines.get, None):
+                forward(line)
+        except BaseException:
+            future.cancel()
+            raise
+        return future.result()
+
+
+def _build_on_thread(
+        engine: Engine,
+        dist_dir: str,
+        layer: LayerConfig,
+        silent: bool,
+        **options
+) -> LayerResult:
+    """
+    Build a single layer (on a thread of its own), running its processes on
+    the event loop and capturing its output.
+
+    :param engine: the engine that runs the processes
+    :param dist_dir: the path to the distribution directory
+    :param layer: the layer configuration
+    :param silent: ``True`` to suppress normal output
+    :param options: any other options for :py:func:`make`
+    :return: the result
+    """
+    # This runs in a context of its own, so none of this leaks into any
+    # other layer's build.
+    buffer = io.StringIO()
+    _OUTPUT.set(buffer)
+    stream.runner.set(engine.run_threadsafe)
+    trace.isolate()
+    result = build(dist_dir, layer, silent=silent, capture=False, **options)
+    return result._replace(output=buffer.getvalue() + result.output)
+
+
+async def make_all(
+        dist_dir: Union[str, Path],
+        layers: Iterable[LayerConfig],
+        jobs: Optional[int] = None,
+        processes: Optional[int] = None,
+        compression: Optional[int] = None,
+        silent: bool = False,
+        wheelhouse: Union[str, Path, None] = None,
+        offline: bool = False,
+        **options
+) -> List[LayerResult]:
+    """
+    Make several layers at once on the running event loop.
+
+    :param dist_dir: the path to the distribution directory
+    :param layers: the layer configurations
+    :param jobs: the maximum number of layers to build at once (defaults to
+        all of them)
+    :param processes: the maximum number of processes (like ``pip``) to run
+        at once (defaults to the number of CPUs)
+    :param compression: the maximum number of files to compress at once,
+        across all the layers (defaults to the number of CPUs)
+    :param silent: ``True`` to suppress normal output
+    :param wheelhouse: the path to a shared wheelhouse the layers are
+        installed from
+    :param offline: ``True`` to use the wheelhouse as it is (without
+        downloading anything into it first)
+    :param options: any other options for :py:func:`make`
+    :return: the results, in the same order as the layers
+    """
+    loop = asyncio.get_running_loop()
+    cpus = os.cpu_count() or 1
+    _layers = await loop.run_in_executor(None, partial(
+        prepare,
+        layers,
+        jobs=cpus,
+        silent=silent,
+        wheelhouse=wheelhouse,
+        offline=offline,
+        options=options
+    ))
+    if not _layers:
+        return []
+    # The interpreter is described once (and the answer kept), so we do it
+    # now instead of in the middle of a build, where its process wouldn't
+    # wait its turn.
+    await loop.run_in_executor(None, interpreter)
+    engine = Engine(loop, processes=processes or cpus)
+    _jobs = max(1, min(jobs or len(_layers), len(_layers)))
+
+    async def _build_one(idx: int, layer: LayerConfig):
+        # Each build gets a copy of the current context to make its own.
+        return idx, await loop.run_in_executor(pool, partial(
+            copy_context().run,
+            _build_on_thread, engine, str(dist_dir), layer, silent, **options
+        ))
+
+    results = {}
+    with redirect_stdout(_Router(sys.stdout)), \
+            redirect_stderr(_Router(sys.stderr)), \
+            archive.limit(compression or cpus), \
+            ThreadPoolExecutor(max_workers=_jobs) as pool:
+        # Report each layer's output as soon as the layer is finished.
+        for done in asyncio.as_completed([
+                _build_one(idx, layer) for idx, layer in enumerate(_layers)
+        ]):
+            idx, result = await done
+            echo_output(result)
+            results[idx] = result
+    return [results[idx] for idx in range(len(_layers))]
@@ -0,0 +1,623 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Create layer archives, compressing files on several threads at once.
+
+.. currentmodule:: lambda_layer.package.archive
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import copy
+from functools import partial
+import hashlib
+import os
+from pathlib import Path
+import struct
+import tempfile
+import threading
+import time
+from typing import (
+    BinaryIO, Callable, Deque, Iterable, Iterator, List, NamedTuple,
+    Optional, Union
+)
+import zipfile
+import zlib
+from .compression import STORE, Policy, Sample
+
+DEFAULT_LEVEL = 6  #: the default compression level (the same as ``zlib``'s)
+#: the timestamp given to every file in a reproducible archive
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+#: the fixed-size part of an entry's local header
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+#: files smaller than this (in bytes) are quicker to compress than to look up
+_MIN_CACHED = 8 * 1024
+#: the start of a cached entry (the length and CRC-32 of its deflate stream)
+_HEADER = struct.Struct('<QL')
+#: the seconds after which a cached entry that's still being written is
+#: given up on
+_STALE = 60 * 60
+#: caps the number of files compressed at once across every archive in the
+#: process (if it's set)
+_LIMIT: Optional[threading.Semaphore] = None
+
+
+class Entry(NamedTuple):
+    """A compressed archive entry that's ready to be written."""
+
+    arcname: str  #: the name of the file within the archive
+    zinfo: zipfile.ZipInfo  #: the entry's header information
+    data: bytes  #: the compressed file contents
+
+
+class EntryCache(object):
+    """
+    Keeps the compressed contents of files, so the same file never has to be
+    compressed twice.
+
+    Entries are keyed on the SHA-256 digest of the file's contents and the
+    compression level (and kept apart by the version of ``zlib`` that
+    compressed them).  Each entry starts with the length and CRC-32 of its
+    deflate stream, so one that's been damaged is never used.  The
+    least-recently used ones are evicted once the cache is too big.
+    """
+
+    def __init__(self, path: Path, max_size: int):
+        """
+        Create a new instance.
+
+        :param path: the cache directory
+        :param max_size: the maximum size of the cache (in bytes)
+        """
+        self.path: Path = path / f"zlib-{zlib.ZLIB_RUNTIME_VERSION}"
+        self.max_size: int = max_size
+        self._lock = threading.Lock()
+        self._added = 0
+
+    @staticmethod
+    def key(data: bytes, level: int) -> str:
+        """
+        Get the key for a file's compressed contents.
+
+        :param data: the file's contents
+        :param level: the compression level
+        :return: the key
+        """
+        return f"{hashlib.sha256(data).hexdigest()}-{level}"
+
+    def _entry(self, key: str) -> Path:
+        """Get the path to an entry."""
+        return self.path / key[:2] / key[2:]
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get compressed contents from the cache.
+
+        :param key: the key
+        :return: the raw deflate stream, or ``None`` if it isn't cached (or
+            the entry is damaged)
+        """
+        entry = self._entry(key)
+        try:
+            data = entry.read_bytes()
+            # Keep track of when it was last used.
+            os.utime(str(entry))
+        except OSError:
+            return None
+        size = _HEADER.size
+        if len(data) < size:
+            return None
+        length, crc = _HEADER.unpack(data[:size])
+        if length != len(data) - size or crc != zlib.crc32(data[size:]):
+            return None
+        return data[size:]
+
+    def put(self, key: str, data: bytes):
+        """
+        Put compressed contents in the cache.
+
+        :param key: the key
+        :param data: the raw deflate stream
+        """
+        entry = self._entry(key)
+        # (Write it somewhere else first, so nobody ever reads half of it.)
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(
+                prefix=f".{entry.name}.", dir=str(entry.parent)
+            )
+        except OSError:
+            return  # The cache is just an optimization.
+        try:
+            with os.fdopen(fd, 'wb') as fb:
+                fb.write(_HEADER.pack(len(data), zlib.crc32(data)))
+                fb.write(data)
+            os.replace(tmp, str(entry))
+        except OSError:
+            # If another build put the same entry in first, theirs is just as
+            # good.
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._added += len(data)
+
+    def prune(self, max_size: Optional[int] = None) -> int:
+        """
+        Evict the least-recently used entries until the cache fits (if
+        anything's been added since the last time).
+
+        :param max_size: the maximum size of the cache in bytes (defaults to
+            the cache's own limit)
+        :return: the number of entries evicted
+        """
+        _max_size = self.max_size if max_size is None else max_size
+        with self._lock:
+            if not self._added and max_size is None:
+                return 0
+            self._added = 0
+        entries = []
+        stale = time.time() - _STALE
+        for dirpath, _, names in os.walk(str(self.path)):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    # Entries that are still being written start with a '.'
+                    # (and the old ones were left behind by builds that
+                    # didn't finish).
+                    if name.startswith('.'):
+                        if stat.st_mtime < stale:
+                            os.unlink(path)
+                        continue
+                except OSError:
+                    continue  # Somebody else just evicted it.
+                entries.append((stat.st_mtime, stat.st_size, path))
+        # The most-recently used entries are the ones we keep.
+        entries.sort(reverse=True)
+        total = 0
+        evicted = 0
+        for _, size, path in entries:
+            total += size
+            if total > _max_size:
+                try:
+                    os.unlink(path)
+                    evicted += 1
+                except OSError:
+                    pass
+        return evicted
+
+
+def _files(dir_path: Path, ordered: bool = False) -> List[Path]:
+    """
+    List the files in a directory tree.
+
+    :param dir_path: the directory
+    :param ordered: ``True`` to sort the files by their paths (otherwise
+        they're in the order ``os.walk`` finds them)
+    :return: the file paths
+    """
+    files = [
+        Path(root) / file
+        for root, _, files in os.walk(str(dir_path))
+        for file in files
+    ]
+    if ordered:
+        files.sort(key=lambda path: path.relative_to(dir_path).as_posix())
+    return files
+
+
+def _zinfo(
+        path: Path,
+        arcname: str,
+        reproducible: bool = False
+) -> zipfile.ZipInfo:
+    """
+    Create the header information for a file.
+
+    :param path: the path to the file
+    :param arcname: the name of the file within the archive
+    :param reproducible: ``True`` to leave out anything (like the file's
+        modification time) that changes from one build to the next
+    :return: the header information
+    """
+    if not reproducible:
+        return zipfile.ZipInfo.from_file(str(path), arcname=arcname)
+    zinfo = zipfile.ZipInfo(arcname, date_time=REPRODUCIBLE_DATE_TIME)
+    # Everything is readable, and anything that was executable still is.
+    mode = 0o755 if os.stat(str(path)).st_mode & 0o111 else 0o644
+    zinfo.external_attr = (0o100000 | mode) << 16
+    return zinfo
+
+
+def _deflate(
+        data: bytes,
+        level: int,
+        sample: Optional[Sample] = None
+) -> bytes:
+    """
+    Compress data into a raw deflate stream (with no ``zlib`` header or
+    trailer) just the way `zipfile` would.
+
+    :param data: the data
+    :param level: the compression level
+    :param sample: the start of the data, already compressed at the same
+        level (to carry on from)
+    :return: the deflate stream
+    """
+    def _compress() -> bytes:
+        if sample is not None:
+            return sample.finish(data)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    limit = _LIMIT
+    if limit is None:
+        return _compress()
+    with limit:
+        return _compress()
+
+
+def _compress(
+        path: Path,
+        arcname: str,
+        level: int = DEFAULT_LEVEL,
+        reproducible: bool = False,
+        cache: Optional[EntryCache] = None,
+        policy: Optional[Policy] = None,
+        relpath: Optional[str] = None
+) -> Entry:
+    """
+    Read and compress a file.
+
+    :param path: the path to the file
+    :param arcname: the name of the file within the archive
+    :param level: the compression level
+    :param reproducible: ``True`` to normalize the file's timestamp and
+        permissions
+    :param cache: a cache of compressed contents
+    :param policy: decides how the file is compressed (instead of just
+        using the compression level)
+    :param relpath: the file's path relative to the archived directory (for
+        the policy)
+    :return: the compressed entry
+    """
+    zinfo = _zinfo(path, arcname, reproducible=reproducible)
+    data = path.read_bytes()
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data) & 0xffffffff
+    start = time.perf_counter()
+    decision = policy.decide(relpath or arcname, data) if policy else None
+    if decision and decision.choice == STORE:
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zinfo.compress_size = len(data)
+        policy.record(
+            decision, len(data), len(data), time.perf_counter() - start
+        )
+        return Entry(arcname=arcname, zinfo=zinfo, data=data)
+    _level = decision.level if decision else level
+    # If we've compressed the same bytes before, we use the same deflate
+    # stream again.
+    key = (
+        cache.key(data, _level)
+        if cache is not None and len(data) >= _MIN_CACHED
+        else None
+    )
+    compressed = cache.get(key) if key else None
+    if compressed is None:
+        # (If the policy took a sample at the same level, we pick up where
+        # it left off.)
+        compressed = _deflate(
+            data,
+            _level,
+            sample=decision.sample
+            if decision and _level == policy.level else None
+        )
+        if key:
+            cache.put(key, compressed)
+    if policy:
+        policy.record(
+            decision, len(data), len(compressed), time.perf_counter() - start
+        )
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.compress_size = len(compressed)
+    return Entry(arcname=arcname, zinfo=zinfo, data=compressed)
+
+
+@contextmanager
+def limit(jobs: int) -> Iterator[None]:
+    """
+    Cap the number of files compressed at once (by every archive this
+    process creates) while the block runs.
+
+    :param jobs: the most files to compress at once
+    """
+    global _LIMIT  # pylint: disable=global-statement
+    previous = _LIMIT
+    _LIMIT = threading.BoundedSemaphore(max(1, jobs))
+    try:
+        yield
+    finally:
+        _LIMIT = previous
+
+
+def _write_entry(_zip: zipfile.ZipFile, entry: Entry):
+    """
+    Write a compressed entry to an open archive.
+
+    :param _zip: the archive
+    :param entry: the entry
+    """
+    zinfo = entry.zinfo
+    # `zipfile` doesn't have a public way to write data that's already been
+    # compressed, so we do what `ZipFile.write()` does but skip the
+    # compression.
+    _zip._writecheck(zinfo)  # pylint: disable=protected-access
+    _zip._didModify = True  # pylint: disable=protected-access
+    zinfo.header_offset = _zip.fp.tell()
+    _zip.fp.write(zinfo.FileHeader())
+    _zip.fp.write(entry.data)
+    _zip.filelist.append(zinfo)
+    _zip.NameToInfo[zinfo.filename] = zinfo
+    _zip.start_dir = _zip.fp.tell()
+
+
+def _copy(fd: int, info: zipfile.ZipInfo) -> Entry:
+    """
+    Read an entry from another archive without decompressing it.
+
+    :param fd: the other archive's file descriptor
+    :param info: the entry's header information (from the other archive)
+    :return: the entry
+    """
+    # The local header's file name and "extra" field lengths can differ from
+    # the central directory's, so we go by the local header.
+    header = os.pread(fd, _LOCAL_HEADER.size, info.header_offset)
+    name_length, extra_length = _LOCAL_HEADER.unpack(header)[-2:]
+    data = os.pread(
+        fd,
+        info.compress_size,
+        info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+    )
+    zinfo = copy.copy(info)
+    # The sizes go in the local header, so there's no data descriptor.
+    zinfo.flag_bits &= ~0x08
+    return Entry(arcname=info.filename, zinfo=zinfo, data=data)
+
+
+def _entries(
+        tasks: Iterable[Callable[[], Entry]],
+        jobs: int
+) -> Iterator[Entry]:
+    """
+    Prepare entries on a pool of threads, yielding them in the same order as
+    the tasks.
+
+    :param tasks: the functions that prepare the entries
+    :param jobs: the number of threads
+    :return: an iterator of entries
+    """
+    # We keep a few entries in flight for each thread (but not all of them,
+    # so we don't end up holding the whole layer in memory).
+    window = jobs * 4
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending: Deque[Future] = deque()
+        for task in tasks:
+            pending.append(pool.submit(task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _compressed(
+        files: Iterable[Path],
+        dir_path: Path,
+        prefix: str,
+        level: int,
+        jobs: int,
+        reproducible: bool = False,
+        cache: Optional[EntryCache] = None,
+        policy: Optional[Policy] = None
+) -> Iterator[Entry]:
+    """
+    Compress files on a pool of threads, yielding the entries in the same
+    order as the files.
+
+    :param files: the files
+    :param dir_path: the directory the files are in
+    :param prefix: the directory the files go into within the archive
+    :param level: the compression level
+    :param jobs: the number of threads
+    :param reproducible: ``True`` to normalize timestamps and permissions
+    :param cache: a cache of compressed contents
+    :param policy: decides how each file is compressed
+    :return: an iterator of entries
+    """
+    return _entries(
+        (
+            partial(
+                _compress,
+                path,
+                f"{prefix}/{relpath}",
+                level,
+                reproducible,
+                cache,
+                policy,
+                relpath
+            )
+            for path, relpath in (
+                (path, path.relative_to(dir_path).as_posix())
+                for path in files
+            )
+        ),
+        jobs
+    )
+
+
+def create(
+        dir_path: Path,
+        archive: Union[Path, BinaryIO],
+        prefix: str = 'python',
+        level: int = DEFAULT_LEVEL,
+        jobs: Optional[int] = None,
+        reproducible: bool = False,
+        cache: Optional[EntryCache] = None,
+        policy: Optional[Policy] = None
+) -> Path:
+    """
+    Create an archive of a directory.
+
+    A reproducible archive has its entries in sorted order with fixed
+    timestamps and permissions, so the same files always produce the same
+    bytes.
+
+    :param dir_path: the directory to archive
+    :param archive: the output archive path (or a file-like object to write
+        the archive to)
+    :param prefix: the directory the files go into within the archive
+    :param level: the compression level (``0`` through ``9``)
+    :param jobs: the number of threads that compress files (defaults to the
+        number of CPUs)
+    :param reproducible: ``True`` to create a reproducible archive
+    :param cache: a cache of compressed contents (to reuse instead of
+        compressing the same files again)
+    :param policy: decides how each file is compressed (instead of just
+        using the compression level)
+    :return: the archive
+    """
+    _jobs = max(1, jobs if jobs else (os.cpu_count() or 1))
+    files = _files(dir_path, ordered=reproducible)
+    with zipfile.ZipFile(
+            str(archive) if isinstance(archive, Path) else archive,
+            'w',
+            zipfile.ZIP_DEFLATED
+    ) as _zip:
+        for entry in _compressed(
+                files, dir_path, prefix, level, _jobs,
+                reproducible=reproducible, cache=cache, policy=policy
+        ):
+            _write_entry(_zip, entry)
+    if cache is not None:
+        cache.prune()
+    return archive
+
+
+def patch(
+        base: Path,
+        keep: Iterable[str],
+        dir_path: Path,
+        files: Iterable[Path],
+        archive: Union[Path, BinaryIO],
+        prefix: str = 'python',
+        level: int = DEFAULT_LEVEL,
+        jobs: Optional[int] = None,
+        reproducible: bool = False,
+        cache: Optional[EntryCache] = None,
+        policy: Optional[Policy] = None
+) -> Union[Path, BinaryIO]:
+    """
+    Create an archive from some of the entries in another archive (copied
+    as they are, without being compressed again) and some new files.
+
+    :param base: the other archive
+    :param keep: the names of the entries to copy from the other archive
+    :param dir_path: the directory the new files are in
+    :param files: the new files
+    :param archive: the output archive path (or a file-like object to write
+        the archive to)
+    :param prefix: the directory the new files go into within the archive
+    :param level: the compression level for the new files
+    :param jobs: the number of threads that compress files (defaults to the
+        number of CPUs)
+    :param reproducible: ``True`` to create a reproducible archive
+    :param cache: a cache of compressed contents (to reuse instead of
+        compressing the same files again)
+    :param policy: decides how each file is compressed (instead of just
+        using the compression level)
+    :return: the archive
+    """
+    _jobs = max(1, jobs if jobs else (os.cpu_count() or 1))
+    _keep = set(keep)
+    with zipfile.ZipFile(str(base)) as _base, open(str(base), 'rb') as fb:
+        fd = fb.fileno()
+        tasks = [
+            (info.filename, partial(_copy, fd, info))
+            for info in _base.infolist() if info.filename in _keep
+        ]
+        tasks.extend(
+            (
+                f"{prefix}/{relpath}",
+                partial(
+                    _compress, path, f"{prefix}/{relpath}", level,
+                    reproducible, cache, policy, relpath
+                )
+            )
+            for path, relpath in (
+                (path, path.relative_to(dir_path).as_posix())
+                for path in files
+            )
+        )
+        # A reproducible archive is in the same order as if it had been
+        # created from scratch.
+        if reproducible:
+            tasks.sort(key=lambda task: task[0])
+        with zipfile.ZipFile(
+                str(archive) if isinstance(archive, Path) else archive,
+                'w',
+                zipfile.ZIP_DEFLATED
+        ) as _zip:
+            for entry in _entries((task for _, task in tasks), _jobs):
+                _write_entry(_zip, entry)
+    if cache is not None:
+        cache.prune()
+    return archive
+
+
+def sidecar(archive: Path) -> Path:
+    """
+    Get the path to an archive's SHA-256 sidecar file.
+
+    :param archive: the path to the archive
+    :return: the path to the sidecar
+    """
+    return archive.with_name(f"{archive.name}.sha256")
+
+
+def sha256(archive: Path) -> str:
+    """
+    Calculate the SHA-256 digest of an archive.
+
+    :param archive: the path to the archive
+    :return: the hex digest
+    """
+    digest = hashlib.sha256()
+    with open(str(archive), 'rb') as fb:
+        for chunk in iter(lambda: fb.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def published_sha256(dist_path: Path) -> Optional[str]:
+    """
+    Get the SHA-256 digest of an archive that's already in the distribution
+    directory.
+
+    :param dist_path: the path to the distribution archive
+    :return: the hex digest, or ``None`` if there's no archive
+    """
+    if not dist_path.is_file():
+        return None
+    _sidecar = sidecar(dist_path)
+    # The sidecar is only good if it's at least as new as the archive.
+    if (
+            _sidecar.is_file()
+            and _sidecar.stat().st_mtime >= dist_path.stat().st_mtime
+    ):
+        return _sidecar.read_text().split()[0]
+    return sha256(dist_path)
@@ -8,83 +8,100 @@ Create packages using ``bash``.
 .. currentmodule:: lambda_layer.package.bash
 .. moduleauthor:: Pat Daburu <pat@daburu.net>
 """
-import os
+import json
+import re
 import shutil
-from subprocess import Popen, PIPE
 import sys
+import zipfile
 from pathlib import Path
 import tempfile
-from typing import Iterable, Union
-import zipfile
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Union
 import click
-from .common import ProcOutput
+from . import bytecode, incremental, size, stream, targets, trace
+from .archive import DEFAULT_LEVEL, EntryCache, create, patch
+from .common import ProcOutput, interpreter
+from .compression import Policy
+from .prune import prune
+from .sinks import LocalSink, Sink, TeeSink
+from .store import Distribution, PackageStore
+from .strip import savings, strip
 from .. import env
 from ..config import LayerConfig
 
+#: the script that compiles a directory the way ``pip`` would (skipping
+#: anything that won't compile)
+_COMPILE = (
+    "import compileall, sys; "
+    "compileall.compile_dir(sys.argv[1], quiet=2, workers=0)"
+)
+#: an exact pin (with any hashes), like ``six==1.16.0 --hash=sha256:...``
+_PIN = re.compile(
+    r'^\s*(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)==(?P<version>[^\s;=]+)'
+    r'(\s+--hash=\S+)*\s*$'
+)
 
-def _run(
+
+def run(
         cmd: Iterable[str],
         shell: bool = False,
-        silent: bool = False
+        silent: bool = False,
+        stage: Optional[str] = None
 ) -> ProcOutput:
     """
-    Run a process.
+    Run a process, showing its output as it arrives.
 
     :param cmd: the command
     :param shell:  ``True`` to run in a full shell environment
     :param silent: ``True`` to suppress normal output
+    :param stage: the build stage the process belongs to (so its output can
+        be labelled)
+    :return: the last lines the process wrote to each stream
     """
     # If we're not running silent...
     if not silent:
         # ...echo the command.
         click.echo(' '.join(cmd))
-    # If we're supposed to use a full shell...
-    if shell:
-        proc = Popen(
-            list(cmd),
-            stdout=PIPE,
-            stderr=PIPE,
+
+    def _forward(line: stream.Line):
+        # Anything written to standard error is always shown (in red).
+        if line.stream == stream.STDERR:
+            click.echo(click.style(stream.format_line(line, stage), fg='red'))
+        elif not silent:
+            click.echo(stream.format_line(line, stage))
+
+    # Run the command.  (We only hang on to the last few lines of output in
+    # case something goes wrong.)
+    with trace.span(
+            stage or 'command', trace.PROCESS, command=' '.join(cmd)
+    ) as args:
+        returncode, output = stream.run(
+            cmd,
+            forward=_forward,
+            tail=int(env.get(env.Vars.LAMBDA_LAYER_OUTPUT_LINES)),
             shell=shell,
-            executable=env.get(env.Vars.LAMBDA_LAYER_SHELL)
-        )
-    else:  # ...otherwise, there's a little less to do.
-        proc = Popen(
-            list(cmd),
-            stdout=PIPE,
-            stderr=PIPE
+            executable=env.get(env.Vars.LAMBDA_LAYER_SHELL) if shell
+            else None
         )
-    # Run the command and get the output.
-    stdout, stderr = proc.communicate()
-
-    # Create the process output object.
-    output = ProcOutput(
-        stdout=stdout.decode('utf-8'),
-        stderr=stdout.decode('utf-8')
-    )
-
-    # Let's figure out how we're going to color our output.
-    fg = None if proc.returncode == 0 else 'red'
-
-    # If the failed, or if we're not running silent...
-    if stdout and proc.returncode != 0 or not silent:
-        # ...write out everything that happened.
-        for line in stdout.decode('utf-8').split('\n'):
-            click.echo(click.style(line, fg=fg))
-
-    # If anything was printed to standard error, let's show that.
-    if stderr:
-        for line in stderr.decode('utf8').split('\n'):
-            click.echo(click.style(line, fg='red'))
+        args['returncode'] = returncode
 
     # If the process failed...
-    if proc.returncode != 0:
+    if returncode != 0:
+        # ...and we haven't shown its output yet, show the end of it now.
+        if silent and output.stdout:
+            for line in output.stdout.split('\n'):
+                click.echo(click.style(line, fg='red'))
+        click.echo(click.style(
+            f"{stage or 'The command'} exited with code {returncode}",
+            fg='red'
+        ))
         # ...fail the whole application with the same code.
-        sys.exit(proc.returncode)
+        sys.exit(returncode)
 
     # Looks like we're all good here.
     return output
 
 
+@trace.traced('venv')
 def _venv(
         path: Path,
         silent: bool = False
@@ -101,12 +118,13 @@ def _venv(
         str(path)
     ]
     # Run it.
-    _run(cmd, silent=silent)
+    run(cmd, silent=silent, stage='venv')
     # Return the path to the caller.
     return path
 
 
-def _requirements(
+@trace.traced('requirements')
+def write_requirements(
         path: Path,
         packages: Iterable[str],
         silent: bool = False
@@ -133,10 +151,14 @@ def _requirements(
     return _path
 
 
+@trace.traced('install')
 def _install(
         venv: Path,
         requirements: Path,
         upgrade_pip: bool = True,
+        wheelhouse: Optional[Path] = None,
+        compile_: bool = True,
+        no_deps: bool = False,
         silent: bool = False
 ):
     """
@@ -146,6 +168,11 @@ def _install(
     :param requirements: the path to a requirements file
     :param upgrade_pip:  ``True`` to upgrade ``pip`` before installing
         packages
+    :param wheelhouse: the path to a wheelhouse to install from (instead of
+        the package index)
+    :param compile_: ``False`` to skip compiling bytecode
+    :param no_deps: ``True`` to install just the requirements (and none of
+        their dependencies)
     :param silent: ``True`` to suppress normal output
     """
     # Let's start preparing the install commands.  First up: activate
@@ -153,17 +180,343 @@ def _install(
     cmds = [
         f"source {venv}/bin/activate"
     ]
-    # Upgrade pip (if requested).
-    if upgrade_pip:
+    # Upgrade pip (if requested).  If we're installing from a wheelhouse,
+    # we're not going to the package index at all, so we'll make do with the
+    # pip we have.
+    if upgrade_pip and not wheelhouse:
         cmds.append("pip3 install --upgrade pip")
     # Install whatever is in the `requirements.txt`.
-    cmds.append(f"pip3 install -r {requirements}")
+    options = '' if compile_ else '--no-compile '
+    if no_deps:
+        options = f"{options}--no-deps "
+    if wheelhouse:
+        options = f"{options}--no-index --find-links {wheelhouse} "
+    cmds.append(f"pip3 install {options}-r {requirements}")
     # Join up the commands so we can run them all-at-once.
     cmd = [' && '.join(cmds)]
     # Run it!
-    _run(cmd, shell=True, silent=silent)
+    run(cmd, shell=True, silent=silent, stage='install')
+
+
+@trace.traced('install')
+def _install_target(
+        target: Path,
+        requirements: Path,
+        wheelhouse: Optional[Path] = None,
+        compile_: bool = True,
+        no_deps: bool = False,
+        options: Iterable[str] = (),
+        silent: bool = False
+) -> Path:
+    """
+    Install requirements straight into a directory (without a virtual
+    environment).
+
+    :param target: the directory to install into
+    :param requirements: the path to a requirements file
+    :param wheelhouse: the path to a wheelhouse to install from (instead of
+        the package index)
+    :param compile_: ``False`` to skip compiling bytecode
+    :param no_deps: ``True`` to install just the requirements (and none of
+        their dependencies)
+    :param options: any other options for ``pip`` (like the ones that pick
+        the target platform)
+    :param silent: ``True`` to suppress normal output
+    """
+    cmd = [
+        'python', '-m', 'pip', 'install',
+        '--target', str(target),
+        '--disable-pip-version-check'
+    ]
+    if not compile_:
+        cmd.append('--no-compile')
+    if no_deps:
+        cmd.append('--no-deps')
+    if wheelhouse:
+        cmd.extend(['--no-index', '--find-links', str(wheelhouse)])
+    cmd.extend(options)
+    cmd.extend(['-r', str(requirements)])
+    run(cmd, silent=silent, stage='install')
+    # Console scripts end up in a `bin` directory which a layer can't use.
+    # (They wouldn't be in a virtual environment's `site-packages` either.)
+    shutil.rmtree(str(target / 'bin'), ignore_errors=True)
+    # Return the path to the caller.
+    return target
+
+
+@trace.traced('install')
+def _install_stored(
+        target: Path,
+        requirements: Path,
+        wheelhouse: Optional[Path] = None,
+        compile_: bool = True,
+        no_deps: bool = False,
+        options: Iterable[str] = (),
+        built_for: str = '',
+        silent: bool = False
+) -> Optional[Path]:
+    """
+    Install requirements into a directory by linking them from the package
+    store (installing whatever isn't in the store yet).
+
+    :param target: the directory to install into
+    :param requirements: the path to a requirements file
+    :param wheelhouse: the path to a wheelhouse to install from (instead of
+        the package index)
+    :param compile_: ``False`` to skip compiling bytecode
+    :param no_deps: ``True`` to install just the requirements (and none of
+        their dependencies)
+    :param options: any other options for ``pip`` (like the ones that pick
+        the target platform)
+    :param built_for: what source distributions are built for
+    :param silent: ``True`` to suppress normal output
+    :return: the directory, or ``None`` if a distribution can't be stored
+        (because it doesn't come from an archive with a known digest)
+    """
+    distributions = [
+        Distribution.from_report(item, built_for=built_for)
+        for item in install_report(
+            requirements=requirements,
+            wheelhouse=wheelhouse,
+            no_deps=no_deps,
+            options=options,
+            silent=silent
+        )
+    ]
+    if None in distributions:
+        return None
+    _store = PackageStore()
+    # Nothing we find in the store can be removed until it's linked.
+    with _store.lock():
+        missing = _store.missing(distributions)
+        if missing:
+            # Download exactly the files pip picked (which is what they're
+            # kept under)...
+            downloads = requirements.with_name('downloads')
+            cmd = [
+                'python', '-m', 'pip', 'download',
+                '--no-deps',
+                '--dest', str(downloads),
+                '--disable-pip-version-check'
+            ]
+            if wheelhouse:
+                cmd.extend(['--no-index', '--find-links', str(wheelhouse)])
+            cmd.extend(options)
+            cmd.extend(['-r', str(write_requirements(
+                path=requirements.with_name('missing.txt'),
+                packages=[
+                    f"{distribution.name}=={distribution.version} "
+                    f"--hash=sha256:{distribution.sha256}"
+                    for distribution in missing
+                ],
+                silent=True
+            ))])
+            run(cmd, silent=silent, stage='download')
+            # ...and install each of them into the store on its own.
+            # (They're never compiled there, since that depends on the
+            # layer.)
+            for distribution in missing:
+                tree = _store.staging(distribution)
+                try:
+                    run(
+                        [
+                            'python', '-m', 'pip', 'install',
+                            '--target', str(tree),
+                            '--no-deps',
+                            '--no-compile',
+                            '--disable-pip-version-check',
+                            *options,
+                            str(downloads / distribution.filename)
+                        ],
+                        silent=silent,
+                        stage='install'
+                    )
+                except BaseException:
+                    shutil.rmtree(str(tree), ignore_errors=True)
+                    raise
+                shutil.rmtree(str(tree / 'bin'), ignore_errors=True)
+                _store.add(distribution, tree)
+        linked = _store.link(distributions, target)
+    # If the store grew, make sure it still fits.  (What we just linked is
+    # the most-recently used, so it's the last to go.  If other builds are
+    # using the store, we leave it to them.)
+    if missing:
+        _store.prune(wait=False)
+    trace.annotate(files=linked.files)
+    if not silent:
+        click.echo(
+            f"Linked {linked.files} files from the package store "
+            f"({len(missing)} of {len(distributions)} distributions were "
+            f"added to it)"
+        )
+    if linked.copied:
+        click.echo(click.style(
+            f"{linked.copied} files were copied from the package store "
+            f"because they couldn't be linked.",
+            fg='yellow'
+        ))
+    if compile_:
+        run(
+            ['python', '-c', _COMPILE, str(target)],
+            silent=silent,
+            stage='compile'
+        )
+    return target
 
 
+@trace.traced('resolve')
+def install_report(
+        requirements: Path,
+        wheelhouse: Optional[Path] = None,
+        no_deps: bool = False,
+        options: Iterable[str] = (),
+        silent: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Figure out which distributions the requirements resolve to (without
+    installing anything).
+
+    :param requirements: the path to a requirements file
+    :param wheelhouse: the path to a wheelhouse to resolve from (instead of
+        the package index)
+    :param no_deps: ``True`` to resolve just the requirements (and none of
+        their dependencies)
+    :param options: any other options for ``pip`` (like the ones that pick
+        the target platform)
+    :param silent: ``True`` to suppress normal output
+    :return: the distributions' entries in ``pip``'s installation report
+    """
+    report = requirements.with_name('report.json')
+    cmd = [
+        'python', '-m', 'pip', 'install',
+        '--dry-run',
+        '--ignore-installed',
+        '--quiet',
+        '--report', str(report),
+        '--disable-pip-version-check'
+    ]
+    if no_deps:
+        cmd.append('--no-deps')
+    if wheelhouse:
+        cmd.extend(['--no-index', '--find-links', str(wheelhouse)])
+    _options = list(options)
+    if _options:
+        # pip only takes platform options when it's installing to a target
+        # directory.  (Not that a dry run puts anything there.)
+        cmd.extend(['--target', str(requirements.with_name('target'))])
+    cmd.extend(_options)
+    cmd.extend(['-r', str(requirements)])
+    run(cmd, silent=silent, stage='resolve')
+    return json.loads(report.read_text())['install']
+
+
+def resolve_versions(
+        requirements: Path,
+        wheelhouse: Optional[Path] = None,
+        no_deps: bool = False,
+        options: Iterable[str] = (),
+        silent: bool = False
+) -> Dict[str, str]:
+    """
+    Figure out which distributions the requirements resolve to (without
+    installing anything).
+
+    :param requirements: the path to a requirements file
+    :param wheelhouse: the path to a wheelhouse to resolve from (instead of
+        the package index)
+    :param no_deps: ``True`` to resolve just the requirements (and none of
+        their dependencies)
+    :param options: any other options for ``pip`` (like the ones that pick
+        the target platform)
+    :param silent: ``True`` to suppress normal output
+    :return: the versions, by normalized distribution name
+    """
+    return {
+        incremental.normalize(item['metadata']['name']):
+            item['metadata']['version']
+        for item in install_report(
+            requirements=requirements,
+            wheelhouse=wheelhouse,
+            no_deps=no_deps,
+            options=options,
+            silent=silent
+        )
+    }
+
+
+def pinned_versions(layer: LayerConfig) -> Optional[Dict[str, str]]:
+    """
+    Get the versions a layer's requirements resolve to without asking
+    ``pip`` (which we can do when every one of them is pinned, and their
+    dependencies aren't installed).
+
+    :param layer: the layer configuration
+    :return: the versions, by normalized distribution name (or ``None`` if
+        the requirements have to be resolved)
+    """
+    if layer.deps:
+        return None
+    pins = {}
+    for package in layer.packages:
+        match = _PIN.match(package)
+        if not match:
+            return None
+        pins[incremental.normalize(match.group('name'))] = (
+            match.group('version')
+        )
+    return pins
+
+
+def resolved_distributions(
+        layer: LayerConfig,
+        wheelhouse: Optional[Path] = None,
+        silent: bool = False
+) -> Optional[List[str]]:
+    """
+    Get the exact distributions a layer's requirements resolve to right now
+    (so a new release of a loose requirement can change the layer's cache
+    key).
+
+    :param layer: the layer configuration
+    :param wheelhouse: the path to a wheelhouse to resolve from (instead of
+        the package index)
+    :param silent: ``True`` to suppress normal output
+    :return: each distribution as ``name==version`` and the digest of its
+        archive (or ``None`` if the layer is locked or pinned, since its
+        requirements already say)
+    """
+    if pinned_versions(layer) is not None:
+        return None
+    target = targets.target(layer)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        items = install_report(
+            requirements=write_requirements(
+                path=Path(tmp_dir) / 'requirements.txt',
+                packages=layer.packages,
+                silent=True
+            ),
+            wheelhouse=wheelhouse,
+            no_deps=not layer.deps,
+            options=target.pip_options() if target else [],
+            silent=silent
+        )
+    resolved = []
+    for item in items:
+        download_info = item.get('download_info', {})
+        archive_info = download_info.get('archive_info', {})
+        # (Older versions of pip only report a single hash, and a local
+        # directory doesn't have one at all.)
+        digest = archive_info.get('hashes', {}).get('sha256') or (
+            archive_info.get('hash') or download_info.get('url', '')
+        )
+        resolved.append(
+            f"{incremental.normalize(item['metadata']['name'])}=="
+            f"{item['metadata']['version']} {digest}"
+        )
+    return sorted(resolved)
+
+
+@trace.traced('site-packages')
 def _site_packages(venv: Path, silent: bool = False) -> Path:
     """
     Get the path to the ``site-packages`` directory for a virtual environment.
@@ -179,53 +532,131 @@ def _site_packages(venv: Path, silent: bool = False) -> Path:
         'python -c "import site; print(site.getsitepackages())"'
     ]
     # Here we go.
-    output = _run(
+    output = run(
         cmd=[' && '.join(cmds)],
         shell=True,
-        silent=silent
+        silent=silent,
+        stage='site-packages'
     )
     # Read the output and carve out the `site-packages` path.
-    _path = Path(output.stdout[2:-3])
+    _path = Path(output.stdout.strip()[2:-2])
     # Return the path we found to the caller.
     return _path
 
 
+@trace.traced('precompile')
+def _precompile(
+        root: Path,
+        drop_sources: bool = False,
+        silent: bool = False
+) -> int:
+    """
+    Compile every module in a layer to bytecode.
+
+    :param root: the layer's root directory
+    :param drop_sources: ``True`` to remove the compiled source files
+    :param silent: ``True`` to suppress normal output
+    :return: the number of compiled files in the layer
+    """
+    run(
+        bytecode.command(root, legacy=drop_sources),
+        silent=silent,
+        stage='precompile'
+    )
+    if drop_sources:
+        removed = bytecode.drop_sources(root)
+        if not silent:
+            click.echo(
+                f"Removed {removed / 1024 / 1024:.1f} MB of compiled sources"
+            )
+    compiled = sum(1 for _ in root.rglob('*.pyc'))
+    trace.annotate(files=compiled)
+    return compiled
+
+
 def _archive(
         dir_path: Path,
-        archive: Path
-) -> Path:
+        archive: Union[Path, BinaryIO],
+        level: int = DEFAULT_LEVEL,
+        reproducible: bool = False,
+        base: Optional[Path] = None,
+        keep: Iterable[str] = (),
+        files: Iterable[Path] = (),
+        policy: Optional[Policy] = None
+) -> Union[Path, BinaryIO]:
     """
     Create an archive of a directory.
 
     :param dir_path: the directory to archive
-    :param archive: the output archive path
+    :param archive: the output archive path (or a file-like object to write
+        the archive to)
+    :param level: the compression level
+    :param reproducible: ``True`` to create a byte-for-byte reproducible
+        archive
+    :param base: an earlier archive to patch (instead of archiving the whole
+        directory)
+    :param keep: the paths (within the layer) of the files to copy from the
+        earlier archive
+    :param files: the files in the directory to add to the earlier archive
+    :param policy: decides how each file is compressed (instead of just
+        using the compression level)
     """
-    # We'll need the length of the `site_packages` path so we can remove
-    # it from the archive names of files we place into the .zip archive.
-    site_packages_len = len(str(dir_path))
+    # Figure out how many threads we can use to compress the files.
+    jobs = env.get(env.Vars.LAMBDA_LAYER_ARCHIVE_JOBS)
+    # Files we've compressed before (in any layer) don't need to be
+    # compressed again.
+    cache_size = int(env.get(env.Vars.LAMBDA_LAYER_ENTRY_CACHE_SIZE))
+    cache = EntryCache(
+        path=Path(env.get(env.Vars.LAMBDA_LAYER_CACHE_DIR)).expanduser()
+        / 'entries',
+        max_size=cache_size * 1024 * 1024
+    ) if cache_size else None
+    # If there's an earlier archive, we just need to patch it.
+    if base:
+        return patch(
+            base=base,
+            keep=[f"python/{path}" for path in keep],
+            dir_path=dir_path,
+            files=files,
+            archive=archive,
+            prefix='python',
+            level=level,
+            jobs=int(jobs) if jobs else None,
+            reproducible=reproducible,
+            cache=cache,
+            policy=policy
+        )
     # Let's start zippin'...
-    with zipfile.ZipFile(str(archive), 'w', zipfile.ZIP_DEFLATED) as _zip:
-        # ``_zip`` is zipfile handle.
-        for root, dirs, files in os.walk(str(dir_path)):
-            for file in files:
-                path = os.path.join(root, file)
-                arcname = "/python" + path[site_packages_len:]
-                _zip.write(path, arcname=arcname)
-    # Return the archive path to the caller.
-    return archive
+    return create(
+        dir_path=dir_path,
+        archive=archive,
+        prefix='python',
+        level=level,
+        jobs=int(jobs) if jobs else None,
+        reproducible=reproducible,
+        cache=cache,
+        policy=policy
+    )
 
 
 def make(
         dist_dir: Union[str, Path],
         layer: LayerConfig,
-        silent: bool = False
-) -> Path:
+        silent: bool = False,
+        wheelhouse: Optional[Path] = None,
+        sink: Optional[Sink] = None
+) -> str:
     """
     Make a layer.
 
     :param dist_dir: the path to the distribution directory
     :param layer: the layer configuration
     :param silent: ``True`` to suppress normal output
+    :param wheelhouse: the path to a wheelhouse to install from (instead of
+        the package index)
+    :param sink: where the archive goes (defaults to the distribution
+        directory)
+    :return: where the archive went
     """
     # Prepare the distribution directory.
     _dist_dir = (
@@ -241,41 +672,322 @@ def make(
     with tempfile.TemporaryDirectory() as tmp_dir:
         # Turn the `tmp_dir` string into a path.
         tmp_path = Path(tmp_dir).expanduser().resolve()
-        # Create the virtual environment.
-        venv = _venv(
-            # python=_python,
-            path=(Path(tmp_path) / 'venv'),
-            silent=silent
-        )
         # Write the requirements file.
-        requirements = _requirements(
+        requirements = write_requirements(
             path=tmp_path / 'requirements.txt',
             packages=layer.packages
         )
 
-        # Install the requirements.
-        _install(venv=venv, requirements=requirements)
-
-        # Get the path to the site packages directory.
-        site_packages = _site_packages(venv=venv, silent=silent)
-
-        # Create the archive.
-        archive = _archive(
-            # python=_python,
-            dir_path=site_packages,
-            archive=tmp_path / f"{layer.name}-{layer.version}.zip"
-        )
-
-        # Calculate the path to the final distribution archive.
-        dist_path = _dist_dir / archive.name
+        # If the layer is built for another platform (or Python), pip has to
+        # pick the wheels for that instead of the ones for this interpreter.
+        # (And, unless it's the same Python, it can't compile them.)
+        target = targets.target(layer)
+        options = target.pip_options() if target else []
+        native = not target or target.native()
+        compile_ = native and not (layer.reproducible or layer.precompile)
+
+        # If the layer is built incrementally, let's see if there's a build
+        # we can patch.  (Patching works file by file, so the layer is
+        # installed straight into a staging directory, not a virtual
+        # environment.)
+        if layer.incremental and layer.venv and not target:
+            click.echo(click.style(
+                f"{layer.name} is built incrementally, so it's installed "
+                f"with `pip install --target` instead of in a virtual "
+                f"environment.  (Set `venv = false` to say so.)",
+                fg='yellow'
+            ))
+        store = incremental.Store() if layer.incremental else None
+        previous = store.previous(layer) if store else None
+        # If the layer is put together from the package store, link what's
+        # in it (if we can).
+        stored = _install_stored(
+            target=tmp_path / 'python',
+            requirements=requirements,
+            wheelhouse=wheelhouse,
+            compile_=compile_,
+            no_deps=not layer.deps,
+            options=options,
+            built_for='-'.join([
+                target.cache_tag if target else interpreter().cache_tag,
+                targets.ARCHITECTURES[target.platform] if target
+                else interpreter().machine
+            ]),
+            silent=silent
+        ) if layer.store and not previous else None
+        # (Unless the layer is installed in a virtual environment, everything
+        # in it is something its requirements resolve to.)
+        requested: Optional[Iterable[str]] = None
+        if previous:
+            # Figure out what's changed since then, and install just that.
+            # (If the layer is locked, we already know what it resolves to.)
+            pinned = pinned_versions(layer)
+            resolved = pinned if pinned is not None else resolve_versions(
+                requirements=requirements,
+                wheelhouse=wheelhouse,
+                no_deps=not layer.deps,
+                options=options,
+                silent=silent
+            )
+            changed = previous.manifest.changed(resolved)
+            site_packages = tmp_path / 'python'
+            site_packages.mkdir()
+            if changed:
+                _install_target(
+                    target=site_packages,
+                    requirements=write_requirements(
+                        path=tmp_path / 'changed.txt',
+                        packages=[
+                            package for package in layer.packages
+                            if incremental.normalize(
+                                _PIN.match(package).group('name')
+                            ) in changed
+                        ] if pinned is not None else [
+                            f"{name}=={resolved[name]}" for name in changed
+                        ],
+                        silent=True
+                    ),
+                    wheelhouse=wheelhouse,
+                    compile_=compile_,
+                    no_deps=True,
+                    options=options,
+                    silent=silent
+                )
+            if not silent:
+                click.echo(
+                    f"Installing {len(changed)} of {len(resolved)} "
+                    f"distributions (the rest are unchanged)"
+                )
+        elif stored:
+            site_packages = stored
+        # If the layer is built in a virtual environment (and not
+        # incrementally, or for another target)...
+        elif layer.venv and not (layer.incremental or target):
+            # ...create the virtual environment.
+            venv = _venv(
+                # python=_python,
+                path=(Path(tmp_path) / 'venv'),
+                silent=silent
+            )
+
+            # Install the requirements.
+            # (Bytecode compiled by pip has the temporary directory's path
+            # in it, so it's left out of reproducible layers.  If we're going
+            # to compile the layer ourselves, there's no need for it either.)
+            _install(
+                venv=venv,
+                requirements=requirements,
+                wheelhouse=wheelhouse,
+                compile_=compile_,
+                no_deps=not layer.deps
+            )
+
+            # Get the path to the site packages directory.
+            site_packages = _site_packages(venv=venv, silent=silent)
+            # The virtual environment comes with packaging tools of its own,
+            # so if we're going to prune them, we need to know which of them
+            # the layer asked for.
+            if layer.prune and layer.prune.defaults:
+                requested = pinned_versions(layer)
+                if requested is None:
+                    requested = resolve_versions(
+                        requirements=requirements,
+                        wheelhouse=wheelhouse,
+                        no_deps=not layer.deps,
+                        silent=silent
+                    )
+        else:
+            # Otherwise, we install the requirements straight into a staging
+            # directory that's laid out just like the layer.
+            site_packages = _install_target(
+                target=tmp_path / 'python',
+                requirements=requirements,
+                wheelhouse=wheelhouse,
+                compile_=compile_,
+                no_deps=not layer.deps,
+                options=options,
+                silent=silent
+            )
+
+        # Before we start taking things out, make a note of which
+        # distribution owns each file (so we can break down the layer's
+        # size later on).
+        owners = size.Owners.read(site_packages)
+        # If this is a fresh incremental build, we need to know which
+        # distributions are in it (before their metadata might be pruned).
+        if store and not previous:
+            resolved = incremental.installed(site_packages)
+
+        # If the layer has prune rules, get rid of anything it doesn't need.
+        if layer.prune:
+            with trace.span('prune') as args:
+                pruned = prune(
+                    root=site_packages,
+                    config=layer.prune,
+                    cache_tag=target.cache_tag if target
+                    else interpreter().cache_tag,
+                    keep=requested if requested is not None
+                    else incremental.installed(site_packages)
+                )
+                args['files'] = pruned.files
+            if not silent:
+                click.echo(
+                    f"Pruned {pruned.files} files "
+                    f"({pruned.size / 1024 / 1024:.1f} MB)"
+                )
+
+        # If we're supposed to, strip the debug symbols from native
+        # extensions.  (We can only do that for this architecture, since a
+        # stripped file has to load before it replaces the original.)
+        if layer.strip and target and target.foreign():
+            click.echo(click.style(
+                f"Can't strip native extensions for {target.platform} on "
+                f"{interpreter().machine}; they'll be left as they are.",
+                fg='yellow'
+            ))
+        elif layer.strip:
+            with trace.span('strip') as args:
+                stripped = strip(site_packages)
+                args['files'] = len(stripped)
+            if not silent:
+                for result in stripped:
+                    if result.error:
+                        click.echo(click.style(
+                            f"Didn't strip {result.path.name}: "
+                            f"{result.error}",
+                            fg='yellow'
+                        ))
+                # (The owners were worked out before anything was pruned, so
+                # they're still there.)
+                for distribution, saved in sorted(
+                        savings(site_packages, stripped, owners.owner).items()
+                ):
+                    click.echo(
+                        f"Stripped {distribution}: "
+                        f"{saved / 1024 / 1024:.1f} MB"
+                    )
+
+        # If we're supposed to, compile the layer ahead of time.  (We can
+        # only do that with the same version of Python.)
+        if layer.precompile and not native:
+            click.echo(click.style(
+                f"Can't compile modules for Python {target.python} with "
+                f"Python {interpreter().version}; they'll be left as they "
+                f"are.",
+                fg='yellow'
+            ))
+        elif layer.precompile:
+            compiled = _precompile(
+                root=site_packages,
+                drop_sources=layer.drop_sources,
+                silent=silent
+            )
+            if not silent:
+                click.echo(f"Compiled {compiled} modules")
+
+        # If we're building incrementally, work out which files we can copy
+        # from the last build, and write down what's in this one.
+        keep = {}
+        manifest = None
+        if store:
+            with trace.span('manifest') as args:
+                files = incremental.records(site_packages, owners.owner)
+                args['files'] = len(files)
+            if previous:
+                # (Anything that was installed this time replaces what was
+                # there before...)
+                keep = {
+                    path: record for path, record in incremental.kept(
+                        previous, changed, resolved
+                    ).items()
+                    if path not in files
+                }
+                # ...but files that were installed again, and didn't change,
+                # can be copied too.
+                keep.update(
+                    (path, record) for path, record in files.items()
+                    if previous.manifest.files.get(path) == record
+                )
+                files = {
+                    path: record for path, record in files.items()
+                    if path not in keep
+                }
+            manifest = incremental.Manifest(
+                settings=incremental.settings(layer),
+                distributions=resolved,
+                files={**keep, **files}
+            )
+
+        # (If the layer has compression rules, each file is compressed the
+        # way they say.)
+        policy = Policy(
+            layer.compression, level=layer.compression_level
+        ) if layer.compression else None
+
+        # Before we archive the layer, make sure it isn't too big.
+        with trace.span('size') as args:
+            report = size.analyze(
+                root=site_packages,
+                owners=owners,
+                level=layer.compression_level,
+                policy=policy
+            )
+            if keep:
+                with zipfile.ZipFile(str(previous.archive)) as _zip:
+                    report = size.merge(report, size.tally(
+                        (record.owner, info.file_size, info.compress_size)
+                        for record, info in (
+                            (record, _zip.getinfo(f"python/{path}"))
+                            for path, record in keep.items()
+                        )
+                    ))
+            args['files'] = report.files
+        limit = layer.max_size * 1024 * 1024
+        if not silent or (limit and report.size > limit):
+            click.echo(size.table(report, limit=limit))
+        size.check(report, limit=limit)
+
+        # Create the archive, writing it straight to wherever it's going.
+        # (If we're building incrementally, we keep a copy to patch next
+        # time.)
+        _sink = sink if sink else LocalSink(_dist_dir)
+        if store:
+            _sink = TeeSink(_sink, store.sink(layer, manifest))
+        with trace.span('archive', files=report.files) as args:
+            with _sink.open(targets.archive_name(layer)) as writer:
+                _archive(
+                    dir_path=site_packages,
+                    archive=writer,
+                    level=layer.compression_level,
+                    reproducible=layer.reproducible,
+                    base=previous.archive if previous else None,
+                    keep=keep,
+                    files=[site_packages / path for path in files]
+                    if previous else (),
+                    policy=policy
+                )
+            args['size'] = writer.tell()
+            if policy:
+                args['compression'] = {
+                    choice: tally.files
+                    for choice, tally in policy.tallies().items()
+                }
+        if previous and not silent:
+            click.echo(
+                f"Copied {len(keep)} files from the last build and "
+                f"compressed {len(files)}"
+            )
+        if policy and not silent:
+            click.echo(policy.table())
 
         # If we're not running silent...
         if not silent:
-            # ...let 'em know we're copying the file.
-            click.echo(f"Copying  {archive} to {dist_path}")
-
-        # Copy the archive to the distribution directory.
-        shutil.copyfile(str(archive), str(dist_path))
-
-        # Return the path to the distribution file.
-        return dist_path
+            # ...let 'em know what happened.  (If the very same archive was
+            # already there, it was left alone.)
+            click.echo(
+                f"Wrote    {writer.location}" if writer.changed
+                else f"{writer.location} is unchanged"
+            )
+
+        # Return the location of the archive.
+        return writer.location
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Compile a layer's modules ahead of time.
+
+.. currentmodule:: lambda_layer.package.bytecode
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import os
+from pathlib import Path
+import shutil
+from typing import List
+
+#: where a layer's ``python`` directory ends up in the Lambda environment
+LAMBDA_PYTHON_DIR = '/opt/python'
+
+#: the script that compiles a directory (It runs in the interpreter the layer
+#: is built with, so the bytecode matches that interpreter.  Files that won't
+#: compile are left as they are.)
+_COMPILE = (
+    "import compileall, py_compile, sys; "
+    "compileall.compile_dir("
+    "sys.argv[1], ddir=sys.argv[2], force=True, quiet=2, "
+    "legacy=sys.argv[3] == 'legacy', workers=0, "
+    "invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)"
+)
+
+
+def command(root: Path, legacy: bool = False) -> List[str]:
+    """
+    Get the command that compiles every module in a layer to bytecode.
+
+    The bytecode is "unchecked-hash" bytecode, so the interpreter never looks
+    at the source files to see if it's out of date.
+
+    :param root: the layer's root directory
+    :param legacy: ``True`` to put each ``.pyc`` file next to its source
+        (rather than in ``__pycache__``) so the source can be removed
+    :return: the command
+    """
+    return [
+        'python', '-c', _COMPILE,
+        str(root),
+        LAMBDA_PYTHON_DIR,
+        'legacy' if legacy else 'cached'
+    ]
+
+
+def drop_sources(root: Path) -> int:
+    """
+    Remove the source files that have been compiled (in ``legacy`` mode),
+    along with the ``__pycache__`` directories nothing will use.
+
+    :param root: the layer's root directory
+    :return: the number of bytes removed
+    """
+    removed = 0
+    for dirpath, dirs, files in os.walk(str(root)):
+        if '__pycache__' in dirs:
+            dirs.remove('__pycache__')
+            pycache = Path(dirpath) / '__pycache__'
+            removed += sum(
+                path.stat().st_size for path in pycache.iterdir()
+            )
+            shutil.rmtree(str(pycache))
+        for file in files:
+            path = Path(dirpath) / file
+            if path.suffix == '.py' and path.with_suffix('.pyc').exists():
+                removed += path.stat().st_size
+                path.unlink()
+    return removed
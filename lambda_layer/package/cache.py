@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+A local, content-addressed cache of layer archives.
+
+.. currentmodule:: lambda_layer.package.cache
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import shlex
+import shutil
+import tempfile
+import time
+from typing import Iterable, List, NamedTuple, Optional, Union
+import zipfile
+from .. import env
+from ..config import LayerConfig
+from .sinks import Sink, SinkWriter
+from .common import interpreter
+
+_ARCHIVE = 'archive.zip'  #: the name of a cached archive within its entry
+_META = 'meta.json'  #: the name of an entry's metadata file
+
+#: layer settings that don't change the archive (so aren't part of the key)
+_UNKEYED = ('max_size', 'profile', 'bases')
+#: the ``pip`` options that refer to other requirements files
+_SHORT = ('-r', '-c')
+_LONG = ('--requirement', '--constraint')
+
+
+def references(layer: LayerConfig) -> List[Path]:
+    """
+    Find the requirements (and constraints) files a layer refers to.
+
+    :param layer: the layer configuration
+    :return: the paths to the files
+    """
+    paths = []
+    for package in layer.packages:
+        words = shlex.split(package)
+        for word, following in zip(words, [*words[1:], None]):
+            # (The file may come after the option, or be stuck to it.)
+            if word in _SHORT + _LONG:
+                ref = following
+            elif word.partition('=')[0] in _LONG:
+                ref = word.partition('=')[2]
+            elif word[:2] in _SHORT:
+                ref = word[2:]
+            else:
+                continue
+            if ref:
+                paths.append(Path(ref).expanduser().resolve())
+    return paths
+
+
+class CacheEntry(NamedTuple):
+    """A cached layer archive."""
+
+    key: str  #: the cache key
+    name: str  #: the name of the layer
+    version: str  #: the layer version
+    size: int  #: the size of the archive (in bytes)
+    created: float  #: when the entry was created (seconds since the epoch)
+    last_used: float  #: when the entry was last used
+    distributions: List[str]  #: the distributions installed in the layer
+    path: Path  #: the path to the entry directory
+
+    @property
+    def archive(self) -> Path:
+        """Get the path to the cached archive."""
+        return self.path / _ARCHIVE
+
+
+def _distributions(archive: Path) -> List[str]:
+    """
+    List the distributions installed in a layer archive.
+
+    :param archive: the path to the archive
+    :return: the distribution names (e.g. ``requests-2.22.0``)
+    """
+    with zipfile.ZipFile(str(archive)) as _zip:
+        return sorted({
+            name.split('/')[1][:-len('.dist-info')]
+            for name in _zip.namelist()
+            if name.count('/') > 1 and name.split('/')[1].endswith(
+                '.dist-info'
+            )
+        })
+
+
+class BuildCache(object):
+    """A local cache of layer archives, keyed on everything that goes into
+    building them."""
+
+    def __init__(
+            self,
+            path: Union[str, Path, None] = None,
+            max_size: Optional[int] = None
+    ):
+        """
+        Create a new instance.
+
+        :param path: the cache directory (defaults to
+            ``LAMBDA_LAYER_CACHE_DIR``)
+        :param max_size: the maximum size of the cache in bytes (defaults to
+            ``LAMBDA_LAYER_CACHE_SIZE`` megabytes)
+        """
+        _path = path if path else env.get(env.Vars.LAMBDA_LAYER_CACHE_DIR)
+        self.path: Path = Path(_path).expanduser().resolve()
+        self.max_size: int = (
+            max_size if max_size is not None
+            else int(env.get(env.Vars.LAMBDA_LAYER_CACHE_SIZE)) * 1024 * 1024
+        )
+
+    @staticmethod
+    def key(
+            layer: LayerConfig,
+            resolved: Optional[Iterable[str]] = None
+    ) -> str:
+        """
+        Calculate the cache key for a layer.
+
+        :param layer: the layer configuration
+        :param resolved: the distributions a layer that isn't locked (or
+            pinned) resolves to (see
+            :py:func:`lambda_layer.package.bash.resolved_distributions`), so
+            a new release of one of them changes the key
+        :return: the key
+        """
+        data = {
+            **{
+                field: value for field, value in layer._asdict().items()
+                if field not in _UNKEYED
+            },
+            'packages': sorted(
+                ' '.join(package.split()).lower()
+                for package in layer.packages
+            ),
+            'interpreter': ' '.join(interpreter())
+        }
+        # If the layer refers to requirements files, what's in them counts
+        # too.
+        _references = references(layer)
+        if _references:
+            data['references'] = {
+                str(path): hashlib.sha256(path.read_bytes()).hexdigest()
+                if path.is_file() else None
+                for path in _references
+            }
+        if resolved is not None:
+            data['resolved'] = sorted(resolved)
+        return hashlib.sha256(
+            json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    def entries(self) -> List[CacheEntry]:
+        """
+        Get the entries in the cache, most-recently used first.
+
+        :return: the entries
+        """
+        if not self.path.is_dir():
+            return []
+        entries = []
+        for meta in self.path.glob(f"*/{_META}"):
+            # Entries that start with a '.' are still being put together.
+            if meta.parent.name.startswith('.'):
+                continue
+            try:
+                data = json.loads(meta.read_text())
+            except (OSError, ValueError):
+                continue  # It's half-written or damaged; ignore it.
+            entries.append(CacheEntry(**{**data, 'path': meta.parent}))
+        return sorted(entries, key=lambda entry: entry.last_used, reverse=True)
+
+    def size(self) -> int:
+        """Get the total size of the cached archives (in bytes)."""
+        return sum(entry.size for entry in self.entries())
+
+    def _write_meta(self, entry: CacheEntry):
+        """Write an entry's metadata."""
+        data = entry._asdict()
+        del data['path']
+        tmp = entry.path / f"{_META}.{os.getpid()}"
+        tmp.write_text(json.dumps(data, indent=2))
+        os.replace(str(tmp), str(entry.path / _META))
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Look up an entry by its key.
+
+        :param key: the cache key
+        :return: the entry, or ``None`` if it isn't in the cache
+        """
+        meta = self.path / key / _META
+        if not meta.is_file() or not (self.path / key / _ARCHIVE).is_file():
+            return None
+        try:
+            data = json.loads(meta.read_text())
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(**{**data, 'path': meta.parent})
+
+    def restore(self, key: str, sink: Sink, name: str) -> Optional[str]:
+        """
+        Write a cached archive to a sink.
+
+        :param key: the cache key
+        :param sink: the sink
+        :param name: the archive's file name
+        :return: where the archive went, or ``None`` if there was nothing in
+            the cache
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        with sink.open(name) as writer:
+            with open(str(entry.archive), 'rb') as fb:
+                shutil.copyfileobj(fb, writer, 1024 * 1024)
+        # Mark it as recently used.
+        self._write_meta(entry._replace(last_used=time.time()))
+        return writer.location
+
+    def sink(self, key: str, layer: LayerConfig) -> Sink:
+        """
+        Get a sink that adds the archive it's given to the cache.
+
+        :param key: the cache key
+        :param layer: the layer configuration
+        :return: the sink
+        """
+        return _CacheSink(self, key, layer)
+
+    def store(
+            self,
+            key: str,
+            layer: LayerConfig,
+            archive: Path
+    ) -> CacheEntry:
+        """
+        Add a layer archive to the cache.
+
+        :param key: the cache key
+        :param layer: the layer configuration
+        :param archive: the path to the archive
+        :return: the new cache entry
+        """
+        with self.sink(key, layer).open(_ARCHIVE) as writer:
+            with open(str(archive), 'rb') as fb:
+                shutil.copyfileobj(fb, writer, 1024 * 1024)
+        return self.get(key)
+
+    def _commit(self, key: str, layer: LayerConfig, tmp: Path):
+        """
+        Move an entry that's been put together off to the side into place.
+
+        :param key: the cache key
+        :param layer: the layer configuration
+        :param tmp: the temporary entry directory (with the archive in it)
+        """
+        now = time.time()
+        entry = CacheEntry(
+            key=key,
+            name=layer.name,
+            version=layer.version,
+            size=(tmp / _ARCHIVE).stat().st_size,
+            created=now,
+            last_used=now,
+            distributions=_distributions(tmp / _ARCHIVE),
+            path=tmp
+        )
+        self._write_meta(entry)
+        try:
+            os.rename(str(tmp), str(self.path / key))
+        except OSError:
+            # Somebody else beat us to it.
+            shutil.rmtree(str(tmp), ignore_errors=True)
+        self.prune()
+
+    def remove(self, entries: Iterable[CacheEntry]) -> int:
+        """
+        Remove entries from the cache.
+
+        :param entries: the entries to remove
+        :return: the number of bytes removed
+        """
+        removed = 0
+        for entry in entries:
+            shutil.rmtree(str(entry.path), ignore_errors=True)
+            removed += entry.size
+        return removed
+
+    def prune(self, max_size: Optional[int] = None) -> List[CacheEntry]:
+        """
+        Evict the least-recently used entries until the cache fits.
+
+        :param max_size: the maximum size of the cache in bytes (defaults to
+            the cache's own limit)
+        :return: the evicted entries
+        """
+        _max_size = self.max_size if max_size is None else max_size
+        total = 0
+        evicted = []
+        for entry in self.entries():
+            total += entry.size
+            if total > _max_size:
+                evicted.append(entry)
+        self.remove(evicted)
+        return evicted
+
+
+class _CacheWriter(SinkWriter):
+    """Writes an archive into a new cache entry."""
+
+    def __init__(self, cache: BuildCache, key: str, layer: LayerConfig):
+        super().__init__(location=str(cache.path / key / _ARCHIVE))
+        self._cache = cache
+        self._key = key
+        self._layer = layer
+        cache.path.mkdir(parents=True, exist_ok=True)
+        # Put the entry together off to the side, then move it into place
+        # all-at-once so nobody sees a partial entry.
+        self._tmp = Path(
+            tempfile.mkdtemp(prefix=f".{key}.", dir=str(cache.path))
+        )
+        self._fb = open(str(self._tmp / _ARCHIVE), 'wb')
+
+    def _write(self, data: bytes):
+        self._fb.write(data)
+
+    def commit(self) -> bool:
+        self._fb.close()
+        self._cache._commit(  # pylint: disable=protected-access
+            self._key, self._layer, self._tmp
+        )
+        return True
+
+    def abort(self):
+        self._fb.close()
+        shutil.rmtree(str(self._tmp), ignore_errors=True)
+
+
+class _CacheSink(Sink):
+    """Adds the archives it's given to a build cache."""
+
+    def __init__(self, cache: BuildCache, key: str, layer: LayerConfig):
+        self.cache = cache
+        self.key = key
+        self.layer = layer
+
+    def open(self, name: str) -> SinkWriter:
+        return _CacheWriter(self.cache, self.key, self.layer)
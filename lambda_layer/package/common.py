@@ -8,6 +8,9 @@ Objects and functions common to all environments.
 .. currentmodule:: lambda_layer.package.common
 .. moduleauthor:: Pat Daburu <pat@daburu.net>
 """
+from functools import lru_cache
+import platform
+from subprocess import PIPE, run
 from typing import NamedTuple
 
 
@@ -16,3 +19,38 @@ class ProcOutput(NamedTuple):
 
     stdout: str  #: standard out (STDOUT)
     stderr: str  #: standard error (STDERR)
+
+
+class Interpreter(NamedTuple):
+    """Describes the interpreter layers are built with."""
+
+    cache_tag: str  #: the bytecode cache tag (e.g. ``cpython-38``)
+    version: str  #: the major and minor version (e.g. ``3.8``)
+    machine: str  #: the machine type (e.g. ``x86_64``)
+    system: str  #: the operating system (e.g. ``Linux``)
+
+
+@lru_cache(maxsize=None)
+def interpreter() -> Interpreter:
+    """
+    Describe the interpreter layers are built with (the ``python`` on the
+    ``PATH``).
+    """
+    proc = run(
+        [
+            'python', '-c',
+            'import platform, sys; '
+            'print(sys.implementation.cache_tag, '
+            '"%d.%d" % sys.version_info[:2], platform.machine())'
+        ],
+        stdout=PIPE,
+        stderr=PIPE,
+        check=True
+    )
+    cache_tag, version, machine = proc.stdout.decode('utf-8').split()
+    return Interpreter(
+        cache_tag=cache_tag,
+        version=version,
+        machine=machine,
+        system=platform.system()
+    )
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Decide how to compress each file in a layer (and keep track of what that
+saves).
+
+.. currentmodule:: lambda_layer.package.compression
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+import zlib
+from ..config import CompressionConfig
+from .prune import compile_glob
+
+STORE = 'store'  #: stored as it is
+FAST = 'fast'  #: compressed as fast as possible
+DEFAULT = 'default'  #: compressed at the layer's compression level
+MAX = 'max'  #: compressed as small as possible
+#: the choices, in the order they're reported
+CHOICES = (STORE, FAST, DEFAULT, MAX)
+
+FAST_LEVEL = 1  #: the compression level for fast compression
+MAX_LEVEL = 9  #: the compression level for maximum compression
+
+#: files that are already compressed (and are stored unless the layer's
+#: rules say otherwise)
+DEFAULT_STORE = (
+    '**/*.zip', '**/*.whl', '**/*.egg', '**/*.jar',
+    '**/*.gz', '**/*.tgz', '**/*.bz2', '**/*.xz', '**/*.lzma', '**/*.zst',
+    '**/*.7z', '**/*.png', '**/*.jpg', '**/*.jpeg', '**/*.gif', '**/*.webp',
+    '**/*.mp3', '**/*.mp4', '**/*.woff', '**/*.woff2'
+)
+
+#: a file whose sample doesn't shrink below this fraction is stored
+_INCOMPRESSIBLE = 0.97
+#: a big text file whose sample shrinks to this fraction (or less) is
+#: compressed as small as possible
+_VERY_COMPRESSIBLE = 0.35
+_BIG = 256 * 1024  #: the size (in bytes) from which a file counts as big
+#: the bytes sampled (just to see what it saved) when a rule has decided
+_PROBE = 4 * 1024
+
+
+class Sample(NamedTuple):
+    """
+    The start of a file, compressed at the layer's compression level.
+
+    The compressor is left as it is, so the rest of the file can be
+    compressed without going over the start again.
+    """
+
+    size: int  #: the number of bytes sampled
+    compressed: int  #: the size of the sample once it's compressed
+    seconds: float  #: how long it took to compress
+    text: bool  #: ``True`` if it looks like text (it has no NULs)
+    head: bytes  #: what the compressor has written so far
+    compressor: Any  #: the compressor (with the sample in it)
+
+    @property
+    def ratio(self) -> float:
+        """Get the size of the compressed sample as a fraction of the
+        original."""
+        return self.compressed / self.size if self.size else 1.0
+
+    def finish(self, data: bytes) -> bytes:
+        """
+        Compress the rest of the file.  (This can only be done once.)
+
+        :param data: the file's contents
+        :return: the whole file's raw deflate stream
+        """
+        return (
+            self.head + self.compressor.compress(data[self.size:])
+            + self.compressor.flush()
+        )
+
+
+class Decision(NamedTuple):
+    """How a file is compressed."""
+
+    choice: str  #: ``store``, ``fast``, ``default`` or ``max``
+    level: int  #: the compression level (``0`` if it's stored)
+    sample: Optional[Sample]  #: the sample it was based on (if any)
+
+
+class Tally(NamedTuple):
+    """What compressing the files with the same choice cost."""
+
+    files: int = 0  #: the number of files
+    size: int = 0  #: the bytes before compression
+    compressed: int = 0  #: the bytes after compression
+    seconds: float = 0  #: the time spent compressing
+    #: the bytes after compression (estimated) at the layer's level
+    baseline_size: float = 0
+    #: the time compressing at the layer's level would take (estimated)
+    baseline_seconds: float = 0
+
+    def add(self, other: 'Tally') -> 'Tally':
+        """
+        Add up two tallies.
+
+        :param other: the other tally
+        :return: the sum
+        """
+        return Tally(*(mine + theirs for mine, theirs in zip(self, other)))
+
+
+def sample(data: bytes, size: int, level: int) -> Sample:
+    """
+    Compress the start of a file.
+
+    :param data: the file's contents
+    :param size: the most bytes to sample
+    :param level: the compression level
+    :return: the sample
+    """
+    chunk = data[:size]
+    start = time.perf_counter()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    head = compressor.compress(chunk)
+    # We flush a copy to see how small the sample got, so the compressor
+    # itself can carry on.
+    compressed = len(head) + len(compressor.copy().flush())
+    return Sample(
+        size=len(chunk),
+        compressed=compressed,
+        seconds=time.perf_counter() - start,
+        text=b'\0' not in chunk,
+        head=head,
+        compressor=compressor
+    )
+
+
+class Policy(object):
+    """Decides how each file in a layer is compressed."""
+
+    def __init__(self, config: CompressionConfig, level: int):
+        """
+        Create a new instance.
+
+        :param config: the layer's compression rules
+        :param level: the layer's compression level
+        """
+        self.config = config
+        self.level = level
+        self._globs = (
+            (STORE, (
+                *(DEFAULT_STORE if config.defaults else ()), *config.store
+            )),
+            (FAST, config.fast),
+            (MAX, config.max)
+        )
+        self._lock = threading.Lock()
+        self._tallies: Dict[str, Tally] = {}
+
+    def level_for(self, choice: str) -> int:
+        """
+        Get the compression level for a choice.
+
+        :param choice: the choice
+        :return: the level (``0`` if the file is stored)
+        """
+        return {
+            STORE: 0, FAST: FAST_LEVEL, DEFAULT: self.level, MAX: MAX_LEVEL
+        }[choice]
+
+    def rule(self, relpath: str) -> Optional[str]:
+        """
+        See which of the rules (if any) decides how a file is compressed.
+
+        :param relpath: the file's path (relative to the layer's ``python``
+            directory)
+        :return: the choice, or ``None`` if it's up to the file's sample
+        """
+        # (The latest rule that matches wins.)
+        choice = None
+        for _choice, globs in self._globs:
+            if any(compile_glob(glob).match(relpath) for glob in globs):
+                choice = _choice
+        return choice
+
+    def decide(self, relpath: str, data: bytes) -> Decision:
+        """
+        Decide how to compress a file.
+
+        Files that match one of the rules' patterns are compressed the way
+        the rule says.  The rest are stored if a sample hardly shrinks, or
+        compressed as small as possible if they're big text files that
+        shrink a lot.  (Native libraries hardly get any smaller at the
+        highest level, and it takes much longer.)
+
+        :param relpath: the file's path (relative to the layer's ``python``
+            directory)
+        :param data: the file's contents
+        :return: the decision
+        """
+        choice = self.rule(relpath)
+        # If a rule has already decided, a small sample is enough to tell
+        # what it saved.
+        size = min(self.config.sample, _PROBE) if choice else (
+            self.config.sample
+        )
+        _sample = sample(data, size, self.level) if size else None
+        if choice is None and _sample is not None:
+            if _sample.ratio >= _INCOMPRESSIBLE:
+                choice = STORE
+            elif (
+                    len(data) >= _BIG
+                    and _sample.text
+                    and _sample.ratio <= _VERY_COMPRESSIBLE
+            ):
+                choice = MAX
+        _choice = choice or DEFAULT
+        return Decision(
+            choice=_choice, level=self.level_for(_choice), sample=_sample
+        )
+
+    def record(
+            self,
+            decision: Decision,
+            size: int,
+            compressed: int,
+            seconds: float
+    ):
+        """
+        Keep track of what compressing a file cost.
+
+        :param decision: how the file was compressed
+        :param size: the bytes before compression
+        :param compressed: the bytes after compression
+        :param seconds: the time spent compressing it (including the sample)
+        """
+        _sample = decision.sample
+        if decision.choice == DEFAULT or _sample is None:
+            # The file was compressed just the way it would have been anyway.
+            baseline_size = compressed
+            baseline_seconds = seconds
+        else:
+            # Otherwise, we go by the sample.
+            scale = size / _sample.size if _sample.size else 1
+            baseline_size = _sample.compressed * scale
+            baseline_seconds = _sample.seconds * scale
+        tally = Tally(
+            files=1,
+            size=size,
+            compressed=compressed,
+            seconds=seconds,
+            baseline_size=baseline_size,
+            baseline_seconds=baseline_seconds
+        )
+        with self._lock:
+            self._tallies[decision.choice] = self._tallies.get(
+                decision.choice, Tally()
+            ).add(tally)
+
+    def tallies(self) -> Dict[str, Tally]:
+        """
+        Get what compressing the files cost, by choice.
+
+        :return: the tallies
+        """
+        with self._lock:
+            return {
+                choice: self._tallies[choice] for choice in CHOICES
+                if choice in self._tallies
+            }
+
+    def table(self) -> str:
+        """
+        Create a table of what compressing the files cost (and what it saved
+        compared with compressing them all at the layer's compression level).
+
+        :return: the table
+        """
+        tallies = self.tallies()
+        total = Tally()
+        for tally in tallies.values():
+            total = total.add(tally)
+        headers = ('compression', 'files', 'MB', 'zipped MB', 'seconds')
+        rows = [
+            (
+                choice,
+                str(tally.files),
+                f"{tally.size / 1024 / 1024:.2f}",
+                f"{tally.compressed / 1024 / 1024:.2f}",
+                f"{tally.seconds:.2f}"
+            )
+            for choice, tally in [*tallies.items(), ('total', total)]
+        ]
+        widths = [
+            max(len(row[col]) for row in [headers, *rows])
+            for col in range(len(headers))
+        ]
+        lines = [
+            '  '.join(
+                cell.ljust(width) if col == 0 else cell.rjust(width)
+                for col, (cell, width) in enumerate(zip(row, widths))
+            )
+            for row in [headers, tuple('-' * width for width in widths), *rows]
+        ]
+        saved_seconds = total.baseline_seconds - total.seconds
+        saved_mb = (total.baseline_size - total.compressed) / 1024 / 1024
+        lines.append(
+            f"Compared with level {self.level} for everything, that saved "
+            f"about {saved_seconds:.2f} seconds and {saved_mb:.2f} MB."
+        )
+        return '\n'.join(lines)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Factor the distributions that several layers share into base layers.
+
+.. currentmodule:: lambda_layer.package.factor
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from pathlib import Path
+import tempfile
+from typing import (
+    Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+)
+from ..config import Config, LayerConfig
+from . import targets
+from .bash import resolve_versions, write_requirements
+
+#: the most layers a Lambda function can use
+MAX_LAYERS = 5
+
+#: the settings a base layer takes from the layers that share it (if they
+#: all agree)
+_SHARED_SETTINGS = (
+    'venv', 'compression_level', 'reproducible', 'prune', 'strip',
+    'precompile', 'drop_sources', 'max_size', 'incremental', 'platforms',
+    'pythons'
+)
+
+
+class BaseLayer(NamedTuple):
+    """A set of distributions that several layers share."""
+
+    name: str  #: the name of the base layer
+    layers: Tuple[str, ...]  #: the names of the layers that share it
+    distributions: Tuple[str, ...]  #: the pinned distributions in it
+
+    @property
+    def version(self) -> str:
+        """Get a version that changes whenever the distributions do."""
+        return hashlib.sha256(
+            ' '.join(self.distributions).encode('utf-8')
+        ).hexdigest()[:12]
+
+
+def resolve(
+        layers: Iterable[LayerConfig],
+        wheelhouse: Optional[Path] = None,
+        jobs: Optional[int] = None
+) -> Dict[str, Dict[str, str]]:
+    """
+    Figure out which distributions each layer's requirements resolve to.
+
+    :param layers: the layer configurations
+    :param wheelhouse: the path to a wheelhouse to resolve from (instead of
+        the package index)
+    :param jobs: the maximum number of targets to resolve at once
+    :return: the versions, by normalized distribution name, by layer name
+    :raises ValueError: if the layers aren't all built for the same targets,
+        or a layer resolves differently for each of its targets
+    """
+    def _target(layer: LayerConfig) -> Dict[str, str]:
+        _target = targets.target(layer)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return resolve_versions(
+                requirements=write_requirements(
+                    path=Path(tmp_dir) / 'requirements.txt',
+                    packages=layer.packages,
+                    silent=True
+                ),
+                wheelhouse=wheelhouse,
+                no_deps=not layer.deps,
+                options=_target.pip_options() if _target else [],
+                silent=True
+            )
+
+    _layers = list(layers)
+    # A base layer is built for the same targets as the layers that use it,
+    # so they all have to agree.
+    if len({(layer.platforms, layer.pythons) for layer in _layers}) > 1:
+        raise ValueError(
+            "The layers aren't all built for the same platforms and Python "
+            "versions, so they can't share base layers."
+        )
+    # Each of a layer's targets is resolved on its own...
+    expanded = [
+        (layer.name, _layer)
+        for layer in _layers for _layer in targets.expand(layer)
+    ]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        versions = pool.map(_target, [_layer for _, _layer in expanded])
+        resolved: Dict[str, Dict[str, str]] = {}
+        for (name, _layer), _versions in zip(expanded, versions):
+            # ...and the layer's distributions are pinned for all of them, so
+            # they have to come out the same.
+            if resolved.setdefault(name, _versions) != _versions:
+                raise ValueError(
+                    f"{name} resolves to other distributions for "
+                    f"{targets.label(_layer)}, so it can't be factored."
+                )
+        return resolved
+
+
+def plan(
+        resolved: Mapping[str, Mapping[str, str]],
+        min_layers: int = 2,
+        max_layers: int = MAX_LAYERS,
+        prefix: str = 'base'
+) -> Tuple[BaseLayer, ...]:
+    """
+    Find the distributions that several layers share, and group them into
+    base layers.
+
+    :param resolved: the versions, by normalized distribution name, by layer
+        name
+    :param min_layers: the fewest layers that must share a distribution for
+        it to go into a base layer
+    :param max_layers: the most layers a function may use (a layer that's
+        split up needs one for itself, plus one for each of its bases)
+    :param prefix: the prefix for the base layers' names
+    :return: the base layers
+    """
+    # Which layers share each distribution (at the same version)?
+    sharers: Dict[str, List[str]] = defaultdict(list)
+    for layer, distributions in sorted(resolved.items()):
+        for name, version in distributions.items():
+            sharers[f"{name}=={version}"].append(layer)
+    # Distributions that are shared by exactly the same layers go together.
+    groups: Dict[FrozenSet[str], List[str]] = defaultdict(list)
+    for pin, layers in sharers.items():
+        if len(layers) >= min_layers:
+            groups[frozenset(layers)].append(pin)
+    # The groups that save the most installs go first, as long as no layer
+    # ends up needing too many bases.
+    bases: Dict[str, int] = defaultdict(int)
+    accepted = []
+    for layers, pins in sorted(
+            groups.items(),
+            key=lambda group: (
+                -len(group[1]) * (len(group[0]) - 1), sorted(group[0])
+            )
+    ):
+        if any(bases[layer] >= max_layers - 1 for layer in layers):
+            continue
+        for layer in layers:
+            bases[layer] += 1
+        accepted.append((tuple(sorted(layers)), tuple(sorted(pins))))
+    return tuple(
+        BaseLayer(
+            name=f"{prefix}-{idx}", layers=layers, distributions=pins
+        )
+        for idx, (layers, pins) in enumerate(accepted, start=1)
+    )
+
+
+def _base_config(
+        base: BaseLayer,
+        layers: Iterable[LayerConfig]
+) -> LayerConfig:
+    """
+    Create the configuration for a base layer.
+
+    :param base: the base layer
+    :param layers: the configurations of the layers that share it
+    :return: the base layer's configuration
+    """
+    _layers = list(layers)
+    defaults = LayerConfig._field_defaults  # pylint: disable=no-member
+    settings = {}
+    for field in _SHARED_SETTINGS:
+        values = {repr(getattr(layer, field)) for layer in _layers}
+        # If the layers don't agree on a setting, the base layer goes with
+        # the default.
+        settings[field] = (
+            getattr(_layers[0], field) if len(values) == 1
+            else defaults[field]
+        )
+    return LayerConfig(
+        name=base.name,
+        version=base.version,
+        packages=base.distributions,
+        deps=False,
+        **settings
+    )
+
+
+def factor(
+        config: Config,
+        resolved: Mapping[str, Mapping[str, str]],
+        bases: Iterable[BaseLayer]
+) -> Config:
+    """
+    Rewrite a configuration to use base layers.
+
+    Every distribution is pinned, and installed without its dependencies
+    (which are pinned too, in the same layer or one of its bases).
+
+    :param config: the configuration
+    :param resolved: the versions, by normalized distribution name, by layer
+        name
+    :param bases: the base layers
+    :return: the new configuration, with the base layers first
+    """
+    _bases = list(bases)
+    layers = {layer.name: layer for layer in config.layers}
+    slim = []
+    for layer in config.layers:
+        used = [base for base in _bases if layer.name in base.layers]
+        shared = {pin for base in used for pin in base.distributions}
+        slim.append(layer._replace(
+            packages=tuple(sorted(
+                pin for pin in (
+                    f"{name}=={version}"
+                    for name, version in resolved[layer.name].items()
+                )
+                if pin not in shared
+            )),
+            deps=False,
+            bases=tuple(base.name for base in used)
+        ))
+    return config._replace(layers=tuple([
+        *(
+            _base_config(base, (layers[name] for name in base.layers))
+            for base in _bases
+        ),
+        *slim
+    ]))
+
+
+def table(
+        resolved: Mapping[str, Mapping[str, str]],
+        bases: Iterable[BaseLayer]
+) -> str:
+    """
+    Describe the base layers (and what they save).
+
+    :param resolved: the versions, by normalized distribution name, by layer
+        name
+    :param bases: the base layers
+    :return: the description
+    """
+    _bases = list(bases)
+    headers = ('base', 'distributions', 'used by')
+    rows = [
+        (base.name, str(len(base.distributions)), ', '.join(base.layers))
+        for base in _bases
+    ]
+    widths = [
+        max(len(row[col]) for row in [headers, *rows])
+        for col in range(len(headers))
+    ]
+    lines = [
+        '  '.join(
+            cell.ljust(width) for cell, width in zip(row, widths)
+        ).rstrip()
+        for row in [headers, tuple('-' * width for width in widths), *rows]
+    ]
+    before = sum(len(distributions) for distributions in resolved.values())
+    after = before - sum(
+        len(base.distributions) * (len(base.layers) - 1) for base in _bases
+    )
+    lines.append(
+        f"Distributions installed: {before} before, {after} after"
+    )
+    return '\n'.join(lines)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Profile how long it takes to import a layer's modules from a cold start.
+
+.. currentmodule:: lambda_layer.package.importtime
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import defaultdict
+from functools import lru_cache
+import os
+from pathlib import Path
+import statistics
+from subprocess import PIPE, run
+import tempfile
+from typing import (
+    Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+)
+import zipfile
+
+_PREFIX = 'import time:'  #: the prefix of ``-X importtime`` lines
+
+
+class ImportNode(NamedTuple):
+    """The time it took to import a module (and the modules it imported)."""
+
+    name: str  #: the module name
+    self_us: int  #: microseconds spent in the module itself
+    cumulative_us: int  #: microseconds including the modules it imported
+    children: Tuple['ImportNode', ...] = ()  #: the modules it imported
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the node as a mapping of simple types."""
+        return {
+            'name': self.name,
+            'self_us': self.self_us,
+            'cumulative_us': self.cumulative_us,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+
+class ImportProfile(NamedTuple):
+    """A layer's import-time profile."""
+
+    modules: Tuple[str, ...]  #: the modules that were imported
+    runs: int  #: the number of times they were imported
+    roots: Tuple[ImportNode, ...]  #: the (median) import times
+    error: Optional[str] = None  #: why the imports failed (if they did)
+
+    @property
+    def total_us(self) -> int:
+        """Get the total (median) import time in microseconds."""
+        return sum(root.cumulative_us for root in self.roots)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the profile as a mapping of simple types."""
+        return {
+            'modules': list(self.modules),
+            'runs': self.runs,
+            'total_us': self.total_us,
+            'error': self.error,
+            'imports': [root.to_dict() for root in self.roots]
+        }
+
+
+def parse(stderr: str) -> List[ImportNode]:
+    """
+    Parse the output of ``python -X importtime``.
+
+    :param stderr: the interpreter's standard error
+    :return: the top-level imports
+    """
+    # Each import is reported after the imports it caused, indented two
+    # spaces deeper, so we hold on to the children at each depth until we
+    # see their parent.
+    pending: Dict[int, List[ImportNode]] = defaultdict(list)
+    for line in stderr.splitlines():
+        if not line.startswith(_PREFIX):
+            continue
+        fields = line[len(_PREFIX):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # It's the header.
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        pending[depth].append(ImportNode(
+            name=name.strip(),
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            children=tuple(pending.pop(depth + 1, []))
+        ))
+    return pending[min(pending)] if pending else []
+
+
+def _merge(runs: Sequence[Sequence[ImportNode]]) -> Tuple[ImportNode, ...]:
+    """
+    Merge the import trees from several runs, taking the median times.
+
+    :param runs: the import trees
+    :return: the merged tree, slowest imports first
+    """
+    by_name: Dict[str, List[ImportNode]] = defaultdict(list)
+    for nodes in runs:
+        for node in nodes:
+            by_name[node.name].append(node)
+    merged = [
+        ImportNode(
+            name=name,
+            self_us=int(statistics.median(node.self_us for node in nodes)),
+            cumulative_us=int(
+                statistics.median(node.cumulative_us for node in nodes)
+            ),
+            children=_merge([node.children for node in nodes])
+        )
+        for name, nodes in by_name.items()
+    ]
+    return tuple(sorted(merged, key=lambda node: -node.cumulative_us))
+
+
+@lru_cache(maxsize=None)
+def _startup() -> FrozenSet[str]:
+    """
+    Get the modules the interpreter imports before it runs anything (so we
+    can leave them out of the profile).
+    """
+    proc = run(
+        ['python', '-s', '-X', 'importtime', '-c', 'pass'],
+        stdout=PIPE,
+        stderr=PIPE
+    )
+    return frozenset(
+        node.name for node in parse(proc.stderr.decode('utf-8'))
+    )
+
+
+def _import(
+        python_dir: Path,
+        modules: Iterable[str]
+) -> Tuple[List[ImportNode], Optional[str]]:
+    """
+    Import modules in a fresh interpreter.
+
+    :param python_dir: the directory that stands in for ``/opt/python``
+    :param modules: the modules
+    :return: the import tree, and the error (if there was one)
+    """
+    proc = run(
+        [
+            'python', '-s', '-X', 'importtime', '-c',
+            '; '.join(f"import {module}" for module in modules)
+        ],
+        stdout=PIPE,
+        stderr=PIPE,
+        cwd=str(python_dir),
+        env={
+            **os.environ,
+            'PYTHONPATH': str(python_dir),
+            # `/opt` is read-only on Lambda, so nothing gets cached between
+            # cold starts.
+            'PYTHONDONTWRITEBYTECODE': '1'
+        }
+    )
+    stderr = proc.stderr.decode('utf-8')
+    error = None
+    if proc.returncode != 0:
+        lines = [
+            line for line in stderr.splitlines()
+            if line.strip() and not line.startswith(_PREFIX)
+        ]
+        error = lines[-1] if lines else f"exited with {proc.returncode}"
+    startup = _startup()
+    return [
+        node for node in parse(stderr) if node.name not in startup
+    ], error
+
+
+def top_levels(archive: Path, prefix: str = 'python') -> Tuple[str, ...]:
+    """
+    List the (public) top-level modules of the distributions in a layer
+    archive.
+
+    :param archive: the path to the archive
+    :param prefix: the directory the layer's files are in within the archive
+    :return: the module names
+    """
+    names = set()
+    with zipfile.ZipFile(str(archive)) as _zip:
+        for info in _zip.infolist():
+            parts = info.filename.split('/')
+            if (
+                    len(parts) == 3 and parts[0] == prefix
+                    and parts[1].endswith('.dist-info')
+                    and parts[2] == 'top_level.txt'
+            ):
+                names.update(_zip.read(info).decode('utf-8').split())
+    return tuple(sorted(
+        name for name in names
+        if not name.startswith('_') and '/' not in name
+    ))
+
+
+def profile(
+        archive: Path,
+        modules: Sequence[str] = (),
+        runs: int = 5
+) -> ImportProfile:
+    """
+    Profile the time it takes to import modules from a layer archive, the
+    way a Lambda function would on a cold start.
+
+    :param archive: the path to the archive
+    :param modules: the modules to import (defaults to the top-level modules
+        of every distribution in the layer)
+    :param runs: the number of times to import them
+    :return: the profile
+    """
+    _modules = tuple(modules) if modules else top_levels(archive)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Lambda extracts layers into `/opt`.
+        opt = Path(tmp_dir) / 'opt'
+        with zipfile.ZipFile(str(archive)) as _zip:
+            _zip.extractall(str(opt))
+        trees = []
+        error = None
+        for _ in range(max(1, runs)):
+            tree, error = _import(opt / 'python', _modules)
+            trees.append(tree)
+            if error:
+                break  # It isn't going to go any better next time.
+    return ImportProfile(
+        modules=_modules,
+        runs=len(trees),
+        roots=_merge(trees),
+        error=error
+    )
+
+
+def tree(
+        _profile: ImportProfile,
+        depth: int = 3,
+        min_us: int = 1000
+) -> str:
+    """
+    Format a profile as a tree of the slowest imports.
+
+    :param _profile: the profile
+    :param depth: the deepest imports to show
+    :param min_us: the fastest import to show (in microseconds)
+    :return: the formatted tree
+    """
+    lines = []
+
+    def _lines(nodes: Iterable[ImportNode], level: int):
+        for node in nodes:
+            if node.cumulative_us < min_us:
+                continue
+            lines.append(
+                f"{node.cumulative_us / 1000:9.1f} ms  "
+                f"{node.self_us / 1000:9.1f} ms  "
+                f"{'  ' * level}{node.name}"
+            )
+            if level + 1 < depth:
+                _lines(node.children, level + 1)
+
+    lines.append(f"{'cumulative':>12}  {'self':>12}  module")
+    _lines(_profile.roots, 0)
+    lines.append(f"{_profile.total_us / 1000:9.1f} ms  total")
+    return '\n'.join(lines)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Rebuild layers incrementally, patching the archive from the last build.
+
+.. currentmodule:: lambda_layer.package.incremental
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import tempfile
+from typing import (
+    Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Union
+)
+from .. import env
+from ..config import LayerConfig
+from .common import interpreter
+from .sinks import Sink, SinkWriter
+from .targets import label
+
+_ARCHIVE = 'archive.zip'  #: the name of the previous archive
+_MANIFEST = 'manifest.json'  #: the name of the previous build's manifest
+
+#: layer settings that don't change how each file ends up in the archive
+_UNKEYED = (
+    'name', 'version', 'packages', 'max_size', 'profile', 'bases'
+)
+
+
+class FileRecord(NamedTuple):
+    """A file in an incrementally-built layer."""
+
+    owner: str  #: the name of the distribution that owns it
+    sha256: str  #: the SHA-256 digest of its contents
+
+
+class Manifest(NamedTuple):
+    """What went into a layer build."""
+
+    settings: str  #: the digest of the settings the layer was built with
+    distributions: Dict[str, str]  #: the versions, by normalized name
+    files: Dict[str, FileRecord]  #: the files, by their paths in the layer
+
+    def to_dict(self) -> Dict:
+        """Get the manifest as a mapping of simple types."""
+        return {
+            'settings': self.settings,
+            'distributions': self.distributions,
+            'files': {
+                path: record._asdict() for path, record in self.files.items()
+            }
+        }
+
+    @classmethod
+    def load(cls, data: Mapping) -> 'Manifest':
+        """
+        Load a manifest from a mapping of simple types.
+
+        :param data: the mapping
+        :return: the manifest
+        """
+        return cls(
+            settings=data['settings'],
+            distributions=dict(data['distributions']),
+            files={
+                path: FileRecord(**record)
+                for path, record in data['files'].items()
+            }
+        )
+
+    def changed(self, resolved: Mapping[str, str]) -> List[str]:
+        """
+        Figure out which distributions have to be installed.
+
+        :param resolved: the versions the requirements resolve to now, by
+            normalized name
+        :return: the normalized names of the distributions that are new or
+            have a different version
+        """
+        return sorted(
+            name for name, version in resolved.items()
+            if self.distributions.get(name) != version
+        )
+
+
+class Previous(NamedTuple):
+    """The last incremental build of a layer."""
+
+    manifest: Manifest  #: what went into it
+    archive: Path  #: the path to its archive
+
+
+def normalize(name: str) -> str:
+    """
+    Normalize a distribution name (so ``PyYAML``, ``pyyaml`` and the
+    ``PyYAML`` in ``PyYAML-6.0.dist-info`` all match).
+
+    :param name: the name
+    :return: the normalized name
+    """
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def settings(layer: LayerConfig) -> str:
+    """
+    Calculate the digest of the settings that decide how a layer's files end
+    up in its archive.  (If they change, there's nothing to patch.)
+
+    :param layer: the layer configuration
+    :return: the digest
+    """
+    data = {
+        **{
+            field: value for field, value in layer._asdict().items()
+            if field not in _UNKEYED
+        },
+        'interpreter': ' '.join(interpreter())
+    }
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def installed(root: Path) -> Dict[str, str]:
+    """
+    List the distributions installed in a layer.
+
+    :param root: the layer's root directory
+    :return: the versions, by normalized name
+    """
+    distributions = {}
+    for dist_info in root.glob('*.dist-info'):
+        name, _, version = dist_info.name[:-len('.dist-info')].partition('-')
+        distributions[normalize(name)] = version
+    return distributions
+
+
+def sha256(path: Path) -> str:
+    """
+    Calculate the SHA-256 digest of a file.
+
+    :param path: the path to the file
+    :return: the hex digest
+    """
+    digest = hashlib.sha256()
+    with open(str(path), 'rb') as fb:
+        for chunk in iter(lambda: fb.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def records(
+        root: Path,
+        owner: Callable[[str], str]
+) -> Dict[str, FileRecord]:
+    """
+    Describe the files in a layer.
+
+    :param root: the layer's root directory
+    :param owner: gets the distribution that owns a file (by its path)
+    :return: the files, by their paths in the layer
+    """
+    files = {}
+    for dirpath, _, names in os.walk(str(root)):
+        for name in names:
+            path = Path(dirpath) / name
+            relpath = path.relative_to(root).as_posix()
+            files[relpath] = FileRecord(
+                owner=owner(relpath), sha256=sha256(path)
+            )
+    return files
+
+
+class Store(object):
+    """Keeps the last incremental build of each layer."""
+
+    def __init__(self, path: Union[str, Path, None] = None):
+        """
+        Create a new instance.
+
+        :param path: the directory (defaults to ``incremental`` in the build
+            cache directory)
+        """
+        self.path: Path = (
+            Path(path) if path
+            else Path(env.get(env.Vars.LAMBDA_LAYER_CACHE_DIR)) / 'incremental'
+        ).expanduser().resolve()
+
+    def previous(self, layer: LayerConfig) -> Optional[Previous]:
+        """
+        Get the last build of a layer (if it can be patched).
+
+        :param layer: the layer configuration
+        :return: the last build, or ``None`` if there isn't one (or it was
+            built with different settings)
+        """
+        entry = self.path / label(layer)
+        try:
+            manifest = Manifest.load(
+                json.loads((entry / _MANIFEST).read_text())
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if (
+                manifest.settings != settings(layer)
+                or not (entry / _ARCHIVE).is_file()
+        ):
+            return None
+        return Previous(manifest=manifest, archive=entry / _ARCHIVE)
+
+    def sink(self, layer: LayerConfig, manifest: Manifest) -> Sink:
+        """
+        Get a sink that keeps the archive it's given (along with its
+        manifest) as the layer's last build.
+
+        :param layer: the layer configuration
+        :param manifest: the new build's manifest
+        :return: the sink
+        """
+        return _StoreSink(self, label(layer), manifest)
+
+    def _commit(self, name: str, tmp: Path):
+        """
+        Replace a layer's last build.
+
+        :param name: the name of the layer
+        :param tmp: the temporary directory with the new build in it
+        """
+        entry = self.path / name
+        old = None
+        if entry.exists():
+            # Move the old build out of the way first.  (If we stop in
+            # between, the next build just starts from scratch.)
+            old = Path(
+                tempfile.mkdtemp(prefix=f".{name}.", dir=str(self.path))
+            )
+            os.rename(str(entry), str(old / name))
+        os.rename(str(tmp), str(entry))
+        if old:
+            shutil.rmtree(str(old), ignore_errors=True)
+
+
+class _StoreWriter(SinkWriter):
+    """Writes an archive (and its manifest) to the store."""
+
+    def __init__(self, store: Store, name: str, manifest: Manifest):
+        super().__init__(location=str(store.path / name / _ARCHIVE))
+        self._store = store
+        self._name = name
+        self._manifest = manifest
+        store.path.mkdir(parents=True, exist_ok=True)
+        self._tmp = Path(
+            tempfile.mkdtemp(prefix=f".{name}.", dir=str(store.path))
+        )
+        self._fb = open(str(self._tmp / _ARCHIVE), 'wb')
+
+    def _write(self, data: bytes):
+        self._fb.write(data)
+
+    def commit(self) -> bool:
+        self._fb.close()
+        (self._tmp / _MANIFEST).write_text(
+            json.dumps(self._manifest.to_dict())
+        )
+        self._store._commit(  # pylint: disable=protected-access
+            self._name, self._tmp
+        )
+        return True
+
+    def abort(self):
+        self._fb.close()
+        shutil.rmtree(str(self._tmp), ignore_errors=True)
+
+
+class _StoreSink(Sink):
+    """Keeps the archives it's given as layers' last builds."""
+
+    def __init__(self, store: Store, name: str, manifest: Manifest):
+        self.store = store
+        self.name = name
+        self.manifest = manifest
+
+    def open(self, name: str) -> SinkWriter:
+        return _StoreWriter(self.store, self.name, self.manifest)
+
+
+def kept(
+        previous: Previous,
+        replaced: Iterable[str],
+        resolved: Mapping[str, str]
+) -> Dict[str, FileRecord]:
+    """
+    Figure out which files from the last build are still good.
+
+    :param previous: the last build
+    :param replaced: the normalized names of the distributions being
+        installed again
+    :param resolved: the versions the requirements resolve to now, by
+        normalized name
+    :return: the files that can be copied from the last build, by their
+        paths in the layer
+    """
+    _replaced = set(replaced)
+    removed = set(previous.manifest.distributions) - set(resolved)
+    return {
+        path: record
+        for path, record in previous.manifest.files.items()
+        if normalize(record.owner) not in _replaced | removed
+    }
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Lock each layer's requirements to exact versions (and hashes), so builds
+don't have to resolve them again.
+
+.. currentmodule:: lambda_layer.package.lock
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+from pathlib import Path
+import tempfile
+from typing import (
+    Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+)
+import toml
+from ..config import LayerConfig
+from .bash import install_report, write_requirements
+from .common import interpreter
+from .incremental import normalize
+from .targets import label, target
+
+#: the suffix of a lockfile (which sits next to its configuration file)
+SUFFIX = '.lock'
+
+
+class LockedDistribution(NamedTuple):
+    """A distribution pinned to an exact version."""
+
+    name: str  #: the name of the distribution
+    version: str  #: the version
+    hashes: Tuple[str, ...] = ()  #: the hashes (e.g. ``sha256:...``)
+    url: Optional[str] = None  #: the archive's URL (if it isn't on an index)
+
+    @property
+    def requirement(self) -> str:
+        """Get the (hash-checked) requirement for the distribution."""
+        return ' '.join([
+            f"{self.name} @ {self.url}" if self.url
+            else f"{self.name}=={self.version}",
+            *(f"--hash={_hash}" for _hash in self.hashes)
+        ])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the locked distribution as a mapping of simple types."""
+        return {
+            key: list(value) if key == 'hashes' else value
+            for key, value in self._asdict().items()
+            if value is not None
+        }
+
+
+class LockedLayer(NamedTuple):
+    """A layer's requirements, resolved."""
+
+    name: str  #: the name of the layer (and its target, if it has one)
+    digest: str  #: the digest of the settings the layer was resolved from
+    distributions: Tuple[LockedDistribution, ...]  #: the distributions
+
+    def stale(self, layer: LayerConfig) -> bool:
+        """
+        Has the layer's configuration changed since it was locked?
+
+        :param layer: the layer configuration
+        :return: ``True`` if the layer has to be locked again
+        """
+        return self.digest != digest(layer)
+
+    def apply(self, layer: LayerConfig) -> LayerConfig:
+        """
+        Pin a layer's packages to the locked distributions.
+
+        :param layer: the layer configuration
+        :return: the locked layer configuration (which installs exactly the
+            locked distributions, checking their hashes)
+        """
+        return layer._replace(
+            packages=tuple(
+                distribution.requirement
+                for distribution in self.distributions
+            ),
+            deps=False
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the locked layer as a mapping of simple types."""
+        return {
+            'name': self.name,
+            'digest': self.digest,
+            'distributions': [
+                distribution.to_dict() for distribution in self.distributions
+            ]
+        }
+
+    @classmethod
+    def load(cls, data: Mapping[str, Any]) -> 'LockedLayer':
+        """
+        Load a locked layer from a mapping of simple types.
+
+        :param data: the mapping
+        :return: the locked layer
+        """
+        return cls(
+            name=data['name'],
+            digest=data['digest'],
+            distributions=tuple(
+                LockedDistribution(**{
+                    **distribution,
+                    'hashes': tuple(distribution.get('hashes', []))
+                })
+                for distribution in data.get('distributions', [])
+            )
+        )
+
+
+class Lock(NamedTuple):
+    """The locked layers in a configuration."""
+
+    layers: Dict[str, LockedLayer]  #: the locked layers, by name
+
+    def get(self, layer: LayerConfig) -> Optional[LockedLayer]:
+        """
+        Get a layer's lock (if it isn't stale).
+
+        :param layer: the layer configuration (for a single target)
+        :return: the locked layer, or ``None`` if the layer isn't locked (or
+            its lock is stale)
+        """
+        locked = self.layers.get(label(layer))
+        if locked is None or locked.stale(layer):
+            return None
+        return locked
+
+    def update(self, layers: Iterable[LockedLayer]) -> 'Lock':
+        """
+        Replace the locks of some layers.
+
+        :param layers: the new locked layers
+        :return: the updated lock
+        """
+        return Lock(layers={
+            **self.layers, **{layer.name: layer for layer in layers}
+        })
+
+    def dumps(self) -> str:
+        """Write the lock as TOML."""
+        return toml.dumps({
+            'layers': [
+                self.layers[name].to_dict() for name in sorted(self.layers)
+            ]
+        })
+
+    @classmethod
+    def loadf(cls, path: Union[str, Path]) -> 'Lock':
+        """
+        Load a lockfile.
+
+        :param path: the file path
+        :return: the lock (which is empty if there isn't a lockfile)
+        """
+        _path = Path(path).expanduser().resolve()
+        if not _path.is_file():
+            return cls(layers={})
+        data = toml.loads(_path.read_text())
+        return cls(layers={
+            layer['name']: LockedLayer.load(layer)
+            for layer in data.get('layers', [])
+        })
+
+
+def path(config: Union[str, Path]) -> Path:
+    """
+    Get the path to the lockfile for a configuration file.
+
+    :param config: the path to the configuration file
+    :return: the path to the lockfile (e.g. ``.lambda-layer.lock`` for
+        ``.lambda-layer.toml``)
+    """
+    return Path(config).expanduser().resolve().with_suffix(SUFFIX)
+
+
+def digest(layer: LayerConfig) -> str:
+    """
+    Calculate the digest of the settings a layer's requirements are resolved
+    from.  (If they change, the lock is stale.)
+
+    :param layer: the layer configuration (for a single target)
+    :return: the digest
+    """
+    _interpreter = interpreter()
+    _target = target(layer)
+    data = {
+        'packages': sorted(
+            ' '.join(package.split()).lower() for package in layer.packages
+        ),
+        'deps': layer.deps,
+        **(
+            {'python': _target.python, 'platform': _target.platform}
+            if _target else {
+                'python': _interpreter.version,
+                'machine': _interpreter.machine,
+                'system': _interpreter.system
+            }
+        )
+    }
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def _hashes(item: Mapping[str, Any]) -> Tuple[str, ...]:
+    """
+    Get the hashes of a distribution from ``pip``'s installation report.
+
+    :param item: the distribution's entry in the report
+    :return: the hashes (e.g. ``sha256:...``)
+    """
+    archive_info = item.get('download_info', {}).get('archive_info', {})
+    hashes = dict(archive_info.get('hashes', {}))
+    # Older versions of pip only report a single hash (as `name=value`).
+    if not hashes and archive_info.get('hash'):
+        name, _, value = archive_info['hash'].partition('=')
+        hashes[name] = value
+    return tuple(f"{name}:{value}" for name, value in sorted(hashes.items()))
+
+
+def _distribution(item: Mapping[str, Any]) -> LockedDistribution:
+    """
+    Lock a distribution from ``pip``'s installation report.
+
+    :param item: the distribution's entry in the report
+    :return: the locked distribution
+    :raises ValueError: if the distribution comes from a direct URL that
+        can't be checked against a hash (like a local directory or a
+        version control repository)
+    """
+    name = normalize(item['metadata']['name'])
+    hashes = _hashes(item)
+    url = None
+    # A distribution that came from a URL (or a local path) has to be
+    # installed from there again, and `pip` won't check a hash for anything
+    # but an archive.
+    if item.get('is_direct'):
+        url = item.get('download_info', {}).get('url')
+        if not url or not hashes:
+            raise ValueError(
+                f"{name} comes from {url or 'a direct reference'}, which "
+                f"can't be locked (there's no archive hash to check); refer "
+                f"to an archive (or a package index) instead"
+            )
+    return LockedDistribution(
+        name=name,
+        version=item['metadata']['version'],
+        hashes=hashes,
+        url=url
+    )
+
+
+def resolve(
+        layer: LayerConfig,
+        wheelhouse: Optional[Path] = None,
+        silent: bool = False
+) -> LockedLayer:
+    """
+    Resolve a layer's requirements.
+
+    :param layer: the layer configuration (for a single target)
+    :param wheelhouse: the path to a wheelhouse to resolve from (instead of
+        the package index)
+    :param silent: ``True`` to suppress normal output
+    :return: the locked layer
+    :raises ValueError: if one of the distributions can't be locked
+    """
+    _target = target(layer)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        items = install_report(
+            requirements=write_requirements(
+                path=Path(tmp_dir) / 'requirements.txt',
+                packages=layer.packages,
+                silent=True
+            ),
+            wheelhouse=wheelhouse,
+            no_deps=not layer.deps,
+            options=_target.pip_options() if _target else [],
+            silent=silent
+        )
+    return LockedLayer(
+        name=label(layer),
+        digest=digest(layer),
+        distributions=tuple(sorted(
+            (_distribution(item) for item in items),
+            key=lambda distribution: distribution.name
+        ))
+    )
+
+
+def lock(
+        layers: Iterable[LayerConfig],
+        wheelhouse: Optional[Path] = None,
+        jobs: Optional[int] = None
+) -> List[LockedLayer]:
+    """
+    Resolve several layers' requirements at once.
+
+    :param layers: the layer configurations (for single targets)
+    :param wheelhouse: the path to a wheelhouse to resolve from (instead of
+        the package index)
+    :param jobs: the maximum number of layers to resolve at once
+    :return: the locked layers, in the same order as the layers
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(
+            lambda layer: resolve(layer, wheelhouse=wheelhouse, silent=True),
+            layers
+        ))
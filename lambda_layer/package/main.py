@@ -10,28 +10,68 @@ Create AWS lambda layer packages.
 """
 from pathlib import Path
 import platform
-from typing import Union
+from typing import Optional, Union
+import click
 from lambda_layer.config import LayerConfig
-from . import bash
+from . import bash, targets, trace
+from .cache import BuildCache
+from .sinks import LocalSink, Sink, TeeSink
 
 
 def make(
         dist_dir: Union[str, Path],
         layer: LayerConfig,
-        silent: bool = False
-) -> Path:
+        silent: bool = False,
+        cache: bool = True,
+        wheelhouse: Union[str, Path, None] = None,
+        sink: Optional[Sink] = None
+) -> str:
     """
     Make a layer.
 
     :param dist_dir: the path to the distribution directory
     :param layer: the layer configuration
     :param silent: ``True`` to suppress normal output
+    :param cache: ``True`` to reuse (and update) the build cache
+    :param wheelhouse: the path to a wheelhouse to install from (instead of
+        the package index)
+    :param sink: where the archive goes (defaults to the distribution
+        directory)
+    :return: where the archive went
     """
     if platform.system() == 'Windows':
         raise NotImplementedError("Windows isn't supported just yet.")
 
+    _sink = sink if sink else LocalSink(dist_dir)
+    name = targets.archive_name(layer)
+    _wheelhouse = (
+        Path(wheelhouse).expanduser().resolve() if wheelhouse else None
+    )
+
+    # If we're using the cache...
+    _cache = BuildCache() if cache else None
+    if _cache:
+        # ...see if we've built this layer before.  (Unless the layer is
+        # locked, that means what its requirements resolve to right now.)
+        key = _cache.key(
+            layer,
+            resolved=bash.resolved_distributions(
+                layer, wheelhouse=_wheelhouse, silent=silent
+            )
+        )
+        with trace.span('restore'):
+            restored = _cache.restore(key, _sink, name)
+        if restored:
+            if not silent:
+                click.echo(f"Restored {restored} from the cache ({key[:12]})")
+            return restored
+
     return bash.make(
         dist_dir=dist_dir,
         layer=layer,
-        silent=silent
+        silent=silent,
+        wheelhouse=_wheelhouse,
+        # Keep a copy of the archive in the cache (for next time) as it's
+        # written.
+        sink=TeeSink(_sink, _cache.sink(key, layer)) if _cache else _sink
     )
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Build several layers at once.
+
+.. currentmodule:: lambda_layer.package.parallel
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import os
+from pathlib import Path
+import time
+import traceback
+from typing import (
+    Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+)
+import click
+from ..config import LayerConfig
+from .cache import BuildCache
+from . import targets, trace
+from .main import make
+from .trace import Span
+from .wheelhouse import built, fill, rehash
+
+
+class LayerResult(NamedTuple):
+    """The result of building a single layer."""
+
+    name: str  #: the name of the layer
+    version: str  #: the layer version
+    archive: Optional[str]  #: the path to the archive (if it was created)
+    elapsed: float  #: the number of seconds the build took
+    output: str  #: the output captured while the layer was built
+    error: Optional[str] = None  #: a description of the failure (if any)
+    spans: Tuple[Span, ...] = ()  #: what the build spent its time on
+
+    @property
+    def ok(self) -> bool:
+        """``True`` if the layer was built successfully."""
+        return self.error is None
+
+
+def build(
+        dist_dir: str,
+        layer: LayerConfig,
+        silent: bool = False,
+        capture: bool = True,
+        **options
+) -> LayerResult:
+    """
+    Build a single layer, capturing its output.
+
+    :param dist_dir: the path to the distribution directory
+    :param layer: the layer configuration
+    :param silent: ``True`` to suppress normal output
+    :param capture: ``True`` to capture output in a buffer instead of
+        writing it straight through
+    :param options: any other options for :py:func:`make`
+    """
+    buffer = io.StringIO()
+    archive = None
+    error = None
+    start = time.perf_counter()
+    # Start a fresh set of spans for this layer.
+    trace.collect()
+
+    def _make():
+        if not silent:
+            click.echo(f"name:    {layer.name}")
+            click.echo(f"version: {layer.version}")
+            if layer.platforms or layer.pythons:
+                click.echo(f"target:  {targets.suffix(layer)}")
+        return make(dist_dir=dist_dir, layer=layer, silent=silent, **options)
+
+    try:
+        # If we're capturing, everything the build writes goes to this
+        # layer's own buffer (so it won't get mixed up with other layers).
+        if capture:
+            with redirect_stdout(buffer), redirect_stderr(buffer):
+                archive = _make()
+        else:
+            archive = _make()
+    except SystemExit as sex:
+        # A failed subprocess exits with its own return code.
+        error = f"exited with code {sex.code}"
+    except Exception as ex:  # pylint: disable=broad-except
+        error = f"{type(ex).__name__}: {ex}"
+        buffer.write(traceback.format_exc())
+    return LayerResult(
+        name=targets.label(layer),
+        version=layer.version,
+        archive=str(archive) if archive else None,
+        elapsed=time.perf_counter() - start,
+        output=buffer.getvalue(),
+        error=error,
+        spans=trace.collect()
+    )
+
+
+def echo_output(result: LayerResult):
+    """
+    Write a layer's captured output, tagging each line with the layer name.
+
+    :param result: the layer result
+    """
+    fg = None if result.ok else 'red'
+    for line in result.output.splitlines():
+        click.echo(click.style(f"[{result.name}] {line}", fg=fg))
+
+
+def prepare(
+        layers: Iterable[LayerConfig],
+        jobs: int,
+        silent: bool,
+        wheelhouse: Union[str, Path, None],
+        offline: bool,
+        options: Dict[str, Any]
+) -> List[LayerConfig]:
+    """
+    Get everything ready to build several layers.
+
+    :param layers: the layer configurations
+    :param jobs: the number of wheels to download at once
+    :param silent: ``True`` to suppress normal output
+    :param wheelhouse: the path to a shared wheelhouse the layers are
+        installed from
+    :param offline: ``True`` to use the wheelhouse as it is
+    :param options: the options for :py:func:`make` (which pick up the
+        wheelhouse)
+    :return: the layers to build (one for each target)
+    """
+    # Each of a layer's targets is built on its own (so they can all be
+    # built at once).
+    _layers = [
+        _layer for layer in layers for _layer in targets.expand(layer)
+    ]
+    # If there's a wheelhouse, fill it (once) with everything the layers are
+    # going to need before we start building any of them.
+    if wheelhouse:
+        options['wheelhouse'] = str(wheelhouse)
+        if not offline:
+            # (Only a locked layer's key can be worked out without resolving
+            # it, so the others always go to the wheelhouse.)
+            _cache = BuildCache() if options.get('cache', True) else None
+            wheels = built(wheelhouse)
+            fill(
+                wheelhouse=wheelhouse,
+                layers=[
+                    layer for layer in _layers
+                    if not (
+                        _cache
+                        and _cache.get(_cache.key(rehash(layer, wheels)))
+                    )
+                ],
+                jobs=jobs,
+                silent=silent
+            )
+        # A locked layer's source distributions are installed from the
+        # wheels we built, so their hashes have to be allowed, too.
+        wheels = built(wheelhouse)
+        _layers = [rehash(layer, wheels) for layer in _layers]
+    return _layers
+
+
+def _gather(
+        pool: Executor,
+        dist_dir: str,
+        layers: List[LayerConfig],
+        silent: bool,
+        options: Dict[str, Any]
+) -> List[LayerResult]:
+    """
+    Build layers in a pool.
+
+    :param pool: the pool
+    :param dist_dir: the path to the distribution directory
+    :param layers: the layer configurations (for single targets)
+    :param silent: ``True`` to suppress normal output
+    :param options: any other options for :py:func:`make`
+    :return: the results, in the same order as the layers
+    """
+    results = {}
+    futures = {
+        pool.submit(build, dist_dir, layer, silent, True, **options): idx
+        for idx, layer in enumerate(layers)
+    }
+    # Report each layer's output as soon as the layer is finished.
+    for future in as_completed(futures):
+        result = future.result()
+        echo_output(result)
+        results[futures[future]] = result
+    return [results[idx] for idx in range(len(layers))]
+
+
+def make_all(
+        dist_dir: Union[str, Path],
+        layers: Iterable[LayerConfig],
+        jobs: Optional[int] = None,
+        silent: bool = False,
+        wheelhouse: Union[str, Path, None] = None,
+        offline: bool = False,
+        pool: Optional[Executor] = None,
+        **options
+) -> List[LayerResult]:
+    """
+    Make several layers, building up to ``jobs`` of them at once.
+
+    :param dist_dir: the path to the distribution directory
+    :param layers: the layer configurations
+    :param jobs: the maximum number of layers to build at once (defaults to
+        the number of CPUs)
+    :param silent: ``True`` to suppress normal output
+    :param wheelhouse: the path to a shared wheelhouse the layers are
+        installed from
+    :param offline: ``True`` to use the wheelhouse as it is (without
+        downloading anything into it first)
+    :param pool: the process pool to build the layers in (which is left
+        running afterward), instead of one of their own
+    :param options: any other options for :py:func:`make`
+    :return: the results, in the same order as the layers
+    """
+    _jobs = max(1, jobs if jobs else (os.cpu_count() or 1))
+    _layers = prepare(
+        layers,
+        jobs=_jobs,
+        silent=silent,
+        wheelhouse=wheelhouse,
+        offline=offline,
+        options=options
+    )
+    # If we're only doing one thing at a time, there's no need for a pool
+    # (and the output can go straight through as it happens).
+    if _jobs == 1 or len(_layers) < 2:
+        return [
+            build(
+                str(dist_dir), layer, silent=silent, capture=False, **options
+            )
+            for layer in _layers
+        ]
+    if pool is None:
+        with ProcessPoolExecutor(
+                max_workers=min(_jobs, len(_layers))
+        ) as _pool:
+            return _gather(_pool, str(dist_dir), _layers, silent, options)
+    return _gather(pool, str(dist_dir), _layers, silent, options)
+
+
+def summary(results: Iterable[LayerResult]) -> str:
+    """
+    Create a summary table of layer results.
+
+    :param results: the layer results
+    :return: the table
+    """
+    headers = ('layer', 'version', 'status', 'seconds', 'archive')
+    rows = [
+        (
+            result.name,
+            result.version,
+            'ok' if result.ok else f"failed ({result.error})",
+            f"{result.elapsed:.1f}",
+            result.archive or ''
+        )
+        for result in results
+    ]
+    widths = [
+        max(len(row[col]) for row in [headers, *rows])
+        for col in range(len(headers))
+    ]
+    lines = [
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in [headers, tuple('-' * width for width in widths), *rows]
+    ]
+    return '\n'.join(line.rstrip() for line in lines)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Remove files a layer doesn't need before it's archived.
+
+.. currentmodule:: lambda_layer.package.prune
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from functools import lru_cache
+import os
+from pathlib import Path
+import re
+from typing import Iterable, List, NamedTuple, Optional, Pattern
+from ..config import PruneConfig
+
+#: the files of the packaging tools a virtual environment comes with, by
+#: distribution (which are removed, along with the defaults, unless the
+#: layer's requirements resolve to the tool)
+PACKAGING_TOOLS = {
+    'pip': ('pip/**', 'pip-*.dist-info/**'),
+    'setuptools': (
+        'setuptools/**',
+        'setuptools-*.dist-info/**',
+        'pkg_resources/**',
+        '_distutils_hack/**',
+        'distutils-precedence.pth',
+        'easy_install.py'
+    ),
+    'wheel': ('wheel/**', 'wheel-*.dist-info/**')
+}
+#: files that are removed unless the layer's rules say otherwise
+DEFAULT_EXCLUDE = (
+    # Test suites inside packages (a top-level `tests` package is a
+    # distribution's own), type stubs and documentation.
+    '*/**/tests/**',
+    '**/*.pyi',
+    'share/doc/**',
+    'share/man/**',
+    # Installation records nothing reads at runtime.
+    '*.dist-info/RECORD',
+    '*.dist-info/INSTALLER',
+    '*.dist-info/REQUESTED',
+    '*.dist-info/direct_url.json',
+)
+
+
+class PruneResult(NamedTuple):
+    """What was removed from a layer."""
+
+    files: int  #: the number of files removed
+    size: int  #: the number of bytes removed
+
+
+@lru_cache(maxsize=None)
+def compile_glob(glob: str) -> Pattern:
+    """
+    Compile a glob pattern.
+
+    ``*`` and ``?`` don't match across directories; ``**`` does.
+
+    :param glob: the glob pattern
+    :return: the regular expression
+    """
+    regex = ''
+    idx = 0
+    while idx < len(glob):
+        if glob.startswith('**/', idx):
+            regex += '(?:.*/)?'
+            idx += 3
+        elif glob.startswith('**', idx):
+            regex += '.*'
+            idx += 2
+        elif glob[idx] == '*':
+            regex += '[^/]*'
+            idx += 1
+        elif glob[idx] == '?':
+            regex += '[^/]'
+            idx += 1
+        else:
+            regex += re.escape(glob[idx])
+            idx += 1
+    return re.compile(f"{regex}$")
+
+
+def matches(path: str, globs: Iterable[str]) -> bool:
+    """
+    See if a path matches any of a set of glob patterns.
+
+    :param path: the path (relative to the layer, with ``/`` separators)
+    :param globs: the glob patterns
+    :return: ``True`` if the path matches
+    """
+    return any(compile_glob(glob).match(path) for glob in globs)
+
+
+def _stale_bytecode(path: str, cache_tag: Optional[str]) -> bool:
+    """
+    See if a file is bytecode compiled for some other interpreter.
+
+    :param path: the path (relative to the layer)
+    :param cache_tag: the cache tag of the interpreter the layer is for
+    """
+    if cache_tag is None or not path.endswith('.pyc'):
+        return False
+    return '/__pycache__/' in f"/{path}" and f".{cache_tag}." not in path
+
+
+def prunable(
+        root: Path,
+        config: PruneConfig,
+        cache_tag: Optional[str] = None,
+        keep: Iterable[str] = ()
+) -> List[Path]:
+    """
+    List the files in a layer that the rules say should be removed.
+
+    :param root: the layer's root directory
+    :param config: the prune rules
+    :param cache_tag: the cache tag of the interpreter the layer is for (so
+        bytecode for other interpreters can be removed)
+    :param keep: the distributions the layer's requirements resolve to, by
+        normalized name (so the packaging tools among them are kept)
+    :return: the paths of the files to remove
+    """
+    _keep = set(keep)
+    exclude = (
+        (
+            *DEFAULT_EXCLUDE,
+            *(
+                glob for tool, globs in PACKAGING_TOOLS.items()
+                if tool not in _keep
+                for glob in globs
+            ),
+            *config.exclude
+        ) if config.defaults
+        else config.exclude
+    )
+    paths = []
+    for dirpath, _, files in os.walk(str(root)):
+        for file in files:
+            path = Path(dirpath) / file
+            relpath = path.relative_to(root).as_posix()
+            if matches(relpath, config.include):
+                continue
+            stale = config.defaults and _stale_bytecode(relpath, cache_tag)
+            if stale or matches(relpath, exclude):
+                paths.append(path)
+    return paths
+
+
+def prune(
+        root: Path,
+        config: PruneConfig,
+        cache_tag: Optional[str] = None,
+        keep: Iterable[str] = ()
+) -> PruneResult:
+    """
+    Remove the files a layer doesn't need.
+
+    :param root: the layer's root directory
+    :param config: the prune rules
+    :param cache_tag: the cache tag of the interpreter the layer is for (so
+        bytecode for other interpreters can be removed)
+    :param keep: the distributions the layer's requirements resolve to, by
+        normalized name (so the packaging tools among them are kept)
+    :return: what was removed
+    """
+    files = 0
+    size = 0
+    for path in prunable(root, config, cache_tag=cache_tag, keep=keep):
+        size += path.lstat().st_size
+        path.unlink()
+        files += 1
+    # Clean up any directories we've emptied.
+    for dirpath, _, _ in sorted(
+            os.walk(str(root)), key=lambda walked: walked[0], reverse=True
+    ):
+        if dirpath != str(root) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return PruneResult(files=files, size=size)
@@ -0,0 +1,666 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Build layers for other ``lambda-layer`` processes (on the same machine) from
+a long-running server, so they share its workers and caches.
+
+The server speaks HTTP over a Unix socket.  ``POST /build`` takes a layer
+(for a single target) and answers when it's built, and ``GET /status`` says
+what the server is up to.  Each job carries the client's ``PIP_*`` and
+``LAMBDA_LAYER_*`` environment variables, and the layer is built with them.
+Jobs for a layer that's already being built the same way (the same build
+cache key and environment) wait for that build instead of starting another
+one.
+
+.. currentmodule:: lambda_layer.package.server
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from concurrent.futures import (
+    Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+)
+from contextlib import contextmanager
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import socket
+from socketserver import ThreadingMixIn, UnixStreamServer
+import threading
+import time
+from typing import (
+    Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple,
+    Union
+)
+import click
+from .. import env
+from ..__init__ import __version__
+from ..config import LayerConfig
+from .cache import BuildCache
+from .common import interpreter
+from .incremental import sha256
+from .parallel import LayerResult, build, echo_output, prepare
+from .sinks import Sink
+from .targets import archive_name, label
+from .trace import Span
+
+#: the name of the socket (in the build cache directory)
+_SOCKET = 'server.sock'
+_KEY = re.compile(r'^[0-9a-f]{64}$')  #: a build cache key
+#: the seconds a built archive is kept for clients to copy
+_KEEP = 60 * 60
+#: the prefixes of the environment variables that change how layers are built
+_ENVIRONMENT = ('PIP_', 'LAMBDA_LAYER_')
+#: a build job (the layer's build cache key, whether the build cache is used,
+#: the wheelhouse, and the environment variables)
+_Job = Tuple[str, bool, Optional[str], Tuple[Tuple[str, str], ...]]
+
+
+def path() -> Path:
+    """
+    Get the path to the server's socket.
+
+    :return: the path (``server.sock`` in the build cache directory, unless
+        ``LAMBDA_LAYER_SERVER`` says otherwise)
+    """
+    _path = env.get(env.Vars.LAMBDA_LAYER_SERVER)
+    return (
+        Path(_path) if _path
+        else Path(env.get(env.Vars.LAMBDA_LAYER_CACHE_DIR)) / _SOCKET
+    ).expanduser().resolve()
+
+
+class JobResult(NamedTuple):
+    """The result of a build job."""
+
+    name: str  #: the name of the layer (and its target)
+    version: str  #: the layer version
+    key: str  #: the layer's build cache key
+    archive: Optional[str]  #: the path to the archive (if it was created)
+    sha256: Optional[str]  #: the SHA-256 digest of the archive
+    size: int  #: the size of the archive (in bytes)
+    queued: float  #: the seconds the job waited for a worker
+    elapsed: float  #: the seconds the build took
+    shared: bool  #: ``True`` if it waited for a build that was running
+    output: str  #: the output captured while the layer was built
+    error: Optional[str] = None  #: a description of the failure (if any)
+    spans: Tuple[Span, ...] = ()  #: what the build spent its time on
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the result as a mapping of simple types."""
+        return {
+            **self._asdict(),
+            'spans': [_span.to_dict() for _span in self.spans]
+        }
+
+    @classmethod
+    def load(cls, data: Mapping[str, Any]) -> 'JobResult':
+        """
+        Load a result from a mapping of simple types.
+
+        :param data: the mapping
+        :return: the result
+        """
+        return cls(**{
+            **data,
+            'spans': tuple(Span(**_span) for _span in data.get('spans', []))
+        })
+
+
+def environment() -> Dict[str, str]:
+    """
+    Get the environment variables that change how this process builds layers
+    (which a server has to build them with instead of its own).
+
+    :return: the ``PIP_*`` and ``LAMBDA_LAYER_*`` environment variables
+    """
+    return {
+        name: value for name, value in os.environ.items()
+        if name.startswith(_ENVIRONMENT)
+    }
+
+
+@contextmanager
+def _environ(variables: Mapping[str, str]) -> Iterator[None]:
+    """
+    Use a client's ``PIP_*`` and ``LAMBDA_LAYER_*`` environment variables
+    (instead of the server's) while the block runs.
+
+    :param variables: the client's environment variables
+    """
+    saved = dict(os.environ)
+    for name in environment():
+        del os.environ[name]
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def _job(
+        dist_dir: str,
+        layer: LayerConfig,
+        cwd: str,
+        variables: Mapping[str, str],
+        submitted: float,
+        silent: bool,
+        **options
+) -> Tuple[float, LayerResult, Optional[str], int]:
+    """
+    Build a layer (in one of the server's workers).
+
+    :param dist_dir: the path to the distribution directory
+    :param layer: the layer configuration
+    :param cwd: the client's working directory (which relative paths in the
+        layer's packages are relative to)
+    :param variables: the client's ``PIP_*`` and ``LAMBDA_LAYER_*``
+        environment variables
+    :param submitted: when the job was submitted (seconds since the epoch)
+    :param silent: ``True`` to suppress normal output
+    :param options: any other options for :py:func:`make`
+    :return: the seconds the job waited, the result, and the archive's
+        digest and size
+    """
+    queued = time.time() - submitted
+    os.chdir(cwd)
+    with _environ(variables):
+        result = build(
+            dist_dir, layer, silent=silent, capture=True, **options
+        )
+    if not result.archive:
+        return queued, result, None, 0
+    archive = Path(result.archive)
+    return queued, result, sha256(archive), archive.stat().st_size
+
+
+def _directory(job: _Job) -> str:
+    """
+    Get the name of the directory a job's archive is built in.
+
+    :param job: the job
+    :return: the name (which is different for every way a layer is built)
+    """
+    return hashlib.sha256(json.dumps(job).encode('utf-8')).hexdigest()
+
+
+class BuildServer(ThreadingMixIn, UnixStreamServer):
+    """Builds layers for clients that connect to its socket."""
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            socket_path: Union[str, Path],
+            dist_dir: Union[str, Path],
+            jobs: Optional[int] = None,
+            pool: Optional[Executor] = None
+    ):
+        """
+        Create a new instance.
+
+        :param socket_path: the path to the socket
+        :param dist_dir: the directory the archives are built in (each in a
+            directory of its own for each way it's built)
+        :param jobs: the most layers to build at once (defaults to the
+            number of CPUs)
+        :param pool: the pool to build the layers in (defaults to a process
+            pool of its own)
+        """
+        self.socket_path = Path(socket_path).expanduser().resolve()
+        self.dist_dir = Path(dist_dir).expanduser().resolve()
+        self.jobs = max(1, jobs if jobs else (os.cpu_count() or 1))
+        self.pool = pool if pool else ProcessPoolExecutor(
+            max_workers=self.jobs
+        )
+        self._lock = threading.Lock()
+        self._running: Dict[_Job, Future] = {}
+        self._counts = {'built': 0, 'shared': 0}
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # If another server left its socket behind, it's no good to anyone.
+        if self.socket_path.exists():
+            if Client(self.socket_path).available():
+                raise FileExistsError(
+                    f"A server is already listening on {self.socket_path}."
+                )
+            self.socket_path.unlink()
+        super().__init__(str(self.socket_path), _Handler)
+        # Only the user who started the server may use it.
+        os.chmod(str(self.socket_path), 0o600)
+
+    def build(
+            self,
+            layer: LayerConfig,
+            key: str,
+            cwd: str,
+            cache: bool = True,
+            wheelhouse: Optional[str] = None,
+            variables: Optional[Mapping[str, str]] = None,
+            silent: bool = False
+    ) -> JobResult:
+        """
+        Build a layer (or wait for the same build that's already running).
+
+        :param layer: the layer configuration (for a single target)
+        :param key: the layer's build cache key
+        :param cwd: the client's working directory
+        :param cache: ``True`` to reuse (and update) the build cache
+        :param wheelhouse: the path to a wheelhouse to install from
+        :param variables: the client's ``PIP_*`` and ``LAMBDA_LAYER_*``
+            environment variables (any others are ignored)
+        :param silent: ``True`` to suppress normal output
+        :return: the result
+        :raises ValueError: if the key isn't a build cache key
+        """
+        # (The key goes into a directory name, so it had better be a digest.)
+        if not _KEY.match(key):
+            raise ValueError(f"{key} isn't a build cache key.")
+        # (Builds are only shared when they'd be built the same way.)
+        _variables = tuple(sorted(
+            (name, value) for name, value in (variables or {}).items()
+            if name.startswith(_ENVIRONMENT)
+        ))
+        job: _Job = (key, cache, wheelhouse, _variables)
+        with self._lock:
+            future = self._running.get(job)
+            shared = future is not None
+            if not shared:
+                future = self.pool.submit(
+                    _job,
+                    str(self.dist_dir / _directory(job)),
+                    layer,
+                    cwd,
+                    dict(_variables),
+                    time.time(),
+                    silent,
+                    cache=cache,
+                    wheelhouse=wheelhouse
+                )
+                self._running[job] = future
+            self._counts['shared' if shared else 'built'] += 1
+        if not shared:
+            future.add_done_callback(
+                lambda done: self._done(job, done)
+            )
+            self._sweep()
+        queued, result, digest, size = future.result()
+        return JobResult(
+            name=result.name,
+            version=result.version,
+            key=key,
+            archive=result.archive,
+            sha256=digest,
+            size=size,
+            queued=queued,
+            elapsed=result.elapsed,
+            shared=shared,
+            output=result.output,
+            error=result.error,
+            spans=result.spans
+        )
+
+    def _done(self, job: _Job, future: Future):
+        """Forget a job once it's finished."""
+        with self._lock:
+            if self._running.get(job) is future:
+                del self._running[job]
+
+    def _sweep(self):
+        """Remove the archives that clients have had time to copy."""
+        if not self.dist_dir.is_dir():
+            return
+        with self._lock:
+            running = {_directory(job) for job in self._running}
+        for entry in self.dist_dir.iterdir():
+            try:
+                if (
+                        entry.name not in running
+                        and entry.stat().st_mtime < time.time() - _KEEP
+                ):
+                    shutil.rmtree(str(entry))
+            except OSError:
+                pass  # It's already gone (or it's on its way).
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Say what the server is up to.
+
+        :return: the status
+        """
+        with self._lock:
+            return {
+                'version': __version__,
+                'interpreter': ' '.join(interpreter()),
+                'jobs': self.jobs,
+                'running': len(self._running),
+                **self._counts
+            }
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+        try:
+            self.socket_path.unlink()
+        except OSError:
+            pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handles requests to the build server."""
+
+    server: BuildServer
+
+    def _reply(self, status: int, data: Mapping[str, Any]):
+        """Send a JSON response."""
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path != '/status':
+            self._reply(404, {'error': f"There's nothing at {self.path}."})
+            return
+        self._reply(200, self.server.status())
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        if self.path != '/build':
+            self._reply(404, {'error': f"There's nothing at {self.path}."})
+            return
+        try:
+            job = json.loads(
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            )
+            layer = LayerConfig.load(job['layer'])
+            key, cwd = job['key'], job['cwd']
+            variables = {
+                str(name): str(value)
+                for name, value in dict(job.get('environment') or {}).items()
+            }
+        except (ValueError, KeyError, TypeError) as ex:
+            self._reply(400, {'error': f"{type(ex).__name__}: {ex}"})
+            return
+        try:
+            result = self.server.build(
+                layer=layer,
+                key=key,
+                cwd=cwd,
+                cache=job.get('cache', True),
+                wheelhouse=job.get('wheelhouse'),
+                variables=variables,
+                silent=job.get('silent', False)
+            )
+        except ValueError as ex:
+            self._reply(400, {'error': str(ex)})
+            return
+        except Exception as ex:  # pylint: disable=broad-except
+            self._reply(500, {'error': f"{type(ex).__name__}: {ex}"})
+            return
+        status = (
+            'shared' if result.shared else 'failed' if result.error else 'ok'
+        )
+        click.echo(
+            f"{result.name}-{result.version}  {result.key[:12]}  {status}  "
+            f"{result.elapsed:.1f}s (queued {result.queued:.1f}s)"
+        )
+        self._reply(200, result.to_dict())
+
+    def address_string(self) -> str:
+        # (Unix sockets don't have an address worth showing.)
+        return str(self.server.socket_path)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass  # We report each job ourselves.
+
+
+class _Connection(HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path: Path, timeout: Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(str(self._socket_path))
+
+
+class Client(object):
+    """Sends build jobs to a build server."""
+
+    def __init__(self, socket_path: Union[str, Path, None] = None):
+        """
+        Create a new instance.
+
+        :param socket_path: the path to the server's socket (defaults to
+            :py:func:`path`)
+        """
+        self.socket_path: Path = (
+            Path(socket_path).expanduser().resolve() if socket_path
+            else path()
+        )
+
+    def _request(
+            self,
+            method: str,
+            url: str,
+            data: Optional[Mapping[str, Any]] = None,
+            timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Send a request to the server.
+
+        :param method: the HTTP method
+        :param url: the path
+        :param data: the JSON body (if there is one)
+        :param timeout: the seconds to wait for the server (or ``None`` to
+            wait as long as it takes)
+        :return: the JSON response
+        :raises RuntimeError: if the server couldn't do what was asked
+        """
+        connection = _Connection(self.socket_path, timeout=timeout)
+        try:
+            connection.request(
+                method,
+                url,
+                body=json.dumps(data) if data is not None else None,
+                headers={'Content-Type': 'application/json'}
+            )
+            response = connection.getresponse()
+            body = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(body.get('error', f"HTTP {response.status}"))
+        return body
+
+    def available(self) -> bool:
+        """
+        Is there a server listening?
+
+        :return: ``True`` if there is
+        """
+        if not self.socket_path.exists():
+            return False
+        try:
+            self.status()
+        except (OSError, ValueError, RuntimeError):
+            return False
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Find out what the server is up to.
+
+        :return: the status
+        """
+        return self._request('GET', '/status', timeout=5)
+
+    def problem(self) -> Optional[str]:
+        """
+        Find out why the server can't build layers for this process.  (Its
+        builds have to come out the same as the ones we'd do ourselves.)
+
+        :return: what's wrong, or ``None`` if the server's ready
+        """
+        try:
+            status = self.status()
+        except (OSError, ValueError, RuntimeError) as ex:
+            return f"The server isn't answering ({ex})."
+        if status.get('version') != __version__:
+            return (
+                f"The server is version {status.get('version')}, but this "
+                f"is version {__version__}."
+            )
+        _interpreter = ' '.join(interpreter())
+        if status.get('interpreter') != _interpreter:
+            return (
+                f"The server builds with {status.get('interpreter')}, but "
+                f"this process builds with {_interpreter}."
+            )
+        return None
+
+    def build(
+            self,
+            layer: LayerConfig,
+            cache: bool = True,
+            wheelhouse: Optional[str] = None,
+            silent: bool = False
+    ) -> JobResult:
+        """
+        Have the server build a layer.
+
+        :param layer: the layer configuration (for a single target)
+        :param cache: ``True`` to reuse (and update) the build cache
+        :param wheelhouse: the path to a wheelhouse to install from
+        :param silent: ``True`` to suppress normal output
+        :return: the result (once the layer is built)
+        """
+        return JobResult.load(self._request('POST', '/build', {
+            'layer': layer.to_dict(),
+            # (The key is worked out here, where any requirements files the
+            # layer refers to are relative to.)
+            'key': BuildCache.key(layer),
+            'cwd': os.getcwd(),
+            'cache': cache,
+            'wheelhouse': str(Path(wheelhouse).expanduser().resolve())
+            if wheelhouse else None,
+            # (The layer is built the way it would be built here.)
+            'environment': environment(),
+            'silent': silent
+        }))
+
+
+def make_all(
+        client: Client,
+        layers: Iterable[LayerConfig],
+        sink: Sink,
+        jobs: Optional[int] = None,
+        silent: bool = False,
+        cache: bool = True,
+        wheelhouse: Union[str, Path, None] = None,
+        offline: bool = False
+) -> List[LayerResult]:
+    """
+    Make several layers on a build server.
+
+    :param client: the client for the server
+    :param layers: the layer configurations
+    :param sink: where the archives go
+    :param jobs: the number of wheels to download at once (the server
+        decides how many layers it builds at once)
+    :param silent: ``True`` to suppress normal output
+    :param cache: ``True`` to reuse (and update) the build cache
+    :param wheelhouse: the path to a shared wheelhouse the layers are
+        installed from
+    :param offline: ``True`` to use the wheelhouse as it is
+    :return: the results, in the same order as the layers
+    """
+    options: Dict[str, Any] = {'cache': cache}
+    _layers = prepare(
+        layers,
+        jobs=max(1, jobs if jobs else (os.cpu_count() or 1)),
+        silent=silent,
+        wheelhouse=wheelhouse,
+        offline=offline,
+        options=options
+    )
+    results = {}
+    # The server queues the jobs, so they're all sent at once.
+    with ThreadPoolExecutor(max_workers=max(1, len(_layers))) as pool:
+        futures = {
+            pool.submit(
+                client.build,
+                layer,
+                cache=cache,
+                wheelhouse=options.get('wheelhouse'),
+                silent=silent
+            ): idx
+            for idx, layer in enumerate(_layers)
+        }
+        for future in as_completed(futures):
+            layer = _layers[futures[future]]
+            result = _result(layer, future, sink, silent)
+            echo_output(result)
+            results[futures[future]] = result
+    return [results[idx] for idx in range(len(_layers))]
+
+
+def _result(
+        layer: LayerConfig,
+        future: Future,
+        sink: Sink,
+        silent: bool
+) -> LayerResult:
+    """
+    Copy the archive a server built to where it's going.
+
+    :param layer: the layer configuration
+    :param future: the job
+    :param sink: where the archive goes
+    :param silent: ``True`` to suppress normal output
+    :return: the result
+    """
+    try:
+        job: JobResult = future.result()
+    except (OSError, ValueError, RuntimeError) as ex:
+        return LayerResult(
+            name=label(layer),
+            version=layer.version,
+            archive=None,
+            elapsed=0,
+            output='',
+            error=f"{type(ex).__name__}: {ex}"
+        )
+    output = job.output
+    archive = None
+    if job.archive:
+        with sink.open(archive_name(layer)) as writer:
+            with open(job.archive, 'rb') as fb:
+                shutil.copyfileobj(fb, writer, 1024 * 1024)
+        archive = writer.location
+        if not silent:
+            shared = ' (for another job, too)' if job.shared else ''
+            output = (
+                f"{output}Built by the server{shared} in {job.elapsed:.1f}s "
+                f"after {job.queued:.1f}s in the queue: {job.sha256[:12]} "
+                f"({job.size / 1024 / 1024:.1f} MB)\n"
+            )
+    return LayerResult(
+        name=job.name,
+        version=job.version,
+        archive=archive,
+        elapsed=job.queued + job.elapsed,
+        output=output,
+        error=job.error,
+        spans=job.spans
+    )
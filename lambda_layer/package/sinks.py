@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Write layer archives straight to wherever they're going.
+
+.. currentmodule:: lambda_layer.package.sinks
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, BinaryIO, Deque, Dict, List, Optional, Union
+import click
+from .. import env
+from .archive import published_sha256, sidecar
+
+#: the smallest part of a multipart upload S3 accepts (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+#: the default size of each part of a multipart upload
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+_MAX_PENDING = 2  #: the most parts being uploaded at once
+
+
+class SinkWriter(object):
+    """
+    Writes one archive to a sink.
+
+    ``zipfile`` can write to it like a file that can't seek.  Use it as a
+    context manager: if the block finishes, the archive is committed;
+    otherwise, it's thrown away.
+    """
+
+    def __init__(self, location: str):
+        """
+        Create a new instance.
+
+        :param location: where the archive ends up
+        """
+        self.location = location  #: where the archive ends up
+        #: ``True`` if the archive was changed by committing it, ``False`` if
+        #: an identical archive was already there (``None`` until it's
+        #: committed)
+        self.changed: Optional[bool] = None
+        self._digest = hashlib.sha256()
+        self._size = 0
+
+    @property
+    def sha256(self) -> str:
+        """Get the SHA-256 digest of what's been written so far."""
+        return self._digest.hexdigest()
+
+    def write(self, data: bytes) -> int:
+        """
+        Write to the archive.
+
+        :param data: the data
+        :return: the number of bytes written
+        """
+        self._digest.update(data)
+        self._size += len(data)
+        self._write(data)
+        return len(data)
+
+    def tell(self) -> int:
+        """Get the number of bytes written so far."""
+        return self._size
+
+    def flush(self):
+        """Flush the archive (which most sinks don't need to do)."""
+
+    def _write(self, data: bytes):
+        """
+        Write data to the sink.
+
+        :param data: the data
+        """
+        raise NotImplementedError
+
+    def commit(self) -> bool:
+        """
+        Finish the archive and put it in place.
+
+        :return: ``True`` if the archive changed, ``False`` if an identical
+            archive was already there
+        """
+        raise NotImplementedError
+
+    def abort(self):
+        """Throw away the archive."""
+
+    def __enter__(self) -> 'SinkWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.changed = self.commit()
+        else:
+            self.abort()
+
+
+class Sink(object):
+    """Somewhere layer archives go."""
+
+    def open(self, name: str) -> SinkWriter:
+        """
+        Start writing an archive.
+
+        :param name: the archive's file name
+        :return: the writer
+        """
+        raise NotImplementedError
+
+
+class _LocalWriter(SinkWriter):
+    """Writes an archive to a temporary file and renames it into place."""
+
+    def __init__(self, path: Path):
+        super().__init__(location=str(path))
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The temporary file is in the same directory so it can be renamed
+        # into place all-at-once.
+        fd, tmp = tempfile.mkstemp(
+            prefix=f".{path.name}.", suffix='.tmp', dir=str(path.parent)
+        )
+        self._tmp = Path(tmp)
+        self._fb = os.fdopen(fd, 'wb')
+
+    def _write(self, data: bytes):
+        self._fb.write(data)
+
+    def commit(self) -> bool:
+        self._fb.close()
+        # If the very same archive is already there, leave it alone.
+        digest = self.sha256
+        if published_sha256(self.path) == digest:
+            self._tmp.unlink()
+            return False
+        os.chmod(str(self._tmp), 0o644)
+        os.replace(str(self._tmp), str(self.path))
+        # The sidecar is written after the archive so it's at least as new.
+        _sidecar = sidecar(self.path)
+        tmp = _sidecar.with_name(f".{_sidecar.name}.{os.getpid()}")
+        tmp.write_text(f"{digest}  {self.path.name}\n")
+        os.replace(str(tmp), str(_sidecar))
+        return True
+
+    def abort(self):
+        self._fb.close()
+        if self._tmp.exists():
+            self._tmp.unlink()
+
+
+class LocalSink(Sink):
+    """Writes archives to a local directory (like the distribution
+    directory)."""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Create a new instance.
+
+        :param path: the directory
+        """
+        self.path = Path(path).expanduser().resolve()  #: the directory
+
+    def open(self, name: str) -> SinkWriter:
+        return _LocalWriter(self.path / name)
+
+
+class _StreamWriter(SinkWriter):
+    """Writes an archive to a stream."""
+
+    def __init__(self, stream: BinaryIO, location: str):
+        super().__init__(location=location)
+        self._stream = stream
+
+    def _write(self, data: bytes):
+        self._stream.write(data)
+
+    def flush(self):
+        self._stream.flush()
+
+    def commit(self) -> bool:
+        self._stream.flush()
+        return True
+
+    def abort(self):
+        # What's been written can't be taken back, but we can at least make
+        # sure whoever's reading sees where it stops.
+        self._stream.flush()
+
+
+class StreamSink(Sink):
+    """Writes archives to a stream (like standard output)."""
+
+    def __init__(self, stream: BinaryIO, location: str = '<stdout>'):
+        """
+        Create a new instance.
+
+        :param stream: the (binary) stream
+        :param location: what to call the stream in messages
+        """
+        self.stream = stream  #: the stream
+        self.location = location  #: what to call the stream
+
+    def open(self, name: str) -> SinkWriter:
+        return _StreamWriter(self.stream, self.location)
+
+
+def _error_code(error: Exception) -> Optional[str]:
+    """Get the error code from an S3 client error (if it has one)."""
+    response: Dict[str, Any] = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
+
+
+class _S3Writer(SinkWriter):
+    """Uploads an archive in parts while it's being written."""
+
+    def __init__(self, sink: 'S3Sink', key: str):
+        super().__init__(location=f"s3://{sink.bucket}/{key}")
+        self._sink = sink
+        self._key = key
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Future] = []
+        self._pending: Deque[Future] = deque()
+        self._pool = ThreadPoolExecutor(max_workers=_MAX_PENDING)
+
+    def _upload(self, body: bytes):
+        """
+        Upload the next part.
+
+        :param body: the part's contents
+        """
+        client = self._sink.client
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(
+                Bucket=self._sink.bucket, Key=self._key
+            )['UploadId']
+        number = len(self._parts) + 1
+
+        def _part() -> Dict[str, Any]:
+            response = client.upload_part(
+                Bucket=self._sink.bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                PartNumber=number,
+                Body=body
+            )
+            return {'ETag': response['ETag'], 'PartNumber': number}
+
+        # The parts go up on other threads while we keep compressing, but
+        # only a couple at a time (so we don't hold the whole layer in
+        # memory when the network is slower than we are).
+        if len(self._pending) >= _MAX_PENDING:
+            self._pending.popleft().result()
+        future = self._pool.submit(_part)
+        self._parts.append(future)
+        self._pending.append(future)
+
+    def _write(self, data: bytes):
+        self._buffer.extend(data)
+        part_size = self._sink.part_size
+        while len(self._buffer) >= part_size:
+            self._upload(bytes(self._buffer[:part_size]))
+            del self._buffer[:part_size]
+
+    def _published(self) -> Optional[str]:
+        """Get the SHA-256 digest of the archive that's already there."""
+        try:
+            response = self._sink.client.get_object(
+                Bucket=self._sink.bucket, Key=f"{self._key}.sha256"
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            if _error_code(error) in ('NoSuchKey', '404'):
+                return None
+            raise
+        return response['Body'].read().decode('utf-8').split()[0]
+
+    def commit(self) -> bool:
+        client = self._sink.client
+        digest = self.sha256
+        if self._published() == digest:
+            self.abort()
+            return False
+        try:
+            if self._upload_id is None:
+                # It was small enough to go up in one piece.
+                client.put_object(
+                    Bucket=self._sink.bucket,
+                    Key=self._key,
+                    Body=bytes(self._buffer)
+                )
+            else:
+                if self._buffer:
+                    self._upload(bytes(self._buffer))
+                client.complete_multipart_upload(
+                    Bucket=self._sink.bucket,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={
+                        'Parts': [part.result() for part in self._parts]
+                    }
+                )
+        except BaseException:
+            self.abort()
+            raise
+        self._pool.shutdown()
+        client.put_object(
+            Bucket=self._sink.bucket,
+            Key=f"{self._key}.sha256",
+            Body=f"{digest}  {self._key.split('/')[-1]}\n".encode('utf-8')
+        )
+        return True
+
+    def abort(self):
+        # Let the parts that are already on their way finish (or fail)
+        # before we call the whole thing off.
+        self._pool.shutdown()
+        if self._upload_id is not None:
+            self._sink.client.abort_multipart_upload(
+                Bucket=self._sink.bucket,
+                Key=self._key,
+                UploadId=self._upload_id
+            )
+            self._upload_id = None
+
+
+class S3Sink(Sink):
+    """Uploads archives to an S3 (or S3-compatible) bucket."""
+
+    def __init__(
+            self,
+            bucket: str,
+            prefix: str = '',
+            client: Any = None,
+            part_size: int = DEFAULT_PART_SIZE
+    ):
+        """
+        Create a new instance.
+
+        :param bucket: the bucket
+        :param prefix: the prefix for the archives' keys
+        :param client: the S3 client (defaults to a ``boto3`` client for
+            ``LAMBDA_LAYER_S3_ENDPOINT_URL``, or AWS itself)
+        :param part_size: the size of each part of the upload (in bytes)
+        """
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(
+                f"The part size must be at least {MIN_PART_SIZE} bytes."
+            )
+        self.bucket = bucket  #: the bucket
+        self.prefix = prefix.strip('/')  #: the prefix for the archives' keys
+        self.part_size = part_size  #: the size of each part of the upload
+        self._client = client
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Clients don't travel between processes, so each process makes its
+        # own.
+        return {**self.__dict__, '_client': None}
+
+    @property
+    def client(self) -> Any:
+        """Get the S3 client."""
+        if self._client is None:
+            try:
+                import boto3  # pylint: disable=import-outside-toplevel
+            except ImportError as error:
+                raise ImportError(
+                    "Uploading layers to S3 requires boto3.  "
+                    "(pip install lambda-layer[s3])"
+                ) from error
+            self._client = boto3.client(
+                's3',
+                endpoint_url=env.get(env.Vars.LAMBDA_LAYER_S3_ENDPOINT_URL)
+            )
+        return self._client
+
+    def open(self, name: str) -> SinkWriter:
+        return _S3Writer(
+            self, f"{self.prefix}/{name}" if self.prefix else name
+        )
+
+
+class TeeSink(Sink):
+    """Writes archives to several sinks at once."""
+
+    def __init__(self, sink: Sink, *others: Sink):
+        """
+        Create a new instance.
+
+        :param sink: the sink that matters (where archives are reported to
+            have gone)
+        :param others: the other sinks (like the build cache)
+        """
+        self.sinks = (sink, *others)  #: the sinks
+
+    def open(self, name: str) -> SinkWriter:
+        return _TeeWriter([sink.open(name) for sink in self.sinks])
+
+
+class _TeeWriter(SinkWriter):
+    """Writes an archive to several sinks at once."""
+
+    def __init__(self, writers: List[SinkWriter]):
+        super().__init__(location=writers[0].location)
+        self._writers = writers
+
+    def _write(self, data: bytes):
+        for writer in self._writers:
+            writer.write(data)
+
+    def flush(self):
+        for writer in self._writers:
+            writer.flush()
+
+    def commit(self) -> bool:
+        try:
+            for writer in self._writers[1:]:
+                writer.commit()
+        except BaseException:
+            self._writers[0].abort()
+            raise
+        return self._writers[0].commit()
+
+    def abort(self):
+        for writer in self._writers:
+            writer.abort()
+
+
+def sink(output: Union[str, Path]) -> Sink:
+    """
+    Get the sink for an output location.
+
+    :param output: ``-`` for standard output, an ``s3://bucket/prefix`` URL,
+        or a local directory
+    :return: the sink
+    """
+    _output = str(output)
+    if _output == '-':
+        return StreamSink(click.get_binary_stream('stdout'))
+    if _output.startswith('s3://'):
+        bucket, _, prefix = _output[len('s3://'):].partition('/')
+        return S3Sink(bucket=bucket, prefix=prefix)
+    return LocalSink(_output)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Break a layer's size down by the distributions that make it up.
+
+.. currentmodule:: lambda_layer.package.size
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import defaultdict
+import csv
+import io
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+import zipfile
+import zlib
+from .archive import DEFAULT_LEVEL
+from .compression import DEFAULT, Policy
+
+_SAMPLE_SIZE = 64 * 1024  #: the most we compress from any one file
+_SAMPLE_BUDGET = 1024 * 1024  #: the most we compress for one distribution
+
+#: the metadata files that tell us who owns what
+_METADATA = ('.dist-info/RECORD', '.dist-info/top_level.txt')
+
+
+class PackageSize(NamedTuple):
+    """The size of one distribution within a layer."""
+
+    name: str  #: the name of the distribution
+    files: int  #: the number of files
+    size: int  #: the uncompressed size (in bytes)
+    compressed: int  #: the (estimated) compressed size (in bytes)
+
+
+class SizeReport(NamedTuple):
+    """A layer's size, broken down by distribution."""
+
+    packages: Tuple[PackageSize, ...]  #: the distributions, largest first
+
+    @property
+    def files(self) -> int:
+        """Get the total number of files."""
+        return sum(package.files for package in self.packages)
+
+    @property
+    def size(self) -> int:
+        """Get the total uncompressed size (in bytes)."""
+        return sum(package.size for package in self.packages)
+
+    @property
+    def compressed(self) -> int:
+        """Get the total (estimated) compressed size (in bytes)."""
+        return sum(package.compressed for package in self.packages)
+
+
+class SizeLimitError(ValueError):
+    """Raised when a layer is bigger than its size limit."""
+
+    def __init__(self, report: SizeReport, limit: int):
+        """
+        Create a new instance.
+
+        :param report: the layer's size report
+        :param limit: the limit (in bytes)
+        """
+        super().__init__(
+            f"The layer is {report.size / 1024 / 1024:.1f} MB unzipped, "
+            f"which is over its {limit / 1024 / 1024:.1f} MB limit."
+        )
+        self.report = report  #: the layer's size report
+        self.limit = limit  #: the limit (in bytes)
+
+
+def _dist_name(dist_info: str) -> str:
+    """
+    Get a distribution's name from its ``.dist-info`` directory name.
+
+    :param dist_info: the directory name (e.g. ``requests-2.22.0.dist-info``)
+    :return: the distribution name (e.g. ``requests``)
+    """
+    return dist_info.split('-')[0]
+
+
+def _source(relpath: str) -> str:
+    """
+    Get the path of the source file a bytecode file was compiled from (or
+    just the path, if it isn't bytecode).
+
+    :param relpath: the path (relative to the layer)
+    :return: the source path
+    """
+    if not relpath.endswith('.pyc'):
+        return relpath
+    parts = relpath.split('/')
+    if len(parts) > 1 and parts[-2] == '__pycache__':
+        # `pkg/__pycache__/mod.cpython-38.pyc` comes from `pkg/mod.py`
+        return '/'.join([
+            *parts[:-2], f"{parts[-1].split('.')[0]}.py"
+        ])
+    return f"{relpath[:-1]}"
+
+
+class Owners(object):
+    """Figures out which distribution owns each file in a layer."""
+
+    def __init__(
+            self,
+            records: Mapping[str, str],
+            top_levels: Mapping[str, str]
+    ):
+        """
+        Create a new instance.
+
+        :param records: the distributions that own each file (from the
+            ``RECORD`` files), by the file's path
+        :param top_levels: the distributions that own each top-level package
+            or module (from the ``top_level.txt`` files)
+        """
+        self.records = records
+        self.top_levels = top_levels
+
+    @classmethod
+    def load(cls, files: Mapping[str, str]) -> 'Owners':
+        """
+        Figure out who owns what from a layer's metadata files.
+
+        :param files: the contents of the ``RECORD`` and ``top_level.txt``
+            files, by their paths (relative to the layer)
+        :return: the owners
+        """
+        records = {}
+        top_levels = {}
+        for relpath, text in files.items():
+            dist_info, name = relpath.split('/')[-2:]
+            dist = _dist_name(dist_info)
+            if name == 'RECORD':
+                for row in csv.reader(io.StringIO(text)):
+                    if row and not row[0].startswith('..'):
+                        records[row[0]] = dist
+            elif name == 'top_level.txt':
+                for top_level in text.split():
+                    top_levels[top_level] = dist
+        return cls(records=records, top_levels=top_levels)
+
+    @classmethod
+    def read(cls, root: Path) -> 'Owners':
+        """
+        Figure out who owns what in an installed layer.
+
+        :param root: the layer's root directory
+        :return: the owners
+        """
+        return cls.load({
+            path.relative_to(root).as_posix(): path.read_text()
+            for name in _METADATA
+            for path in root.glob(f"*{name}")
+        })
+
+    def owner(self, relpath: str) -> str:
+        """
+        Get the distribution that owns a file.
+
+        :param relpath: the path (relative to the layer)
+        :return: the name of the distribution
+        """
+        for candidate in (relpath, _source(relpath)):
+            if candidate in self.records:
+                return self.records[candidate]
+        top = relpath.split('/')[0]
+        if top.endswith('.dist-info'):
+            return _dist_name(top)
+        # `pkg/...` and `pkg.py` both belong to the `pkg` top-level.
+        top = top[:-3] if top.endswith('.py') else top
+        return self.top_levels.get(top, top)
+
+
+def _ratio(paths: Iterable[Path], level: int = DEFAULT_LEVEL) -> float:
+    """
+    Estimate how well a set of files compresses by compressing samples from
+    them.
+
+    :param paths: the paths to the files
+    :param level: the compression level
+    :return: the estimated ratio of compressed to uncompressed size
+    """
+    sampled = 0
+    compressed = 0
+    for path in paths:
+        with open(str(path), 'rb') as fb:
+            sample = fb.read(_SAMPLE_SIZE)
+        sampled += len(sample)
+        compressed += len(zlib.compress(sample, level))
+        if sampled >= _SAMPLE_BUDGET:
+            break
+    return compressed / sampled if sampled else 1.0
+
+
+def _sorted(totals: Mapping[str, List[int]]) -> SizeReport:
+    """
+    Put together a report from the totals for each distribution.
+
+    :param totals: the number of files, uncompressed size and compressed
+        size, by distribution
+    :return: the report, largest distributions first
+    """
+    return SizeReport(packages=tuple(sorted(
+        (
+            PackageSize(name, files, size, compressed)
+            for name, (files, size, compressed) in totals.items()
+        ),
+        key=lambda package: (-package.size, package.name)
+    )))
+
+
+def tally(
+        sizes: Iterable[Tuple[str, int, int]]
+) -> SizeReport:
+    """
+    Total up file sizes by distribution.
+
+    :param sizes: the owner, uncompressed size and compressed size of each
+        file
+    :return: the report
+    """
+    totals: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for owner, size, compressed in sizes:
+        total = totals[owner]
+        total[0] += 1
+        total[1] += size
+        total[2] += compressed
+    return _sorted(totals)
+
+
+def analyze(
+        root: Path,
+        owners: Optional[Owners] = None,
+        level: int = DEFAULT_LEVEL,
+        policy: Optional[Policy] = None
+) -> SizeReport:
+    """
+    Break down the size of an installed layer.
+
+    The compressed sizes are estimates.  They come from samples of each
+    distribution's files, not from the archive itself.
+
+    :param root: the layer's root directory
+    :param owners: who owns what (if it was worked out earlier, say before
+        the ``RECORD`` files were pruned)
+    :param level: the compression level the layer will be archived with
+    :param policy: decides how each file will be compressed (if the layer
+        has compression rules)
+    :return: the report
+    """
+    _owners = owners if owners else Owners.read(root)
+    # The files are grouped by who owns them, and how they'll be compressed.
+    files: Dict[Tuple[str, int], List[Tuple[Path, int]]] = defaultdict(list)
+    for dirpath, _, names in os.walk(str(root)):
+        for name in names:
+            path = Path(dirpath) / name
+            relpath = path.relative_to(root).as_posix()
+            _level = policy.level_for(
+                policy.rule(relpath) or DEFAULT
+            ) if policy else level
+            files[(_owners.owner(relpath), _level)].append(
+                (path, path.stat().st_size)
+            )
+
+    def _sizes():
+        # We don't compress everything (that's what archiving is for), just
+        # enough of each distribution to see how well it compresses.  (Files
+        # that will be stored, at level 0, are as big as they are.)
+        for (owner, _level), _files in files.items():
+            ratio = _ratio(
+                (path for path, _ in _files), level=_level
+            ) if _level else 1.0
+            for _, size in _files:
+                yield owner, size, int(size * ratio)
+
+    return tally(_sizes())
+
+
+def analyze_archive(archive: Path, prefix: str = 'python') -> SizeReport:
+    """
+    Break down the size of a layer archive.
+
+    :param archive: the path to the archive
+    :param prefix: the directory the layer's files are in within the archive
+    :return: the report
+    """
+    with zipfile.ZipFile(str(archive)) as _zip:
+        infos = [
+            (info.filename[len(prefix) + 1:], info)
+            for info in _zip.infolist()
+            if info.filename.startswith(f"{prefix}/") and not info.is_dir()
+        ]
+        owners = Owners.load({
+            relpath: _zip.read(info).decode('utf-8')
+            for relpath, info in infos
+            if relpath.endswith(_METADATA)
+        })
+    return tally(
+        (owners.owner(relpath), info.file_size, info.compress_size)
+        for relpath, info in infos
+    )
+
+
+def merge(*reports: SizeReport) -> SizeReport:
+    """
+    Combine the size reports for different parts of a layer.
+
+    :param reports: the reports
+    :return: the combined report
+    """
+    totals: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for report in reports:
+        for package in report.packages:
+            total = totals[package.name]
+            total[0] += package.files
+            total[1] += package.size
+            total[2] += package.compressed
+    return _sorted(totals)
+
+
+def check(report: SizeReport, limit: Optional[int]):
+    """
+    Make sure a layer isn't too big.
+
+    :param report: the layer's size report
+    :param limit: the largest the layer may be unzipped (in bytes), or
+        ``None`` for no limit
+    :raises SizeLimitError: if the layer is too big
+    """
+    if limit and report.size > limit:
+        raise SizeLimitError(report, limit)
+
+
+def table(report: SizeReport, limit: Optional[int] = None) -> str:
+    """
+    Format a size report as a table.
+
+    :param report: the report
+    :param limit: the layer's size limit (in bytes)
+    :return: the table
+    """
+    def _mb(size: int) -> str:
+        return f"{size / 1024 / 1024:.2f}"
+
+    total = report.size or 1
+    headers = ('package', 'files', 'MB', 'zipped MB', '%')
+    rows = [
+        (
+            package.name,
+            str(package.files),
+            _mb(package.size),
+            _mb(package.compressed),
+            f"{100 * package.size / total:.1f}"
+        )
+        for package in report.packages
+    ]
+    rows.append((
+        'total',
+        str(report.files),
+        _mb(report.size),
+        _mb(report.compressed),
+        '100.0'
+    ))
+    if limit:
+        rows.append(('limit', '', _mb(limit), '', ''))
+    widths = [
+        max(len(row[col]) for row in [headers, *rows])
+        for col in range(len(headers))
+    ]
+    return '\n'.join(
+        '  '.join(
+            cell.ljust(width) if col == 0 else cell.rjust(width)
+            for col, (cell, width) in enumerate(zip(row, widths))
+        ).rstrip()
+        for row in [headers, tuple('-' * width for width in widths), *rows]
+    )
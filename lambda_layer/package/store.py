@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Keep every installed distribution once, and put layers together from hard
+links to it.
+
+Nothing a build does afterward changes a file in place (pruning removes
+files, and stripping and compiling write new ones), so the links can't
+change what's in the store.  When the store grows past its limit, the
+least-recently used distributions are removed.  (Builds hold a shared lock
+on the store from the time they look for a distribution until it's linked,
+and removing distributions takes an exclusive one, so a build never links
+half of a distribution that's being removed.)
+
+.. currentmodule:: lambda_layer.package.store
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from contextlib import contextmanager
+import fcntl
+import os
+from pathlib import Path
+import re
+import shutil
+import tempfile
+import time
+from typing import (
+    Any, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Union
+)
+from urllib.parse import unquote, urlparse
+from .. import env
+from .incremental import normalize
+
+#: a wheel's file name (``name-version[-build]-python-abi-platform.whl``)
+_WHEEL = re.compile(
+    r'^[^-]+-[^-]+(-\d[^-]*)?-(?P<tag>[^-]+-[^-]+-[^-]+)\.whl$'
+)
+#: the seconds after which a staging directory is assumed to be abandoned
+_STALE = 60 * 60
+#: the name of the file builds lock to share the store
+_LOCK = '.lock'
+
+
+class Distribution(NamedTuple):
+    """A distribution (as it's kept in the store)."""
+
+    name: str  #: the normalized name
+    version: str  #: the version
+    tag: str  #: the wheel's tags (or what a source distribution is built for)
+    sha256: str  #: the SHA-256 digest of the wheel (or source distribution)
+    url: str  #: where it's downloaded from
+
+    @property
+    def key(self) -> str:
+        """Get the name of the distribution's entry in the store."""
+        return f"{self.name}-{self.version}-{self.tag}-{self.sha256[:16]}"
+
+    @property
+    def filename(self) -> str:
+        """Get the file name of the wheel (or source distribution)."""
+        return unquote(urlparse(self.url).path).rsplit('/', 1)[-1]
+
+    @classmethod
+    def from_report(
+            cls,
+            item: Mapping[str, Any],
+            built_for: str
+    ) -> Optional['Distribution']:
+        """
+        Get a distribution from its entry in ``pip``'s installation report.
+
+        :param item: the entry
+        :param built_for: what a source distribution would be built for
+            (like ``cpython-312-x86_64``)
+        :return: the distribution, or ``None`` if it doesn't come from an
+            archive with a SHA-256 digest (like a local directory)
+        """
+        download_info = item.get('download_info', {})
+        archive_info = download_info.get('archive_info', {})
+        sha256 = archive_info.get('hashes', {}).get('sha256')
+        # Older versions of pip only report a single hash (as `name=value`).
+        if not sha256 and archive_info.get('hash', '').startswith('sha256='):
+            sha256 = archive_info['hash'][len('sha256='):]
+        if not sha256:
+            return None
+        url = download_info['url']
+        match = _WHEEL.match(unquote(urlparse(url).path).rsplit('/', 1)[-1])
+        return cls(
+            name=normalize(item['metadata']['name']),
+            version=item['metadata']['version'],
+            tag=match.group('tag') if match else built_for,
+            sha256=sha256,
+            url=url
+        )
+
+
+class LinkReport(NamedTuple):
+    """How a layer was put together from the store."""
+
+    files: int  #: the number of files in the layer
+    copied: int  #: the files that had to be copied (instead of linked)
+
+
+class PackageStore(object):
+    """Keeps installed distributions (each in a directory of its own)."""
+
+    def __init__(
+            self,
+            path: Union[str, Path, None] = None,
+            max_size: Optional[int] = None
+    ):
+        """
+        Create a new instance.
+
+        :param path: the directory (defaults to ``packages`` in the build
+            cache directory)
+        :param max_size: the maximum size of the store in bytes (defaults to
+            ``LAMBDA_LAYER_STORE_SIZE`` megabytes)
+        """
+        self.path: Path = (
+            Path(path) if path
+            else Path(env.get(env.Vars.LAMBDA_LAYER_CACHE_DIR)) / 'packages'
+        ).expanduser().resolve()
+        self.max_size: int = (
+            max_size if max_size is not None
+            else int(env.get(env.Vars.LAMBDA_LAYER_STORE_SIZE)) * 1024 * 1024
+        )
+
+    @contextmanager
+    def lock(
+            self,
+            exclusive: bool = False,
+            wait: bool = True
+    ) -> Iterator[None]:
+        """
+        Lock the store while the block runs.
+
+        :param exclusive: ``True`` to keep everybody else out (to remove
+            distributions), or ``False`` to share the store with other
+            builds
+        :param wait: ``False`` to give up (instead of waiting) if somebody
+            else has the store
+        :raises BlockingIOError: if we don't wait, and somebody else has the
+            store
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(str(self.path / _LOCK), 'a') as lock_file:
+            operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            fcntl.flock(
+                lock_file.fileno(),
+                operation if wait else operation | fcntl.LOCK_NB
+            )
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def missing(
+            self,
+            distributions: Iterable[Distribution]
+    ) -> List[Distribution]:
+        """
+        Figure out which distributions aren't in the store yet.
+
+        :param distributions: the distributions
+        :return: the ones that have to be installed
+        """
+        return [
+            distribution for distribution in distributions
+            if not (self.path / distribution.key).is_dir()
+        ]
+
+    def staging(self, distribution: Distribution) -> Path:
+        """
+        Create a temporary directory to install a distribution into (before
+        it's added to the store).
+
+        :param distribution: the distribution
+        :return: the directory
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        return Path(tempfile.mkdtemp(
+            prefix=f".{distribution.key}.", dir=str(self.path)
+        ))
+
+    def add(self, distribution: Distribution, tree: Path) -> Path:
+        """
+        Add an installed distribution to the store.
+
+        :param distribution: the distribution
+        :param tree: the directory it was installed into (from
+            :py:meth:`staging`), which is moved into the store
+        :return: the distribution's entry
+        """
+        entry = self.path / distribution.key
+        try:
+            os.rename(str(tree), str(entry))
+        except OSError:
+            # Another build got there first.  (It's the same distribution, so
+            # theirs is just as good.)
+            if not entry.is_dir():
+                raise
+            shutil.rmtree(str(tree), ignore_errors=True)
+        return entry
+
+    def link(
+            self,
+            distributions: Iterable[Distribution],
+            root: Path
+    ) -> LinkReport:
+        """
+        Put a layer together from hard links to distributions in the store.
+
+        :param distributions: the distributions (which must be in the store,
+            and stay there, so hold the :py:meth:`lock` from the time you
+            look for them)
+        :param root: the layer's root directory
+        :return: what was done
+        """
+        files = 0
+        copied = 0
+        for distribution in distributions:
+            entry = self.path / distribution.key
+            # Keep track of when each entry was last used.
+            os.utime(str(entry))
+            for dirpath, _, names in os.walk(str(entry)):
+                target = root / Path(dirpath).relative_to(entry)
+                target.mkdir(parents=True, exist_ok=True)
+                for name in names:
+                    src = os.path.join(dirpath, name)
+                    dst = target / name
+                    # (If two distributions have the same file, the last one
+                    # wins.)
+                    if dst.exists():
+                        dst.unlink()
+                    try:
+                        os.link(src, str(dst))
+                    except OSError:
+                        # The store is on another file system (or it doesn't
+                        # do hard links).
+                        shutil.copy2(src, str(dst))
+                        copied += 1
+                    files += 1
+        return LinkReport(files=files, copied=copied)
+
+    def prune(self, max_size: Optional[int] = None, wait: bool = True) -> int:
+        """
+        Remove the least-recently used distributions until the store fits.
+
+        :param max_size: the maximum size of the store in bytes (defaults to
+            the store's own limit)
+        :param wait: ``False`` to leave the store alone (instead of waiting)
+            if other builds are using it
+        :return: the number of distributions removed
+        """
+        if not self.path.is_dir():
+            return 0
+        try:
+            with self.lock(exclusive=True, wait=wait):
+                return self._prune(
+                    self.max_size if max_size is None else max_size
+                )
+        except BlockingIOError:
+            return 0  # One of the builds that has it will try again.
+
+    def _prune(self, max_size: int) -> int:
+        """
+        Remove the least-recently used distributions until the store fits.
+        (The store must be locked exclusively.)
+
+        :param max_size: the maximum size of the store in bytes
+        :return: the number of distributions removed
+        """
+        entries = []
+        stale = time.time() - _STALE
+        for entry in self.path.iterdir():
+            try:
+                stat = entry.stat()
+                # Staging directories start with a '.' (and the old ones
+                # were left behind by builds that didn't finish).
+                if entry.name.startswith('.'):
+                    if entry.name != _LOCK and stat.st_mtime < stale:
+                        shutil.rmtree(str(entry), ignore_errors=True)
+                    continue
+                size = sum(
+                    os.stat(os.path.join(dirpath, name)).st_size
+                    for dirpath, _, names in os.walk(str(entry))
+                    for name in names
+                )
+            except OSError:
+                continue  # Somebody else just removed it.
+            entries.append((stat.st_mtime, size, entry))
+        # The most-recently used distributions are the ones we keep.
+        entries.sort(reverse=True)
+        total = 0
+        removed = 0
+        for _, size, entry in entries:
+            total += size
+            if total > max_size:
+                # It's moved out of the way first, so nobody finds half of it.
+                trash = self.path / f".{entry.name}.removed"
+                try:
+                    os.rename(str(entry), str(trash))
+                except OSError:
+                    continue
+                shutil.rmtree(str(trash), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def clear(self) -> int:
+        """
+        Remove everything from the store.
+
+        :return: the number of distributions removed
+        """
+        if not self.path.is_dir():
+            return 0
+        with self.lock(exclusive=True):
+            entries = [
+                entry for entry in self.path.iterdir()
+                if entry.is_dir() and not entry.name.startswith('.')
+            ]
+            # (The lock file stays, since other builds may be waiting on
+            # it.)
+            for entry in self.path.iterdir():
+                if entry.name != _LOCK:
+                    shutil.rmtree(str(entry), ignore_errors=True)
+        return len(entries)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Stream the output of external processes as it arrives.
+
+.. currentmodule:: lambda_layer.package.stream
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from queue import Queue
+from subprocess import PIPE, Popen
+from threading import Thread
+from typing import (
+    BinaryIO, Callable, Deque, Dict, Iterable, NamedTuple, Optional, Tuple
+)
+from .common import ProcOutput
+
+STDOUT = 'stdout'  #: the name of the standard output stream
+STDERR = 'stderr'  #: the name of the standard error stream
+
+_MAX_LINE = 64 * 1024  #: the longest line we read at once (in bytes)
+_QUEUE_SIZE = 1024  #: the most lines waiting to be forwarded
+
+#: runs processes in place of :py:func:`run` (if it's set for the current
+#: context)
+runner: ContextVar[Optional[Callable[..., Tuple[int, ProcOutput]]]] = (
+    ContextVar('runner', default=None)
+)
+
+
+class Line(NamedTuple):
+    """A line of output from an external process."""
+
+    stream: str  #: the stream it came from (``stdout`` or ``stderr``)
+    text: str  #: the text (without the line ending)
+    time: datetime  #: when it arrived
+
+
+def _read(pipe: BinaryIO, stream: str, queue: Queue):
+    """
+    Read lines from a pipe until it's closed, putting them on a queue.
+
+    :param pipe: the pipe
+    :param stream: the name of the stream
+    :param queue: the queue
+    """
+    with pipe:
+        # Really long "lines" come through in pieces so no single line can
+        # take up more than its share of memory.
+        for data in iter(lambda: pipe.readline(_MAX_LINE), b''):
+            queue.put(_line(data, stream))
+    # Let the reader know this stream is finished.
+    queue.put(None)
+
+
+def lines(proc: Popen) -> Iterable[Line]:
+    """
+    Get the lines a process writes to standard output and standard error,
+    as they arrive.
+
+    :param proc: the process (with both streams piped)
+    :return: the lines, in the order they arrived
+    """
+    # The queue is bounded, so a chatty process just has to wait for us.
+    queue = Queue(maxsize=_QUEUE_SIZE)
+    readers = [
+        Thread(target=_read, args=(pipe, stream, queue), daemon=True)
+        for pipe, stream in ((proc.stdout, STDOUT), (proc.stderr, STDERR))
+    ]
+    for reader in readers:
+        reader.start()
+    finished = 0
+    while finished < len(readers):
+        line = queue.get()
+        if line is None:
+            finished += 1
+        else:
+            yield line
+    for reader in readers:
+        reader.join()
+
+
+def _line(data: bytes, stream: str) -> Line:
+    """
+    Decode a line of output.
+
+    :param data: the raw line
+    :param stream: the name of the stream it came from
+    :return: the line
+    """
+    return Line(
+        stream=stream,
+        text=data.decode('utf-8', errors='replace').rstrip('\r\n'),
+        time=datetime.now()
+    )
+
+
+async def _read_async(
+        reader: asyncio.StreamReader,
+        stream: str,
+        forward: Callable[[Line], None]
+):
+    """
+    Read lines from a stream until it's closed, forwarding each of them.
+
+    :param reader: the stream reader
+    :param stream: the name of the stream
+    :param forward: called with each line as it arrives
+    """
+    while True:
+        try:
+            data = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as ire:
+            # This is the last line (and it doesn't have a line ending).
+            data = ire.partial
+        except asyncio.LimitOverrunError as loe:
+            # Really long "lines" come through in pieces (just like they do
+            # when we're reading on threads).
+            data = await reader.read(min(loe.consumed, _MAX_LINE))
+        if not data:
+            return
+        forward(_line(data, stream))
+
+
+def format_line(line: Line, stage: Optional[str] = None) -> str:
+    """
+    Format a line of output for display.
+
+    :param line: the line
+    :param stage: the build stage the process belongs to
+    :return: the formatted line
+    """
+    label = f" {stage} |" if stage else ''
+    return f"{line.time:%H:%M:%S}{label} {line.text}"
+
+
+def run(
+        cmd: Iterable[str],
+        forward: Callable[[Line], None],
+        tail: int = 100,
+        **kwargs
+) -> Tuple[int, ProcOutput]:
+    """
+    Run a process, forwarding its output line by line.
+
+    Only the last few lines of each stream are kept.
+
+    :param cmd: the command
+    :param forward: called with each line as it arrives
+    :param tail: the number of lines to keep from each stream
+    :param kwargs: any other arguments for :py:class:`subprocess.Popen`
+    :return: the process's return code, and the last lines it wrote
+    """
+    # If something else is running processes for us (like an event loop),
+    # let it.
+    _runner = runner.get()
+    if _runner is not None:
+        return _runner(cmd, forward, tail=tail, **kwargs)
+    kept: Dict[str, Deque[str]] = {
+        STDOUT: deque(maxlen=tail),
+        STDERR: deque(maxlen=tail)
+    }
+    proc = Popen(list(cmd), stdout=PIPE, stderr=PIPE, **kwargs)
+    try:
+        for line in lines(proc):
+            kept[line.stream].append(line.text)
+            forward(line)
+    except BaseException:
+        # If we stop reading, the process can't finish writing.
+        proc.kill()
+        raise
+    finally:
+        returncode = proc.wait()
+    return returncode, ProcOutput(
+        stdout='\n'.join(kept[STDOUT]),
+        stderr='\n'.join(kept[STDERR])
+    )
+
+
+async def run_async(
+        cmd: Iterable[str],
+        forward: Callable[[Line], None],
+        tail: int = 100,
+        shell: bool = False,
+        **kwargs
+) -> Tuple[int, ProcOutput]:
+    """
+    Run a process on the event loop, forwarding its output line by line.
+
+    Only the last few lines of each stream are kept.
+
+    :param cmd: the command
+    :param forward: called (on the event loop) with each line as it arrives
+    :param tail: the number of lines to keep from each stream
+    :param shell: ``True`` to run the command in a shell
+    :param kwargs: any other arguments for :py:class:`subprocess.Popen`
+    :return: the process's return code, and the last lines it wrote
+    """
+    kept: Dict[str, Deque[str]] = {
+        STDOUT: deque(maxlen=tail),
+        STDERR: deque(maxlen=tail)
+    }
+
+    def _forward(line: Line):
+        kept[line.stream].append(line.text)
+        forward(line)
+
+    _cmd = list(cmd)
+    if shell:
+        proc = await asyncio.create_subprocess_shell(
+            ' '.join(_cmd), stdout=PIPE, stderr=PIPE, limit=_MAX_LINE,
+            **kwargs
+        )
+    else:
+        proc = await asyncio.create_subprocess_exec(
+            *_cmd, stdout=PIPE, stderr=PIPE, limit=_MAX_LINE, **kwargs
+        )
+    try:
+        await asyncio.gather(
+            _read_async(proc.stdout, STDOUT, _forward),
+            _read_async(proc.stderr, STDERR, _forward)
+        )
+    except BaseException:
+        # If we stop reading (or get cancelled), the process can't finish
+        # writing.
+        proc.kill()
+        raise
+    finally:
+        returncode = await proc.wait()
+    return returncode, ProcOutput(
+        stdout='\n'.join(kept[STDOUT]),
+        stderr='\n'.join(kept[STDERR])
+    )
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Strip debug symbols from the native extensions in a layer.
+
+.. currentmodule:: lambda_layer.package.strip
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import shutil
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from .. import env
+from . import stream
+
+_ELF_MAGIC = b'\x7fELF'  #: the first bytes of every ELF file
+
+#: the script that makes sure a shared object still loads
+_LOAD = "import ctypes, sys; ctypes.CDLL(sys.argv[1])"
+
+
+class StripResult(NamedTuple):
+    """The result of stripping a shared object."""
+
+    path: Path  #: the path to the shared object
+    before: int  #: its size (in bytes) before it was stripped
+    after: int  #: its size after it was stripped
+    error: Optional[str] = None  #: why it was left alone (if it was)
+
+    @property
+    def saved(self) -> int:
+        """Get the number of bytes saved."""
+        return self.before - self.after
+
+
+def shared_objects(root: Path) -> List[Path]:
+    """
+    Find the ELF shared objects in a layer.
+
+    :param root: the layer's root directory
+    :return: the paths to the shared objects
+    """
+    paths = []
+    for dirpath, _, files in os.walk(str(root)):
+        for file in files:
+            path = Path(dirpath) / file
+            if '.so' not in path.name or path.is_symlink():
+                continue
+            with open(str(path), 'rb') as fb:
+                if fb.read(len(_ELF_MAGIC)) == _ELF_MAGIC:
+                    paths.append(path)
+    return paths
+
+
+def _loads(path: Path) -> bool:
+    """
+    See if a shared object can be loaded (in a separate process).
+
+    :param path: the path to the shared object
+    :return: ``True`` if it loads
+    """
+    # (This goes through the stream module so that, in an event loop, it
+    # waits its turn like every other process.)
+    returncode, _ = stream.run(
+        ['python', '-c', _LOAD, str(path)], forward=lambda _: None
+    )
+    return returncode == 0
+
+
+def _strip(path: Path, tool: str) -> StripResult:
+    """
+    Strip the debug symbols from a shared object, keeping the original if the
+    stripped copy won't load.
+
+    :param path: the path to the shared object
+    :param tool: the ``strip`` executable
+    :return: the result
+    """
+    before = path.stat().st_size
+    # The stripped copy goes right next to the original so it finds the same
+    # libraries (through `$ORIGIN`) when we try to load it.
+    stripped = path.with_name(f".{path.name}.stripped")
+    try:
+        returncode, output = stream.run(
+            [tool, '--strip-debug', '-o', str(stripped), str(path)],
+            forward=lambda _: None
+        )
+        if returncode != 0:
+            return StripResult(path, before, before, output.stderr.strip())
+        if stripped.stat().st_size >= before:
+            return StripResult(path, before, before, 'nothing to strip')
+        # If the stripped copy won't load, but the original does, we keep the
+        # original.  (If neither loads on this machine, we can't tell, so we
+        # play it safe then too.)
+        if not _loads(stripped):
+            return StripResult(
+                path, before, before, "the stripped copy won't load"
+            )
+        shutil.copymode(str(path), str(stripped))
+        os.replace(str(stripped), str(path))
+        return StripResult(path, before, path.stat().st_size)
+    finally:
+        if stripped.exists():
+            stripped.unlink()
+
+
+def strip(
+        root: Path,
+        jobs: Optional[int] = None
+) -> List[StripResult]:
+    """
+    Strip the debug symbols from every shared object in a layer.
+
+    :param root: the layer's root directory
+    :param jobs: the number of shared objects to strip at once (defaults to
+        the number of CPUs)
+    :return: the results
+    """
+    tool = env.get(env.Vars.LAMBDA_LAYER_STRIP)
+    if not shutil.which(tool):
+        raise FileNotFoundError(f"{tool} wasn't found.")
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        return list(
+            pool.map(lambda path: _strip(path, tool), shared_objects(root))
+        )
+
+
+def savings(
+        root: Path,
+        results: Iterable[StripResult],
+        owner: Callable[[str], str]
+) -> Dict[str, int]:
+    """
+    Total up the bytes saved for each distribution.
+
+    :param root: the layer's root directory
+    :param results: the results of stripping the layer
+    :param owner: gets the distribution that owns a file (from its path
+        relative to the layer)
+    :return: the number of bytes saved, by distribution
+    """
+    saved = defaultdict(int)
+    for result in results:
+        saved[owner(result.path.relative_to(root).as_posix())] += (
+            result.saved
+        )
+    return dict(saved)
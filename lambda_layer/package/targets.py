@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Build layers for other platforms (and Python versions) than the one we're
+running on.
+
+.. currentmodule:: lambda_layer.package.targets
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from itertools import product
+from typing import List, NamedTuple, Optional, Tuple
+from ..config import LayerConfig
+from .common import interpreter
+
+#: the machine each Lambda architecture runs on
+ARCHITECTURES = {'x86_64': 'x86_64', 'arm64': 'aarch64'}
+#: the Python version from which Lambda runtimes run on Amazon Linux 2023
+#: (instead of Amazon Linux 2)
+_AL2023_PYTHON = (3, 12)
+_AL2_GLIBC = 26  #: the minor version of glibc on Amazon Linux 2
+_AL2023_GLIBC = 34  #: the minor version of glibc on Amazon Linux 2023
+#: the oldest glibc (minor version) with a ``manylinux_2_*`` name on aarch64
+_MIN_AARCH64_GLIBC = 17
+#: the oldest glibc (minor version) with a ``manylinux_2_*`` name on x86_64
+_MIN_X86_64_GLIBC = 5
+#: the legacy ``manylinux`` names, by the glibc minor versions they stand for
+_LEGACY = {17: 'manylinux2014', 12: 'manylinux2010', 5: 'manylinux1'}
+
+
+class Target(NamedTuple):
+    """A Lambda runtime a layer is built for."""
+
+    python: str  #: the Python version (e.g. ``3.12``)
+    platform: str  #: the Lambda architecture (``x86_64`` or ``arm64``)
+
+    @property
+    def cache_tag(self) -> str:
+        """Get the bytecode cache tag (e.g. ``cpython-312``)."""
+        return f"cpython-{self.python.replace('.', '')}"
+
+    def platforms(self) -> List[str]:
+        """
+        Get the ``pip`` platform tags of the wheels that work on the
+        runtime, best first.
+
+        :return: the platform tags
+        """
+        machine = ARCHITECTURES[self.platform]
+        major, minor = (int(part) for part in self.python.split('.')[:2])
+        glibc = (
+            _AL2023_GLIBC if (major, minor) >= _AL2023_PYTHON
+            else _AL2_GLIBC
+        )
+        oldest = (
+            _MIN_X86_64_GLIBC if machine == 'x86_64'
+            else _MIN_AARCH64_GLIBC
+        )
+        tags = []
+        for _minor in range(glibc, oldest - 1, -1):
+            tags.append(f"manylinux_2_{_minor}_{machine}")
+            # (Older versions of pip only know the legacy names.)
+            if _minor in _LEGACY:
+                tags.append(f"{_LEGACY[_minor]}_{machine}")
+        return tags
+
+    def pip_options(self) -> List[str]:
+        """
+        Get the options that make ``pip`` install for the runtime (using
+        nothing but binary wheels).
+
+        :return: the options
+        """
+        return [
+            *(
+                option for tag in self.platforms()
+                for option in ('--platform', tag)
+            ),
+            '--python-version', self.python,
+            '--implementation', 'cp',
+            '--only-binary=:all:'
+        ]
+
+    def native(self) -> bool:
+        """Is this the interpreter we're running (so its bytecode works)?"""
+        return self.python == interpreter().version
+
+    def foreign(self) -> bool:
+        """Is this another architecture (so its native code won't load)?"""
+        return self.platform != _host_platform()
+
+
+def _host_platform() -> str:
+    """Get the Lambda architecture we're running on."""
+    machine = interpreter().machine
+    for platform, _machine in ARCHITECTURES.items():
+        if machine in (platform, _machine):
+            return platform
+    return machine
+
+
+def host() -> Target:
+    """Get the target that matches the interpreter we're running."""
+    return Target(python=interpreter().version, platform=_host_platform())
+
+
+def expand(layer: LayerConfig) -> Tuple[LayerConfig, ...]:
+    """
+    Expand a layer's matrix of platforms and Python versions into a layer
+    for each target.
+
+    :param layer: the layer configuration
+    :return: the layers (one for each target), or just the layer itself if
+        it doesn't list any platforms or Python versions
+    """
+    for platform in layer.platforms:
+        if platform not in ARCHITECTURES:
+            raise ValueError(
+                f"{layer.name} can't be built for {platform}.  (The "
+                f"platforms are {', '.join(ARCHITECTURES)}.)"
+            )
+    if len(layer.platforms) < 2 and len(layer.pythons) < 2:
+        return (layer,)
+    return tuple(
+        layer._replace(
+            platforms=(platform,) if platform else (),
+            pythons=(python,) if python else ()
+        )
+        for python, platform in product(
+            layer.pythons or (None,), layer.platforms or (None,)
+        )
+    )
+
+
+def target(layer: LayerConfig) -> Optional[Target]:
+    """
+    Get the target a layer (that's been expanded) is built for.
+
+    :param layer: the layer configuration
+    :return: the target, or ``None`` if the layer is built for the
+        interpreter we're running
+    """
+    if not (layer.platforms or layer.pythons):
+        return None
+    if len(layer.platforms) > 1 or len(layer.pythons) > 1:
+        raise ValueError(f"{layer.name} has more than one target.")
+    _host = host()
+    return Target(
+        python=layer.pythons[0] if layer.pythons else _host.python,
+        platform=layer.platforms[0] if layer.platforms else _host.platform
+    )
+
+
+def suffix(layer: LayerConfig) -> str:
+    """
+    Get the suffix that tells the archives of a layer's targets apart.
+
+    :param layer: the layer configuration (for a single target)
+    :return: the suffix (e.g. ``py3.12-arm64``), which is empty if the layer
+        doesn't have a target
+    """
+    return '-'.join([
+        *(f"py{python}" for python in layer.pythons),
+        *layer.platforms
+    ])
+
+
+def label(layer: LayerConfig) -> str:
+    """
+    Get the name of a layer (that's been expanded), including its target.
+
+    :param layer: the layer configuration
+    :return: the name (e.g. ``my-layer-py3.12-arm64``)
+    """
+    _suffix = suffix(layer)
+    return f"{layer.name}-{_suffix}" if _suffix else layer.name
+
+
+def archive_name(layer: LayerConfig) -> str:
+    """
+    Get the file name of a layer's archive.
+
+    :param layer: the layer configuration (for a single target)
+    :return: the file name (e.g. ``my-layer-1.0.0-py3.12-arm64.zip``)
+    """
+    _suffix = suffix(layer)
+    return (
+        f"{layer.name}-{layer.version}"
+        f"{'-' + _suffix if _suffix else ''}.zip"
+    )
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Time each stage of a build (and each process it runs), so we can see where
+the time goes.
+
+.. currentmodule:: lambda_layer.package.trace
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import sys
+import threading
+import time
+from typing import (
+    Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional,
+    Sequence, Tuple
+)
+
+try:
+    import resource
+except ImportError:  # pragma: no cover (it's not on Windows)
+    resource = None
+
+STAGE = 'stage'  #: the category of spans that time a build stage
+PROCESS = 'process'  #: the category of spans that time an external process
+
+_BLOCK_SIZE = 512  #: the size of the blocks `getrusage` counts (in bytes)
+#: the units of `ru_maxrss` (kilobytes on Linux, bytes on macOS)
+_RSS_UNITS = 1 if sys.platform == 'darwin' else 1024
+
+_SPANS: List['Span'] = []  #: the spans recorded in this process
+_LOCK = threading.Lock()  #: guards the recorded spans
+_OPEN = threading.local()  #: the spans that are open on each thread
+#: the spans recorded in the current context (if it keeps its own)
+_RECORDED: ContextVar[Optional[List['Span']]] = ContextVar(
+    'spans', default=None
+)
+
+
+class Span(NamedTuple):
+    """Something that happened during a build (and what it cost)."""
+
+    name: str  #: what happened
+    category: str  #: ``stage`` or ``process``
+    start: float  #: when it started (seconds since the epoch)
+    wall: float  #: how long it took (in seconds)
+    #: the CPU time it used, including child processes (``None`` if it
+    #: shared the process with other builds)
+    cpu: Optional[float]
+    read_bytes: Optional[int]  #: the bytes read from the file system
+    write_bytes: Optional[int]  #: the bytes written to the file system
+    peak_rss: Optional[int]  #: the peak resident set size by the end (bytes)
+    thread: int  #: the thread it ran on
+    args: Dict[str, Any]  #: anything else worth knowing (like file counts)
+    nested: bool = False  #: ``True`` if it ran inside another stage
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the span as a mapping of simple types."""
+        return self._asdict()
+
+
+class _Usage(NamedTuple):
+    """Resource usage (of this process and its children) at some point."""
+
+    cpu: float  #: the CPU time (in seconds)
+    read_blocks: int  #: the blocks read from the file system
+    write_blocks: int  #: the blocks written to the file system
+    peak_rss: int  #: the largest resident set size (in bytes)
+
+
+def _usage() -> _Usage:
+    """Get the resources this process (and its children) have used so far."""
+    if resource is None:
+        return _Usage(
+            cpu=time.process_time(), read_blocks=0, write_blocks=0, peak_rss=0
+        )
+    usages = [
+        resource.getrusage(who)
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    ]
+    return _Usage(
+        cpu=sum(usage.ru_utime + usage.ru_stime for usage in usages),
+        read_blocks=sum(usage.ru_inblock for usage in usages),
+        write_blocks=sum(usage.ru_oublock for usage in usages),
+        peak_rss=max(usage.ru_maxrss for usage in usages) * _RSS_UNITS
+    )
+
+
+@contextmanager
+def span(name: str, category: str = STAGE, **args) -> Iterator[Dict]:
+    """
+    Record a span around a block.
+
+    :param name: what's happening
+    :param category: ``stage`` or ``process``
+    :param args: anything else worth knowing
+    :return: the span's arguments (which the block can add to)
+    """
+    _args = dict(args)
+    start = time.time()
+    began = time.perf_counter()
+    # Resource usage is counted for the whole process, so it doesn't say
+    # anything about a context that shares the process with other builds.
+    isolated = _RECORDED.get() is not None
+    before = None if isolated else _usage()
+    stack = _OPEN.__dict__.setdefault('stack', [])
+    # (A stage that runs inside another one is part of its time.)
+    nested = any(_category == STAGE for _category, _ in stack)
+    stack.append((category, _args))
+    try:
+        yield _args
+    finally:
+        stack.pop()
+        after = None if before is None else _usage()
+        record = Span(
+            name=name,
+            category=category,
+            start=start,
+            wall=time.perf_counter() - began,
+            cpu=after.cpu - before.cpu if after else None,
+            read_bytes=(
+                (after.read_blocks - before.read_blocks) * _BLOCK_SIZE
+                if after else None
+            ),
+            write_bytes=(
+                (after.write_blocks - before.write_blocks) * _BLOCK_SIZE
+                if after else None
+            ),
+            peak_rss=after.peak_rss if after else None,
+            thread=threading.get_ident(),
+            args=_args,
+            nested=nested
+        )
+        with _LOCK:
+            _recorded().append(record)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """
+    Record a (stage) span around every call to a function.
+
+    :param name: the name of the stage
+    :return: the decorator
+    """
+    def _decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def _traced(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return _traced
+    return _decorator
+
+
+def annotate(**args):
+    """
+    Add to the arguments of the innermost span that's open on this thread
+    (if there is one).
+
+    :param args: the arguments
+    """
+    stack = getattr(_OPEN, 'stack', None)
+    if stack:
+        stack[-1][1].update(args)
+
+
+def _recorded() -> List[Span]:
+    """Get the list the current context records its spans in."""
+    recorded = _RECORDED.get()
+    return _SPANS if recorded is None else recorded
+
+
+def isolate():
+    """
+    Record the spans of the current context (like a single layer's build in
+    an event loop) on their own, apart from the rest of the process.
+
+    (The spans only have wall times, since the CPU time, I/O and memory
+    the process uses can't be told apart by context.)
+    """
+    _RECORDED.set([])
+
+
+def collect() -> Tuple[Span, ...]:
+    """
+    Get the spans recorded in this process (or the current context, if it's
+    been isolated) so far, and start over.
+
+    :return: the spans, in the order they finished
+    """
+    with _LOCK:
+        recorded = _recorded()
+        spans = tuple(recorded)
+        recorded.clear()
+    return spans
+
+
+def chrome(layers: Mapping[str, Sequence[Span]]) -> Dict[str, Any]:
+    """
+    Create a Chrome trace (which ``chrome://tracing`` and Perfetto can open)
+    from the layers' spans.
+
+    Each layer shows up as its own process.
+
+    :param layers: the spans, by layer name
+    :return: the trace (as a mapping of simple types)
+    """
+    starts = [_span.start for spans in layers.values() for _span in spans]
+    origin = min(starts) if starts else 0
+    events: List[Dict[str, Any]] = []
+    for pid, (layer, spans) in enumerate(layers.items(), start=1):
+        events.append({
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': pid,
+            'args': {'name': layer}
+        })
+        for _span in spans:
+            events.append({
+                'name': _span.name,
+                'cat': _span.category,
+                'ph': 'X',
+                'ts': round((_span.start - origin) * 1e6),
+                'dur': round(_span.wall * 1e6),
+                'pid': pid,
+                'tid': _span.thread,
+                'args': {
+                    **_usages(_span),
+                    **_span.args
+                }
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _usages(_span: Span) -> Dict[str, Any]:
+    """
+    Get what a span used (if it knows).
+
+    :param _span: the span
+    :return: the CPU time, I/O and peak resident set size
+    """
+    if _span.cpu is None:
+        return {}
+    return {
+        'cpu_s': round(_span.cpu, 6),
+        'read_bytes': _span.read_bytes,
+        'write_bytes': _span.write_bytes,
+        'peak_rss': _span.peak_rss
+    }
+
+
+def summary(layers: Mapping[str, Sequence[Span]]) -> Dict[str, Any]:
+    """
+    Total up the time (and everything else) each layer spent in each stage.
+
+    A stage's totals include any stages that ran inside it (like the
+    ``resolve`` in an ``install`` from the package store), but the layer's
+    total only counts each moment once.
+
+    :param layers: the spans, by layer name
+    :return: the totals, by stage name, by layer name (as a mapping of simple
+        types)
+    """
+    totals: Dict[str, Any] = {}
+    for layer, spans in layers.items():
+        stages: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+            'count': 0, 'wall_s': 0.0, 'files': 0
+        })
+        for _span in spans:
+            if _span.category != STAGE:
+                continue
+            stage = stages[_span.name]
+            stage['count'] += 1
+            stage['wall_s'] += _span.wall
+            stage['files'] += _span.args.get('files', 0)
+            # (Spans that shared the process don't know what they used.)
+            for key, value in _usages(_span).items():
+                stage[key] = (
+                    max(stage.get(key, 0), value) if key == 'peak_rss'
+                    else stage.get(key, 0) + value
+                )
+        totals[layer] = {
+            'wall_s': round(
+                sum(
+                    _span.wall for _span in spans
+                    if _span.category == STAGE and not _span.nested
+                ),
+                6
+            ),
+            'stages': {
+                name: {
+                    **stage,
+                    'wall_s': round(stage['wall_s'], 6),
+                    **(
+                        {'cpu_s': round(stage['cpu_s'], 6)}
+                        if 'cpu_s' in stage else {}
+                    )
+                }
+                for name, stage in stages.items()
+            }
+        }
+    return totals
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+Watch a configuration (and the files it refers to), and rebuild the layers
+that change.
+
+.. currentmodule:: lambda_layer.package.watch
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+import os
+from pathlib import Path
+import time
+from typing import (
+    Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+)
+import click
+from ..config import LayerConfig
+from .cache import references
+from .incremental import sha256
+from .lock import path as lock_path
+from .targets import label
+
+
+class Snapshot(NamedTuple):
+    """The layers in a configuration (and the files they refer to)."""
+
+    layers: Dict[str, LayerConfig]  #: the layers, by name (and target)
+    references: Dict[str, Tuple[str, ...]]  #: the files each layer refers to
+    files: Dict[str, Optional[str]]  #: the files' digests (``None`` if gone)
+
+
+def snapshot(layers: Iterable[LayerConfig]) -> Snapshot:
+    """
+    Take a snapshot of some layers.
+
+    :param layers: the layer configurations (for single targets)
+    :return: the snapshot
+    """
+    _layers = {label(layer): layer for layer in layers}
+    _references = {
+        name: tuple(str(path) for path in references(layer))
+        for name, layer in _layers.items()
+    }
+    files = {}
+    for path in {path for paths in _references.values() for path in paths}:
+        try:
+            files[path] = sha256(Path(path))
+        except OSError:
+            files[path] = None
+    return Snapshot(layers=_layers, references=_references, files=files)
+
+
+def changed(old: Optional[Snapshot], new: Snapshot) -> List[LayerConfig]:
+    """
+    Figure out which layers have to be built again.
+
+    :param old: the last snapshot (or ``None`` if nothing's been built yet)
+    :param new: the new snapshot
+    :return: the layers that are new, whose settings changed, or that refer
+        to a file that changed
+    """
+    return [
+        layer for name, layer in new.layers.items()
+        if old is None
+        or old.layers.get(name) != layer
+        or any(
+            old.files.get(path) != new.files[path]
+            for path in new.references[name]
+        )
+    ]
+
+
+class Watcher(object):
+    """Watches a configuration file for changes."""
+
+    def __init__(
+            self,
+            configf: Union[str, Path],
+            load: Callable[[], Iterable[LayerConfig]],
+            interval: float = 0.5
+    ):
+        """
+        Create a new instance.
+
+        :param configf: the path to the configuration file
+        :param load: loads the layers (for single targets, with their locks
+            applied)
+        :param interval: the seconds between checks (and the time a change
+            has to settle before it's picked up)
+        """
+        self.configf: Path = Path(configf).expanduser().resolve()
+        self.interval = interval
+        self.snapshot: Optional[Snapshot] = None
+        self._load = load
+        self._stats: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    def paths(self) -> List[Path]:
+        """
+        Get the files that are watched.
+
+        :return: the configuration file, its lockfile, and the files the
+            layers refer to
+        """
+        return [
+            self.configf,
+            lock_path(self.configf),
+            *(Path(path) for path in (
+                self.snapshot.files if self.snapshot else ()
+            ))
+        ]
+
+    def _stat(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        """Get the modification time and size of each watched file."""
+        stats = {}
+        for path in self.paths():
+            try:
+                stat = os.stat(str(path))
+                stats[str(path)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stats[str(path)] = None
+        return stats
+
+    def poll(self) -> Optional[List[LayerConfig]]:
+        """
+        Check the watched files for changes.
+
+        :return: the layers that have to be built again, or ``None`` if none
+            of the files changed
+        :raises ValueError: if the configuration can't be loaded
+        """
+        stats = self._stat()
+        if stats == self._stats:
+            return None
+        # Editors often write a file in more than one go, so we wait for it
+        # to settle down.  (There's no need the first time around.)
+        while self.snapshot is not None:
+            time.sleep(self.interval)
+            settled = self._stat()
+            if settled == stats:
+                break
+            stats = settled
+        # (If the configuration won't load, we wait for the next change
+        # before we try again.)
+        self._stats = stats
+        _snapshot = snapshot(self._load())
+        layers = changed(self.snapshot, _snapshot)
+        self.snapshot = _snapshot
+        return layers
+
+    def watch(
+            self,
+            build: Callable[[List[LayerConfig]], None],
+            failed: Callable[[Exception], None],
+            runs: Optional[int] = None
+    ):
+        """
+        Build the layers, then build them again whenever they change.
+
+        :param build: builds layers
+        :param failed: reports a configuration that couldn't be loaded
+        :param runs: the number of times to check for changes (or ``None``
+            to keep checking until we're interrupted)
+        """
+        run = 0
+        while runs is None or run < runs:
+            run += 1
+            try:
+                layers = self.poll()
+            except (
+                    OSError, ValueError, TypeError, KeyError,
+                    click.ClickException
+            ) as ex:
+                failed(ex)
+                continue
+            if layers:
+                build(layers)
+            elif layers is None:
+                time.sleep(self.interval)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Created by pat on 10/18/26
+"""
+A shared wheelhouse, so each distribution is downloaded (and built) once no
+matter how many layers need it.
+
+.. currentmodule:: lambda_layer.package.wheelhouse
+.. moduleauthor:: Pat Daburu <pat@daburu.net>
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from ..config import LayerConfig
+from . import targets
+from .bash import run, write_requirements
+from .incremental import sha256
+
+_DOWNLOADS = '.downloads'  #: where downloaded files are kept
+_BUILT = '.built'  #: the suffix of markers for source distributions we built
+_HASH = re.compile(r'--hash=sha256:(?P<value>[0-9a-fA-F]+)')
+
+
+def _download(
+        requirements: Path,
+        dest: Path,
+        wheelhouse: Path,
+        options: Iterable[str] = (),
+        silent: bool = False
+):
+    """
+    Download a layer's distributions (and their dependencies).
+
+    :param requirements: the path to the layer's requirements file
+    :param dest: the directory the files are downloaded to
+    :param wheelhouse: the path to the wheelhouse
+    :param options: any other options for ``pip`` (like the ones that pick
+        the target platform)
+    :param silent: ``True`` to suppress normal output
+    """
+    run(
+        [
+            'python', '-m', 'pip', 'download',
+            '--dest', str(dest),
+            '--find-links', str(wheelhouse),
+            *options,
+            '-r', str(requirements)
+        ],
+        silent=silent,
+        stage='download'
+    )
+
+
+def _wheel(
+        sdist: Path,
+        wheelhouse: Path,
+        silent: bool = False
+):
+    """
+    Build a wheel from a source distribution.
+
+    :param sdist: the path to the source distribution
+    :param wheelhouse: the path to the wheelhouse
+    :param silent: ``True`` to suppress normal output
+    """
+    # The wheel is built on its own (so we can tell which one it is) before
+    # it goes into the wheelhouse.
+    with tempfile.TemporaryDirectory(
+            prefix='.wheel-', dir=str(wheelhouse)
+    ) as tmp_dir:
+        run(
+            [
+                'python', '-m', 'pip', 'wheel',
+                '--no-deps',
+                '--wheel-dir', tmp_dir,
+                str(sdist)
+            ],
+            silent=silent,
+            stage='wheel'
+        )
+        wheels = {}
+        for path in Path(tmp_dir).glob('*.whl'):
+            wheels[path.name] = sha256(path)
+            os.replace(str(path), str(wheelhouse / path.name))
+    # Leave a marker so we don't build it again next time (which also
+    # records which wheels stand in for the source distribution).
+    sdist.with_name(f"{sdist.name}{_BUILT}").write_text(
+        json.dumps({'sha256': sha256(sdist), 'wheels': wheels})
+    )
+
+
+def built(wheelhouse: Union[str, Path]) -> Dict[str, Tuple[str, ...]]:
+    """
+    Get the wheels that were built from source distributions.
+
+    :param wheelhouse: the path to the wheelhouse
+    :return: the ``sha256`` hashes of the wheels, by the ``sha256`` hash of
+        the source distribution they were built from
+    """
+    _built = {}
+    for marker in Path(wheelhouse).expanduser().glob(
+            f"{_DOWNLOADS}/*{_BUILT}"
+    ):
+        try:
+            data = json.loads(marker.read_text())
+            _built[data['sha256']] = tuple(sorted(data['wheels'].values()))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            continue  # (Older markers are empty.)
+    return _built
+
+
+def rehash(
+        layer: LayerConfig,
+        wheels: Mapping[str, Tuple[str, ...]]
+) -> LayerConfig:
+    """
+    Let the wheels built from a locked layer's source distributions stand in
+    for them.  (A lock has the source distribution's hash, but the layer is
+    installed from the wheel.)
+
+    :param layer: the layer configuration
+    :param wheels: the wheels built from source distributions (see
+        :py:func:`built`)
+    :return: the layer configuration, with the wheels' hashes added to the
+        requirements that pin the source distributions
+    """
+    def _rehash(package: str) -> str:
+        hashes = [
+            value
+            for match in _HASH.finditer(package)
+            for value in wheels.get(match.group('value').lower(), ())
+        ]
+        return ' '.join([
+            package,
+            *(
+                f"--hash=sha256:{value}" for value in hashes
+                if f"sha256:{value}" not in package
+            )
+        ])
+    return layer._replace(
+        packages=tuple(_rehash(package) for package in layer.packages)
+    )
+
+
+def fill(
+        wheelhouse: Union[str, Path],
+        layers: Iterable[LayerConfig],
+        jobs: Optional[int] = None,
+        silent: bool = False
+) -> Path:
+    """
+    Make sure the wheelhouse has a wheel for every distribution the layers
+    need.
+
+    :param wheelhouse: the path to the wheelhouse
+    :param layers: the layer configurations
+    :param jobs: the maximum number of downloads (or builds) to run at once
+    :param silent: ``True`` to suppress normal output
+    :return: the path to the wheelhouse
+    """
+    _wheelhouse = (
+        wheelhouse if isinstance(wheelhouse, Path) else Path(wheelhouse)
+    ).expanduser().resolve()
+    downloads = _wheelhouse / _DOWNLOADS
+    downloads.mkdir(parents=True, exist_ok=True)
+    _layers = [layer for layer in layers if layer.packages]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # Each layer is resolved on its own (two layers may well want
+        # different versions of the same thing), but anything that's already
+        # in the wheelhouse is found there instead of being fetched again.
+        # Each one also downloads to a directory of its own (so pip never
+        # sees another layer's half-written files).
+        with tempfile.TemporaryDirectory(
+                prefix='.download-', dir=str(_wheelhouse)
+        ) as tmp_dir:
+            dests = []
+            futures = []
+            for idx, (layer, target) in enumerate(
+                    (_layer, targets.target(_layer))
+                    for layer in _layers for _layer in targets.expand(layer)
+            ):
+                dest = Path(tmp_dir) / str(idx)
+                dests.append(dest)
+                futures.append(pool.submit(
+                    _download,
+                    write_requirements(
+                        path=Path(tmp_dir) / f"{idx}-requirements.txt",
+                        packages=layer.packages,
+                        silent=True
+                    ),
+                    dest,
+                    _wheelhouse,
+                    target.pip_options() if target else [],
+                    silent
+                ))
+            for future in futures:
+                future.result()
+
+            # Once they're all done, wheels can go straight into the
+            # wheelhouse, and anything else is a source distribution we
+            # keep with the other downloads.
+            for dest in dests:
+                for path in dest.glob('*'):
+                    os.replace(
+                        str(path),
+                        str(
+                            _wheelhouse / path.name
+                            if path.suffix == '.whl'
+                            else downloads / path.name
+                        )
+                    )
+
+        # Anything else is a source distribution that we need to build.
+        sdists: List[Path] = [
+            path for path in downloads.iterdir()
+            if path.is_file()
+            and not path.name.endswith(_BUILT)
+            and not path.with_name(f"{path.name}{_BUILT}").exists()
+        ]
+        for future in [
+                pool.submit(_wheel, sdist, _wheelhouse, silent)
+                for sdist in sdists
+        ]:
+            future.result()
+
+    return _wheelhouse
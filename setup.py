@@ -52,6 +52,10 @@ setup(
         'click>=7.0,<8',
         'toml'
     ],
+    extras_require={
+        # Uploading layers straight to S3.
+        's3': ['boto3']
+    },
     entry_points="""
     [console_scripts]
     lambda-layer=lambda_layer.cli:cli
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+from pathlib import Path
+import zipfile
+import pytest
+
+
+def _digest(data: bytes) -> str:
+    """Get a file's digest the way a wheel's ``RECORD`` has it."""
+    return base64.urlsafe_b64encode(
+        hashlib.sha256(data).digest()
+    ).decode('ascii').rstrip('=')
+
+
+def _wheel(
+        path: Path,
+        name: str,
+        version: str = '1.0',
+        requires: str = ''
+) -> Path:
+    """Build a tiny wheel (without needing a build backend)."""
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        f"{name}/__init__.py": f"VERSION = '{version}'\n".encode('utf-8'),
+        f"{dist_info}/METADATA": (
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+            + (f"Requires-Dist: {requires}\n" if requires else '')
+        ).encode('utf-8'),
+        f"{dist_info}/WHEEL": (
+            b"Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\n"
+            b"Tag: py3-none-any\n"
+        )
+    }
+    record = [
+        f"{_path},sha256={_digest(data)},{len(data)}"
+        for _path, data in files.items()
+    ]
+    files[f"{dist_info}/RECORD"] = '\n'.join(
+        [*record, f"{dist_info}/RECORD,,"]
+    ).encode('utf-8')
+    wheel = path / f"{name}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(str(wheel), 'w') as _zip:
+        for _path, data in files.items():
+            _zip.writestr(_path, data)
+    return wheel
+
+
+@pytest.fixture
+def wheel():
+    """Build tiny wheels for a local index (or wheelhouse)."""
+    return _wheel
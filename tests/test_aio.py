@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+from contextvars import copy_context
+from pathlib import Path
+import sys
+import click
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import aio, archive, parallel, stream, trace
+from lambda_layer.package.bash import run
+
+_SCRIPT = '''
+import sys, time
+print("x" * 100000)
+print("oops", file=sys.stderr)
+time.sleep(0.2)
+print("done", end="")
+'''
+
+
+def test_run_async():
+    lines = []
+    returncode, output = asyncio.run(stream.run_async(
+        [sys.executable, '-c', _SCRIPT], lines.append, tail=2
+    ))
+    assert returncode == 0
+    # Long lines come through in pieces, and the last line doesn't need a
+    # line ending.
+    assert [
+        len(line.text) for line in lines if line.stream == stream.STDOUT
+    ] == [64 * 1024, 100000 - 64 * 1024, 4]
+    assert output.stderr == 'oops'
+    assert output.stdout.endswith('x\ndone')
+
+
+def test_engine_limits_processes(monkeypatch):
+    running = [0, 0]  # (now, most)
+    run_async = stream.run_async
+
+    async def _counted(*args, **kwargs):
+        running[0] += 1
+        running[1] = max(running)
+        try:
+            return await run_async(*args, **kwargs)
+        finally:
+            running[0] -= 1
+
+    monkeypatch.setattr(stream, 'run_async', _counted)
+
+    def _build(engine, idx):
+        # Each build runs in a context of its own.
+        stream.runner.set(engine.run_threadsafe)
+        trace.isolate()
+        script = f'import time; time.sleep(0.1); print({idx})'
+        output = run([sys.executable, '-c', script], silent=True)
+        return output.stdout, len(trace.collect())
+
+    async def _main():
+        loop = asyncio.get_running_loop()
+        engine = aio.Engine(loop, processes=2)
+        return await asyncio.gather(*(
+            loop.run_in_executor(
+                None, copy_context().run, _build, engine, idx
+            )
+            for idx in range(6)
+        ))
+
+    # Each build got its own output (and its own spans), but no more than
+    # two processes ran at once.
+    assert asyncio.run(_main()) == [(str(idx), 1) for idx in range(6)]
+    assert running[1] == 2
+    assert stream.runner.get() is None
+
+
+def test_make_all(tmp_path, monkeypatch, capsys):
+    limits = []
+
+    def _make(dist_dir, layer, silent=False, **options):
+        # Everything a build writes ends up in its own output...
+        click.echo(f"making {layer.name}")
+        output = run(
+            [sys.executable, '-c', f'print("{layer.name}")'], silent=True
+        )
+        # ...and archives are compressed under the engine's limit.
+        # pylint: disable=protected-access
+        limits.append(archive._LIMIT._initial_value)
+        if layer.name == 'broken':
+            raise ValueError('no good')
+        path = Path(dist_dir) / f"{output.stdout}.zip"
+        path.write_bytes(b'zip')
+        return path
+
+    monkeypatch.setattr(parallel, 'make', _make)
+    layers = [
+        LayerConfig(name, '1.0', ('six',))
+        for name in ('api', 'broken', 'jobs')
+    ]
+    results = asyncio.run(aio.make_all(
+        tmp_path, layers, processes=1, compression=3, silent=True
+    ))
+    assert [result.name for result in results] == ['api', 'broken', 'jobs']
+    assert [Path(result.archive).name for result in results if result.ok] == [
+        'api.zip', 'jobs.zip'
+    ]
+    assert results[1].error == 'ValueError: no good'
+    assert results[0].output == 'making api\n'
+    assert 'making broken' in results[1].output
+    assert limits == [3, 3, 3]
+    assert archive._LIMIT is None  # pylint: disable=protected-access
+    # Each layer's output is reported (once it's finished), tagged with the
+    # layer's name.
+    out = capsys.readouterr().out
+    assert '[api] making api' in out and '[jobs] making jobs' in out
+    # (The layers share the process, so their spans only have wall times.)
+    assert all(_span.cpu is None for _span in results[0].spans)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from pathlib import Path
+import zipfile
+import zlib
+from lambda_layer.package import archive
+
+
+def _tree(path: Path) -> Path:
+    (path / 'pkg' / 'sub').mkdir(parents=True)
+    (path / 'pkg' / '__init__.py').write_text('import os\n' * 100)
+    (path / 'pkg' / 'sub' / 'data.bin').write_bytes(bytes(range(256)) * 64)
+    (path / 'pkg' / 'empty.txt').write_bytes(b'')
+    return path
+
+
+def test_create_matches_contents(tmp_path):
+    site_packages = _tree(tmp_path / 'site-packages')
+    path = archive.create(
+        dir_path=site_packages, archive=tmp_path / 'layer.zip', jobs=2
+    )
+    with zipfile.ZipFile(str(path)) as _zip:
+        assert _zip.testzip() is None
+        assert sorted(_zip.namelist()) == [
+            'python/pkg/__init__.py',
+            'python/pkg/empty.txt',
+            'python/pkg/sub/data.bin'
+        ]
+        assert _zip.read('python/pkg/sub/data.bin') == (
+            site_packages / 'pkg' / 'sub' / 'data.bin'
+        ).read_bytes()
+
+
+def test_create_level(tmp_path):
+    site_packages = _tree(tmp_path / 'site-packages')
+    stored = archive.create(site_packages, tmp_path / 'stored.zip', level=0)
+    smallest = archive.create(site_packages, tmp_path / 'best.zip', level=9)
+    assert smallest.stat().st_size < stored.stat().st_size
+
+
+def test_reproducible(tmp_path):
+    site_packages = _tree(tmp_path / 'site-packages')
+    first = archive.create(
+        site_packages, tmp_path / 'first.zip', reproducible=True
+    )
+    # Touching the files shouldn't make any difference.
+    for path in site_packages.rglob('*.py'):
+        path.write_text(path.read_text())
+    second = archive.create(
+        site_packages, tmp_path / 'second.zip', reproducible=True
+    )
+    assert first.read_bytes() == second.read_bytes()
+    with zipfile.ZipFile(str(first)) as _zip:
+        assert _zip.namelist() == sorted(_zip.namelist())
+
+
+def test_patch_matches_create(tmp_path):
+    site_packages = _tree(tmp_path / 'site-packages')
+    base = archive.create(
+        site_packages, tmp_path / 'base.zip', reproducible=True
+    )
+    (site_packages / 'pkg' / '__init__.py').write_text('import sys\n')
+    (site_packages / 'pkg' / 'new.py').write_text('x = 1\n')
+    (site_packages / 'pkg' / 'empty.txt').unlink()
+    patched = archive.patch(
+        base=base,
+        keep=['python/pkg/sub/data.bin'],
+        dir_path=site_packages,
+        files=[
+            site_packages / 'pkg' / 'new.py',
+            site_packages / 'pkg' / '__init__.py'
+        ],
+        archive=tmp_path / 'patched.zip',
+        reproducible=True
+    )
+    created = archive.create(
+        site_packages, tmp_path / 'created.zip', reproducible=True
+    )
+    assert patched.read_bytes() == created.read_bytes()
+
+
+def test_entry_cache(tmp_path):
+    site_packages = _tree(tmp_path / 'site-packages')
+    cache = archive.EntryCache(tmp_path / 'entries', max_size=1024 * 1024)
+    uncached = archive.create(
+        site_packages, tmp_path / 'uncached.zip', reproducible=True
+    )
+    first = archive.create(
+        site_packages, tmp_path / 'first.zip', reproducible=True,
+        cache=cache
+    )
+    # Only the file that's big enough is worth keeping.
+    data = (site_packages / 'pkg' / 'sub' / 'data.bin').read_bytes()
+    key = cache.key(data, archive.DEFAULT_LEVEL)
+    assert cache.get(key) is not None
+    # The next archive copies the cached deflate stream.  (We can tell
+    # because we've tampered with it.)
+    cache.put(key, zlib.compress(data[::-1], 6)[2:-4])
+    second = archive.create(
+        site_packages, tmp_path / 'second.zip', reproducible=True,
+        cache=cache
+    )
+    assert first.read_bytes() == uncached.read_bytes()
+    assert second.read_bytes() != first.read_bytes()
+    # A damaged entry is never used.
+    entry = cache._entry(key)  # pylint: disable=protected-access
+    entry.write_bytes(entry.read_bytes()[:-1])
+    assert cache.get(key) is None
+    # Entries that were never finished are cleaned up after a while.
+    cache.put(key, zlib.compress(data, 6)[2:-4])
+    orphan = entry.with_name(f".{entry.name}.abc123")
+    orphan.write_bytes(b'half')
+    os.utime(str(orphan), (0, 0))
+    # Once the cache is too big, it's emptied out from the oldest entry.
+    assert cache.prune(max_size=0) == 1
+    assert cache.get(key) is None
+    assert not orphan.exists()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+import subprocess
+import sys
+from lambda_layer.package import bash
+
+
+def _tree(root: Path) -> Path:
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'pkg' / '__init__.py').write_text('from .mod import VALUE\n')
+    (root / 'pkg' / 'mod.py').write_text('VALUE = 42\n')
+    (root / 'pkg' / 'broken.py').write_text('print "python 2"\n')
+    return root
+
+
+def test_precompile_unchecked_hash(tmp_path):
+    root = _tree(tmp_path / 'python')
+    assert bash._precompile(root, silent=True) == 2
+    pyc = next((root / 'pkg' / '__pycache__').glob('mod.*.pyc'))
+    # Flags: hash-based (0b01), without checking the source (0b10).
+    assert int.from_bytes(pyc.read_bytes()[4:8], 'little') == 0b01
+
+
+def test_precompile_drop_sources(tmp_path):
+    root = _tree(tmp_path / 'python')
+    bash._precompile(root, drop_sources=True, silent=True)
+    assert not (root / 'pkg' / 'mod.py').exists()
+    assert (root / 'pkg' / 'mod.pyc').exists()
+    # Files that didn't compile are left alone.
+    assert (root / 'pkg' / 'broken.py').exists()
+    assert not (root / 'pkg' / '__pycache__').exists()
+    proc = subprocess.run(
+        [sys.executable, '-c', 'import pkg; print(pkg.VALUE)'],
+        cwd=str(root),
+        stdout=subprocess.PIPE
+    )
+    assert proc.stdout.strip() == b'42'
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+import zipfile
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import bash, main
+from lambda_layer.package.cache import BuildCache, references
+from lambda_layer.package.sinks import LocalSink
+
+
+def _archive(path: Path, size: int = 10) -> Path:
+    with zipfile.ZipFile(str(path), 'w') as _zip:
+        _zip.writestr('python/requests-2.22.0.dist-info/METADATA', 'x')
+        _zip.writestr('python/requests/__init__.py', 'x' * size)
+    return path
+
+
+def test_key_changes_with_packages():
+    layer = LayerConfig('layer', '0.0.1', ('toml', 'requests'))
+    assert BuildCache.key(layer) == BuildCache.key(
+        layer._replace(packages=('Requests', 'toml'))
+    )
+    assert BuildCache.key(layer) != BuildCache.key(
+        layer._replace(packages=('toml',))
+    )
+
+
+def test_key_changes_with_references(tmp_path):
+    requirements = tmp_path / 'requirements.txt'
+    requirements.write_text('six\n')
+    layer = LayerConfig('layer', '0.0.1', (
+        f"-r {requirements}",
+        f"--constraint={tmp_path / 'b.txt'}",
+        f"-c{tmp_path / 'c.txt'}",
+        'toml'
+    ))
+    assert references(layer) == [
+        requirements, tmp_path / 'b.txt', tmp_path / 'c.txt'
+    ]
+    key = BuildCache.key(layer)
+    # What's in the files is part of the key.
+    requirements.write_text('six\nattrs\n')
+    assert BuildCache.key(layer) != key
+
+
+def test_store_and_restore(tmp_path):
+    cache = BuildCache(path=tmp_path / 'cache')
+    layer = LayerConfig('layer', '0.0.1', ('requests',))
+    key = cache.key(layer)
+    dist_path = tmp_path / 'dist' / 'layer-0.0.1.zip'
+    sink = LocalSink(dist_path.parent)
+    assert cache.restore(key, sink, dist_path.name) is None
+    entry = cache.store(key, layer, _archive(tmp_path / 'built.zip'))
+    assert entry.distributions == ['requests-2.22.0']
+    assert cache.restore(key, sink, dist_path.name) == str(dist_path)
+    assert dist_path.read_bytes() == (tmp_path / 'built.zip').read_bytes()
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    cache = BuildCache(path=tmp_path / 'cache')
+    layers = [LayerConfig(f"layer{i}", '0.0.1', ()) for i in range(3)]
+    for layer in layers:
+        cache.store(
+            cache.key(layer), layer, _archive(tmp_path / f"{layer.name}.zip")
+        )
+    # Using the first layer makes it the most-recently used.
+    cache.restore(cache.key(layers[0]), LocalSink(tmp_path), 'restored.zip')
+    newest = cache.entries()[0]
+    evicted = cache.prune(max_size=newest.size)
+    assert len(evicted) == 2
+    assert [entry.name for entry in cache.entries()] == ['layer0']
+
+
+def test_restore_unlocked(tmp_path, monkeypatch, capsys, wheel):
+    monkeypatch.setenv('LAMBDA_LAYER_CACHE_DIR', str(tmp_path / 'cache'))
+    wheelhouse = tmp_path / 'wheelhouse'
+    wheelhouse.mkdir()
+    wheel(wheelhouse, 'pkga')
+    layer = LayerConfig('layer', '0.0.1', ('pkga>=1',))
+    resolved = bash.resolved_distributions(layer, wheelhouse, silent=True)
+    assert len(resolved) == 1 and resolved[0].startswith('pkga==1.0 ')
+    BuildCache().store(
+        BuildCache.key(layer, resolved),
+        layer,
+        _archive(tmp_path / 'built.zip')
+    )
+    assert main.make(tmp_path / 'dist', layer, wheelhouse=wheelhouse)
+    assert 'Restored' in capsys.readouterr().out
+    # A new release changes what a layer that isn't locked resolves to (and
+    # so its key)...
+    wheel(wheelhouse, 'pkga', version='1.1')
+    assert BuildCache.key(
+        layer, bash.resolved_distributions(layer, wheelhouse, silent=True)
+    ) != BuildCache.key(layer, resolved)
+    # ...but a locked layer doesn't have to be resolved at all.
+    locked = layer._replace(packages=('pkga==1.0',), deps=False)
+    assert bash.resolved_distributions(locked, wheelhouse) is None
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import os
+import zipfile
+from lambda_layer.config import CompressionConfig, LayerConfig
+from lambda_layer.package import archive, compression
+
+_TEXT = b'def handler(event, context):\n    return {"ok": True}\n'
+
+
+def test_decide():
+    policy = compression.Policy(
+        CompressionConfig(fast=['pkg/*.so'], max=['**/keep.zip']), level=6
+    )
+    decide = policy.decide
+    assert decide('pkg/a.whl', _TEXT * 10).choice == compression.STORE
+    assert decide('pkg/a.so', os.urandom(1024)).choice == compression.FAST
+    # The latest rule that matches wins.
+    assert decide('pkg/keep.zip', b'').choice == compression.MAX
+    # Everything else goes by its sample.
+    assert decide('pkg/blob', os.urandom(64 * 1024)).choice == (
+        compression.STORE
+    )
+    assert decide('pkg/mod.py', _TEXT * 10).choice == compression.DEFAULT
+    big = decide('pkg/data.json', _TEXT * 10000)
+    assert (big.choice, big.level) == (compression.MAX, 9)
+    # Big native libraries aren't worth the time the highest level takes.
+    assert decide('lib/lib.so', b'\0' * 1024 * 1024).choice == (
+        compression.DEFAULT
+    )
+    no_defaults = compression.Policy(
+        CompressionConfig(defaults=False, sample=0), level=6
+    )
+    assert no_defaults.decide('pkg/a.whl', b'').choice == compression.DEFAULT
+
+
+def test_archive_with_policy(tmp_path):
+    root = tmp_path / 'python'
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'pkg' / 'mod.py').write_bytes(_TEXT * 100)
+    (root / 'pkg' / 'weights.bin').write_bytes(os.urandom(256 * 1024))
+    plain = io.BytesIO()
+    archive.create(root, plain, reproducible=True)
+    policy = compression.Policy(CompressionConfig(), level=6)
+    adaptive = io.BytesIO()
+    archive.create(root, adaptive, reproducible=True, policy=policy)
+    with zipfile.ZipFile(adaptive) as _zip:
+        assert _zip.testzip() is None
+        assert {
+            info.filename: info.compress_type for info in _zip.infolist()
+        } == {
+            'python/pkg/mod.py': zipfile.ZIP_DEFLATED,
+            'python/pkg/weights.bin': zipfile.ZIP_STORED
+        }
+    # Picking up where the sample left off makes the same deflate stream.
+    with zipfile.ZipFile(plain) as _plain, zipfile.ZipFile(adaptive) as _zip:
+        assert _zip.getinfo('python/pkg/mod.py').compress_size == (
+            _plain.getinfo('python/pkg/mod.py').compress_size
+        )
+    tallies = policy.tallies()
+    assert [choice for choice in tallies] == ['store', 'default']
+    assert tallies['store'].compressed == 256 * 1024
+    assert 'Compared with level 6' in policy.table()
+
+
+def test_load():
+    layer = LayerConfig.load({
+        'name': 'api',
+        'version': '1.0',
+        'compression': {'store': ['**/*.onnx']}
+    })
+    assert layer.compression == CompressionConfig(store=('**/*.onnx',))
+    assert LayerConfig.load(layer.to_dict()) == layer
+    assert LayerConfig.load({
+        'name': 'api', 'version': '1.0', 'compression': True
+    }).compression == CompressionConfig()
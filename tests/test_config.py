@@ -17,3 +17,66 @@ def test_loadf_single():
     print()
     print(config)
 
+
+def test_load_defaults():
+    layer = LayerConfig.load({'name': 'layer', 'version': '0.0.1'})
+    assert layer.packages == ()
+    assert layer.venv
+
+
+def test_load_without_venv():
+    layer = LayerConfig.load({
+        'name': 'layer',
+        'version': '0.0.1',
+        'packages': ['toml'],
+        'venv': False
+    })
+    assert layer.packages == ('toml',)
+    assert not layer.venv
+
+
+def test_load_prune():
+    assert LayerConfig.load({
+        'name': 'layer', 'version': '0.0.1', 'prune': True
+    }).prune == config.PruneConfig()
+    layer = LayerConfig.load({
+        'name': 'layer',
+        'version': '0.0.1',
+        'prune': {'exclude': ['**/*.md'], 'defaults': False}
+    })
+    assert layer.prune.exclude == ('**/*.md',)
+    assert not layer.prune.defaults
+    assert LayerConfig.load({
+        'name': 'layer', 'version': '0.0.1', 'prune': {}
+    }).prune == config.PruneConfig()
+
+
+def test_load_profile():
+    layer = LayerConfig.load({
+        'name': 'layer',
+        'version': '0.0.1',
+        'profile': {'modules': ['toml'], 'budget': 250}
+    })
+    assert layer.profile.modules == ('toml',)
+    assert layer.profile.budget == 250
+    assert LayerConfig.load({
+        'name': 'layer', 'version': '0.0.1'
+    }).profile is None
+
+
+def test_to_dict():
+    layer = LayerConfig.load({
+        'name': 'layer',
+        'version': '0.0.1',
+        'packages': ['toml'],
+        'prune': {'exclude': ['**/*.md']},
+        'deps': False
+    })
+    assert layer.to_dict() == {
+        'name': 'layer',
+        'version': '0.0.1',
+        'packages': ['toml'],
+        'prune': {'exclude': ['**/*.md'], 'include': [], 'defaults': True},
+        'deps': False
+    }
+    assert LayerConfig.load(layer.to_dict()) == layer
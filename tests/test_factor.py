@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+import toml
+from lambda_layer.config import Config, LayerConfig
+from lambda_layer.package import factor
+
+_CORE = {'boto3': '1.34.0', 'botocore': '1.34.0', 'requests': '2.31.0'}
+
+_RESOLVED = {
+    'api': {**_CORE, 'pydantic': '2.5.0'},
+    'worker': {**_CORE, 'pydantic': '2.5.0', 'pyyaml': '6.0'},
+    'cron': {**_CORE, 'pyyaml': '5.4'}
+}
+
+
+def test_plan():
+    bases = factor.plan(_RESOLVED)
+    assert bases[0] == factor.BaseLayer(
+        name='base-1',
+        layers=('api', 'cron', 'worker'),
+        distributions=(
+            'boto3==1.34.0', 'botocore==1.34.0', 'requests==2.31.0'
+        )
+    )
+    # pydantic is shared by two layers; the two versions of PyYAML aren't
+    # shared at all.
+    assert bases[1].layers == ('api', 'worker')
+    assert bases[1].distributions == ('pydantic==2.5.0',)
+    assert len(bases) == 2
+
+
+def test_plan_respects_max_layers():
+    # With room for just one base (plus the layer itself), the biggest
+    # saving wins.
+    bases = factor.plan(_RESOLVED, max_layers=2)
+    assert [base.layers for base in bases] == [('api', 'cron', 'worker')]
+
+
+def test_factor():
+    config = Config(environment={}, layers=tuple(
+        LayerConfig(name, '0.0.1', ('anything',), compression_level=9)
+        for name in ('api', 'worker', 'cron')
+    ))
+    bases = factor.plan(_RESOLVED)
+    factored = factor.factor(config, _RESOLVED, bases)
+    assert [layer.name for layer in factored.layers] == [
+        'base-1', 'base-2', 'api', 'worker', 'cron'
+    ]
+    base = factored.layers[0]
+    assert base.packages == bases[0].distributions
+    assert base.compression_level == 9
+    assert not base.deps
+    worker = factored.layers[3]
+    assert worker.packages == ('pyyaml==6.0',)
+    assert worker.bases == ('base-1', 'base-2')
+    assert not worker.deps
+    # What's written can be read back.
+    assert Config.load(toml.loads(factored.dumps())) == factored
+
+
+def test_resolve(monkeypatch):
+    calls = []
+
+    def _resolve_versions(options=(), **_):
+        calls.append(list(options))
+        return dict(_CORE)
+
+    monkeypatch.setattr(factor, 'resolve_versions', _resolve_versions)
+    layers = [
+        LayerConfig(name, '0.0.1', ('boto3',), platforms=('x86_64', 'arm64'))
+        for name in ('api', 'worker')
+    ]
+    # Each target is resolved for its own platform.
+    assert factor.resolve(layers) == {'api': _CORE, 'worker': _CORE}
+    assert len(calls) == 4
+    assert all('--platform' in options for options in calls)
+    base = factor.factor(
+        Config(environment={}, layers=tuple(layers)),
+        factor.resolve(layers),
+        factor.plan(factor.resolve(layers))
+    ).layers[0]
+    assert base.platforms == ('x86_64', 'arm64')
+    # The layers that share a base have to be built for the same targets...
+    with pytest.raises(ValueError):
+        factor.resolve([*layers, LayerConfig('cron', '0.0.1', ('boto3',))])
+    # ...and a layer has to come out the same for all of them.
+    monkeypatch.setattr(
+        factor,
+        'resolve_versions',
+        lambda options=(), **_: (
+            {'boto3': '1.34.0'} if 'manylinux2014_x86_64' in options
+            else {'boto3': '1.33.0'}
+        )
+    )
+    with pytest.raises(ValueError):
+        factor.resolve(layers[:1])
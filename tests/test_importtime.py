@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import zipfile
+from lambda_layer.package import importtime
+
+_STDERR = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     pkg.leaf
+import time:       200 |        300 |   pkg.sub
+import time:        50 |        350 | pkg
+import time:        10 |         10 | other
+"""
+
+
+def test_parse():
+    roots = importtime.parse(_STDERR)
+    assert [root.name for root in roots] == ['pkg', 'other']
+    pkg = roots[0]
+    assert (pkg.self_us, pkg.cumulative_us) == (50, 350)
+    assert pkg.children[0].name == 'pkg.sub'
+    assert pkg.children[0].children[0].name == 'pkg.leaf'
+
+
+def test_profile(tmp_path):
+    archive = tmp_path / 'layer.zip'
+    with zipfile.ZipFile(str(archive), 'w') as _zip:
+        _zip.writestr('python/slow/__init__.py', 'import json\n')
+        _zip.writestr('python/slow-1.0.dist-info/top_level.txt', 'slow\n')
+        _zip.writestr('python/broken.py', 'raise ValueError("nope")\n')
+    assert importtime.top_levels(archive) == ('slow',)
+    profile = importtime.profile(archive, runs=2)
+    assert profile.error is None
+    assert profile.runs == 2
+    assert profile.roots[0].name == 'slow'
+    assert 'slow' in importtime.tree(profile)
+    profile = importtime.profile(archive, modules=['broken'], runs=3)
+    assert profile.runs == 1
+    assert 'ValueError' in profile.error
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import zipfile
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import bash, incremental
+from lambda_layer.package.incremental import FileRecord, Manifest
+
+
+def _manifest(layer: LayerConfig) -> Manifest:
+    return Manifest(
+        settings=incremental.settings(layer),
+        distributions={'pyyaml': '5.3', 'six': '1.16.0'},
+        files={
+            'yaml/__init__.py': FileRecord('PyYAML', 'a'),
+            'six.py': FileRecord('six', 'b')
+        }
+    )
+
+
+def test_changed_and_kept(tmp_path):
+    layer = LayerConfig('layer', '0.0.1', ('pyyaml', 'six'))
+    previous = incremental.Previous(_manifest(layer), tmp_path)
+    resolved = {'pyyaml': '5.4', 'toml': '0.10.2'}
+    changed = previous.manifest.changed(resolved)
+    assert changed == ['pyyaml', 'toml']
+    # PyYAML is being installed again, and six is gone.
+    assert incremental.kept(previous, changed, resolved) == {}
+    assert incremental.kept(
+        previous, ['pyyaml'], {**resolved, 'six': '1.16.0'}
+    ) == {
+        'six.py': FileRecord('six', 'b')
+    }
+
+
+def test_store(tmp_path):
+    store = incremental.Store(tmp_path)
+    layer = LayerConfig('layer', '0.0.1', ('pyyaml', 'six'))
+    assert store.previous(layer) is None
+    for data in (b'first', b'second'):
+        with store.sink(layer, _manifest(layer)).open('layer.zip') as writer:
+            writer.write(data)
+    previous = store.previous(layer._replace(version='0.0.2'))
+    assert previous.manifest == _manifest(layer)
+    assert previous.archive.read_bytes() == b'second'
+    # If the settings change, there's nothing to patch.
+    assert store.previous(layer._replace(compression_level=9)) is None
+    assert [path.name for path in tmp_path.iterdir()] == ['layer']
+
+
+def test_make(tmp_path, monkeypatch, capsys, wheel):
+    monkeypatch.setenv('LAMBDA_LAYER_CACHE_DIR', str(tmp_path / 'cache'))
+    wheelhouse = tmp_path / 'wheelhouse'
+    wheelhouse.mkdir()
+    wheel(wheelhouse, 'pkga')
+    wheel(wheelhouse, 'pkgb')
+    installed = []
+    install_target = bash._install_target  # pylint: disable=protected-access
+
+    def _install_target(target, requirements, **kwargs):
+        installed.append(requirements.read_text().split())
+        return install_target(target, requirements, **kwargs)
+
+    monkeypatch.setattr(bash, '_install_target', _install_target)
+    layer = LayerConfig(
+        'layer', '1.0', ('pkga', 'pkgb'), incremental=True, reproducible=True
+    )
+
+    def _make():
+        archive = bash.make(
+            tmp_path / 'dist', layer, silent=True, wheelhouse=wheelhouse
+        )
+        with zipfile.ZipFile(archive) as _zip:
+            return {
+                name: _zip.read(name) for name in _zip.namelist()
+                if name.endswith('__init__.py')
+            }
+
+    assert _make() == {
+        'python/pkga/__init__.py': b"VERSION = '1.0'\n",
+        'python/pkgb/__init__.py': b"VERSION = '1.0'\n"
+    }
+    # (It isn't built in a virtual environment, and it says so.)
+    assert 'pip install --target' in capsys.readouterr().out
+    # Only the distribution that changed is installed again, and the last
+    # build is patched with it.
+    wheel(wheelhouse, 'pkgb', version='2.0')
+    assert _make() == {
+        'python/pkga/__init__.py': b"VERSION = '1.0'\n",
+        'python/pkgb/__init__.py': b"VERSION = '2.0'\n"
+    }
+    assert installed == [['pkga', 'pkgb'], ['pkgb==2.0']]
+    capsys.readouterr()
+    layer = layer._replace(venv=False)
+    _make()
+    assert 'pip install --target' not in capsys.readouterr().out
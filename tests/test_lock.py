@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import pytest
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import lock, wheelhouse
+from lambda_layer.package.bash import pinned_versions
+
+_LAYER = LayerConfig(name='api', version='1', packages=('requests',))
+
+
+def _locked(layer: LayerConfig = _LAYER) -> lock.LockedLayer:
+    return lock.LockedLayer(
+        name=layer.name,
+        digest=lock.digest(layer),
+        distributions=(
+            lock.LockedDistribution(
+                name='idna', version='3.6', hashes=('sha256:abc',)
+            ),
+            lock.LockedDistribution(
+                name='requests', version='2.31.0', hashes=('sha256:def',)
+            )
+        )
+    )
+
+
+def test_lockfile_round_trip(tmp_path):
+    lockf = lock.path(tmp_path / '.lambda-layer.toml')
+    assert lockf.name == '.lambda-layer.lock'
+    assert lock.Lock.loadf(lockf).layers == {}
+    lockf.write_text(lock.Lock(layers={}).update([_locked()]).dumps())
+    assert lock.Lock.loadf(lockf).layers == {'api': _locked()}
+
+
+def test_stale():
+    _lock = lock.Lock(layers={'api': _locked()})
+    assert _lock.get(_LAYER) == _locked()
+    # Changing the layer's version (or how it's archived) doesn't matter...
+    assert _lock.get(_LAYER._replace(version='2', reproducible=True))
+    # ...but changing its requirements does.
+    assert _lock.get(_LAYER._replace(packages=('requests<2.31',))) is None
+    assert _lock.get(_LAYER._replace(deps=False)) is None
+    assert _lock.get(_LAYER._replace(name='worker')) is None
+
+
+def test_apply():
+    layer = _locked().apply(_LAYER)
+    assert layer.packages == (
+        'idna==3.6 --hash=sha256:abc',
+        'requests==2.31.0 --hash=sha256:def'
+    )
+    assert not layer.deps
+    # A locked layer doesn't have to be resolved again.
+    assert pinned_versions(layer) == {'idna': '3.6', 'requests': '2.31.0'}
+    assert pinned_versions(_LAYER) is None
+    assert pinned_versions(layer._replace(packages=('requests>=2',))) is None
+
+
+def test_hashes():
+    assert lock._hashes({
+        'download_info': {
+            'archive_info': {'hashes': {'sha256': 'abc', 'md5': 'def'}}
+        }
+    }) == ('md5:def', 'sha256:abc')
+    assert lock._hashes({
+        'download_info': {'archive_info': {'hash': 'sha256=abc'}}
+    }) == ('sha256:abc',)
+    assert lock._hashes({'download_info': {'dir_info': {}}}) == ()
+
+
+def test_direct():
+    item = {
+        'metadata': {'name': 'My_Pkg', 'version': '1.0'},
+        'is_direct': True,
+        'download_info': {
+            'url': 'https://example.com/my_pkg-1.0.tar.gz',
+            'archive_info': {'hashes': {'sha256': 'abc'}}
+        }
+    }
+    distribution = lock._distribution(item)
+    assert distribution.requirement == (
+        'my_pkg @ https://example.com/my_pkg-1.0.tar.gz --hash=sha256:abc'
+    )
+    locked = lock.LockedLayer(
+        name='api', digest='', distributions=(distribution,)
+    )
+    assert lock.LockedLayer.load(locked.to_dict()) == locked
+    # (Distributions from an index don't have a URL.)
+    assert 'url' not in _locked().to_dict()['distributions'][0]
+    # There's nothing to check a directory (or a repository) against.
+    with pytest.raises(ValueError, match='my_pkg'):
+        lock._distribution({
+            **item,
+            'download_info': {'url': 'file:///src/my_pkg', 'dir_info': {}}
+        })
+
+
+def test_rehash(tmp_path):
+    marker = tmp_path / '.downloads' / 'idna-3.6.tar.gz.built'
+    marker.parent.mkdir()
+    marker.write_text(json.dumps({
+        'sha256': 'abc', 'wheels': {'idna-3.6-py3-none-any.whl': 'fed'}
+    }))
+    (tmp_path / '.downloads' / 'six-1.0.tar.gz.built').touch()
+    wheels = wheelhouse.built(tmp_path)
+    assert wheels == {'abc': ('fed',)}
+    # The wheel built from the source distribution passes the hash check,
+    # too.
+    layer = wheelhouse.rehash(_locked().apply(_LAYER), wheels)
+    assert layer.packages == (
+        'idna==3.6 --hash=sha256:abc --hash=sha256:fed',
+        'requests==2.31.0 --hash=sha256:def'
+    )
+    assert wheelhouse.rehash(layer, wheels) == layer
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+import click
+import pytest
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import parallel
+
+
+def _fake_make(dist_dir, layer, silent=False, **_):
+    click.echo(f"building {layer.name}")
+    if layer.name == 'broken':
+        sys.exit(2)
+    return Path(dist_dir) / f"{layer.name}-{layer.version}.zip"
+
+
+def test_build_captures_output(monkeypatch, tmp_path):
+    monkeypatch.setattr(parallel, 'make', _fake_make)
+    result = parallel.build(
+        str(tmp_path), LayerConfig('one', '0.0.1', ()), capture=True
+    )
+    assert result.ok
+    assert 'building one' in result.output
+    assert result.archive == str(tmp_path / 'one-0.0.1.zip')
+
+
+def test_make_all_reports_failures(monkeypatch, tmp_path):
+    monkeypatch.setattr(parallel, 'make', _fake_make)
+    results = parallel.make_all(
+        dist_dir=tmp_path,
+        layers=[
+            LayerConfig('one', '0.0.1', ()),
+            LayerConfig('broken', '0.0.1', ())
+        ],
+        jobs=1
+    )
+    assert [result.name for result in results] == ['one', 'broken']
+    assert results[0].ok
+    assert not results[1].ok
+    assert 'code 2' in results[1].error
+    table = parallel.summary(results)
+    assert 'broken' in table
+    assert 'failed' in table
+
+
+def _pid_make(dist_dir, layer, silent=False, **_):
+    # (The first layer takes longest, so it finishes last.)
+    if layer.name == 'slow':
+        time.sleep(0.5)
+    click.echo(f"built in {os.getpid()}")
+    return Path(dist_dir) / f"{layer.name}-{layer.version}.zip"
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != 'fork',
+    reason="the stubbed make only reaches forked workers"
+)
+def test_make_all_in_processes(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(parallel, 'make', _pid_make)
+    results = parallel.make_all(
+        dist_dir=tmp_path,
+        layers=[
+            LayerConfig('slow', '0.0.1', ()),
+            LayerConfig('fast', '0.0.1', ())
+        ],
+        jobs=2
+    )
+    # The results come back in the same order as the layers...
+    assert [result.name for result in results] == ['slow', 'fast']
+    assert all(result.ok for result in results)
+    assert results[0].archive == str(tmp_path / 'slow-0.0.1.zip')
+    # ...but each layer's output is written (tagged with the layer's name)
+    # as soon as it's built, in a worker process of its own.
+    lines = [
+        line for line in capsys.readouterr().out.splitlines()
+        if 'built in' in line
+    ]
+    assert [line.split(']')[0] for line in lines] == ['[fast', '[slow']
+    assert str(os.getpid()) not in ' '.join(lines)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+from lambda_layer.config import PruneConfig
+from lambda_layer.package.prune import matches, prune
+
+
+def _touch(root: Path, *paths: str):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text('x' * 10)
+
+
+def test_matches():
+    assert matches('pkg/tests/test_a.py', ['**/tests/**'])
+    assert matches('tests/test_a.py', ['**/tests/**'])
+    assert matches('requests-2.22.0.dist-info/RECORD', ['*.dist-info/RECORD'])
+    assert not matches('pkg/a.py', ['*.py'])
+    assert matches('pkg/a.py', ['**/*.py'])
+
+
+def test_prune_defaults(tmp_path):
+    _touch(
+        tmp_path,
+        'pkg/__init__.py',
+        'pkg/__init__.pyi',
+        'pkg/tests/test_pkg.py',
+        'pkg/__pycache__/__init__.cpython-38.pyc',
+        'pkg/__pycache__/__init__.cpython-37.pyc',
+        'pkg-1.0.dist-info/METADATA',
+        'pkg-1.0.dist-info/RECORD',
+        'pip/__init__.py'
+    )
+    result = prune(tmp_path, PruneConfig(), cache_tag='cpython-38')
+    assert result.files == 5
+    assert result.size == 50
+    assert sorted(
+        path.relative_to(tmp_path).as_posix()
+        for path in tmp_path.rglob('*') if path.is_file()
+    ) == [
+        'pkg-1.0.dist-info/METADATA',
+        'pkg/__init__.py',
+        'pkg/__pycache__/__init__.cpython-38.pyc'
+    ]
+    assert not (tmp_path / 'pip').exists()
+
+
+def test_prune_include_overrides_exclude(tmp_path):
+    _touch(tmp_path, 'pkg/tests/fixture.json', 'pkg/data/big.csv')
+    result = prune(
+        tmp_path,
+        PruneConfig(
+            exclude=('**/*.csv',),
+            include=('pkg/tests/**',),
+        )
+    )
+    assert result.files == 1
+    assert (tmp_path / 'pkg' / 'tests' / 'fixture.json').exists()
+
+
+def test_prune_keeps_requested_tools(tmp_path):
+    _touch(
+        tmp_path,
+        'setuptools/__init__.py',
+        'setuptools-69.0.0.dist-info/METADATA',
+        'pkg_resources/__init__.py',
+        'pip/__init__.py',
+        'tests/__init__.py'
+    )
+    # A layer that asks for setuptools keeps it (but not pip)...
+    result = prune(tmp_path, PruneConfig(), keep=['setuptools', 'pkg'])
+    assert result.files == 1
+    assert (tmp_path / 'pkg_resources' / '__init__.py').exists()
+    assert not (tmp_path / 'pip').exists()
+    # ...and a top-level `tests` package is a distribution's own.
+    assert (tmp_path / 'tests' / '__init__.py').exists()
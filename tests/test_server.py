@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+from pathlib import Path
+import threading
+import time
+import pytest
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import server
+from lambda_layer.package.parallel import LayerResult
+from lambda_layer.package.sinks import LocalSink
+from lambda_layer.package.targets import archive_name
+
+
+def test_build(tmp_path, monkeypatch):
+    built = []
+    seen = []
+
+    def _build(dist_dir, layer, silent=False, capture=True, **options):
+        built.append(layer.name)
+        seen.append(os.environ.get('PIP_INDEX_URL'))
+        time.sleep(0.3)
+        archive = Path(dist_dir) / archive_name(layer)
+        archive.parent.mkdir(parents=True, exist_ok=True)
+        archive.write_bytes(b'zip')
+        return LayerResult(
+            name=layer.name,
+            version=layer.version,
+            archive=str(archive),
+            elapsed=0.3,
+            output='built\n'
+        )
+
+    monkeypatch.setattr(server, 'build', _build)
+    _server = server.BuildServer(
+        tmp_path / 'server.sock',
+        dist_dir=tmp_path / 'builds',
+        jobs=2,
+        pool=ThreadPoolExecutor(max_workers=2)
+    )
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    client = server.Client(tmp_path / 'server.sock')
+    layer = LayerConfig('api', '1.0', ('six',))
+    try:
+        assert client.available()
+        # The second job waits for the first one (instead of building the
+        # layer all over again).
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            jobs = list(pool.map(lambda _: client.build(layer), range(2)))
+        assert built == ['api']
+        assert sorted(job.shared for job in jobs) == [False, True]
+        assert jobs[0].sha256 == hashlib.sha256(b'zip').hexdigest()
+        assert jobs[0].size == 3
+        # The client copies the archive to wherever it's going.
+        results = server.make_all(
+            client, [layer], sink=LocalSink(tmp_path / 'dist'), silent=True
+        )
+        assert results[0].ok
+        assert (tmp_path / 'dist' / 'api-1.0.zip').read_bytes() == b'zip'
+        assert client.status()['built'] == 2
+        # Builds from different wheelhouses aren't shared.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            jobs = list(pool.map(
+                lambda wheelhouse: client.build(layer, wheelhouse=wheelhouse),
+                [None, str(tmp_path)]
+            ))
+        assert not any(job.shared for job in jobs)
+        # (Nor are their archives built in the same directory.)
+        assert jobs[0].archive != jobs[1].archive
+        # A server that wouldn't build the layers the way we would isn't
+        # used.
+        assert client.problem() is None
+        status = client.status()
+        monkeypatch.setattr(
+            client, 'status', lambda: {**status, 'version': '0.0.0'}
+        )
+        assert 'version 0.0.0' in client.problem()
+        # (The key has to be a build cache key.)
+        # pylint: disable=protected-access
+        with pytest.raises(RuntimeError):
+            client._request('POST', '/build', {
+                'layer': layer.to_dict(), 'key': '../api', 'cwd': '/'
+            })
+        # The layer is built with the client's pip settings (and nothing
+        # else from its environment)...
+        monkeypatch.delenv('PIP_INDEX_URL', raising=False)
+        job = client._request('POST', '/build', {
+            'layer': layer.to_dict(),
+            'key': jobs[0].key,
+            'cwd': str(tmp_path),
+            'environment': {
+                'PIP_INDEX_URL': 'https://index.example/simple',
+                'PATH': '/nowhere'
+            }
+        })
+        assert seen[-1] == 'https://index.example/simple'
+        assert 'PIP_INDEX_URL' not in os.environ
+        # ...so it's built apart from the builds with other settings.
+        assert job['archive'] != jobs[0].archive
+    finally:
+        _server.shutdown()
+        _server.server_close()
+    assert not client.available()
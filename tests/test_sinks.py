@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import os
+from pathlib import Path
+import zipfile
+import pytest
+from lambda_layer.package import archive, sinks
+
+
+def _tree(path: Path, size: int = 1024) -> Path:
+    (path / 'pkg').mkdir(parents=True)
+    (path / 'pkg' / '__init__.py').write_text('import os\n' * 100)
+    (path / 'pkg' / 'data.bin').write_bytes(os.urandom(size))
+    return path
+
+
+def _write(sink: sinks.Sink, site_packages: Path) -> sinks.SinkWriter:
+    with sink.open('layer.zip') as writer:
+        archive.create(site_packages, writer, reproducible=True)
+    return writer
+
+
+def test_local_sink_skips_unchanged(tmp_path):
+    site_packages = _tree(tmp_path / 'site-packages')
+    sink = sinks.LocalSink(tmp_path / 'dist')
+    dist_path = tmp_path / 'dist' / 'layer.zip'
+    writer = _write(sink, site_packages)
+    assert writer.changed
+    assert writer.location == str(dist_path)
+    assert archive.sidecar(dist_path).read_text().split() == [
+        archive.sha256(dist_path), 'layer.zip'
+    ]
+    with zipfile.ZipFile(str(dist_path)) as _zip:
+        assert _zip.testzip() is None
+    assert not _write(sink, site_packages).changed
+    # Nothing is left behind.
+    assert sorted(path.name for path in dist_path.parent.iterdir()) == [
+        'layer.zip', 'layer.zip.sha256'
+    ]
+
+
+def test_local_sink_aborts(tmp_path):
+    sink = sinks.LocalSink(tmp_path)
+    with pytest.raises(ValueError):
+        with sink.open('layer.zip') as writer:
+            writer.write(b'partial')
+            raise ValueError()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stream_sink(tmp_path):
+    stream = io.BytesIO()
+    _write(sinks.StreamSink(stream), _tree(tmp_path))
+    with zipfile.ZipFile(io.BytesIO(stream.getvalue())) as _zip:
+        assert _zip.testzip() is None
+        assert 'python/pkg/data.bin' in _zip.namelist()
+
+
+def test_tee_sink(tmp_path):
+    stream = io.BytesIO()
+    sink = sinks.TeeSink(
+        sinks.LocalSink(tmp_path / 'dist'), sinks.StreamSink(stream)
+    )
+    writer = _write(sink, _tree(tmp_path / 'site-packages'))
+    assert writer.location == str(tmp_path / 'dist' / 'layer.zip')
+    assert stream.getvalue() == (tmp_path / 'dist' / 'layer.zip').read_bytes()
+
+
+def test_sink_for_output(tmp_path):
+    assert isinstance(sinks.sink('-'), sinks.StreamSink)
+    s3 = sinks.sink('s3://bucket/layers/')
+    assert (s3.bucket, s3.prefix) == ('bucket', 'layers')
+    assert sinks.sink(tmp_path).path == tmp_path
+
+
+@pytest.fixture
+def s3_client():
+    boto3 = pytest.importorskip('boto3')
+    server = pytest.importorskip('moto.server')
+    # A local stand-in for S3.
+    moto = server.ThreadedMotoServer(port=0, verbose=False)
+    moto.start()
+    host, port = moto.get_host_and_port()
+    try:
+        client = boto3.client(
+            's3',
+            endpoint_url=f"http://{host}:{port}",
+            region_name='us-east-1',
+            aws_access_key_id='testing',
+            aws_secret_access_key='testing'
+        )
+        client.create_bucket(Bucket='layers')
+        yield client
+    finally:
+        moto.stop()
+
+
+def test_s3_sink_uploads_in_parts(tmp_path, s3_client):
+    site_packages = _tree(tmp_path, size=sinks.MIN_PART_SIZE * 2)
+    sink = sinks.S3Sink(
+        bucket='layers',
+        prefix='dev',
+        client=s3_client,
+        part_size=sinks.MIN_PART_SIZE
+    )
+    writer = _write(sink, site_packages)
+    assert writer.changed
+    assert writer.location == 's3://layers/dev/layer.zip'
+    head = s3_client.head_object(Bucket='layers', Key='dev/layer.zip')
+    # Multipart uploads have ETags like "<digest>-<parts>".
+    assert head['ETag'].strip('"').endswith('-3')
+    data = s3_client.get_object(
+        Bucket='layers', Key='dev/layer.zip'
+    )['Body'].read()
+    stream = io.BytesIO()
+    _write(sinks.StreamSink(stream), site_packages)
+    assert data == stream.getvalue()
+    with zipfile.ZipFile(io.BytesIO(data)) as _zip:
+        assert _zip.testzip() is None
+    # The same archive isn't uploaded again.
+    assert not _write(sink, site_packages).changed
+    assert not s3_client.list_multipart_uploads(
+        Bucket='layers'
+    ).get('Uploads')
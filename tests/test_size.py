@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+import pytest
+from lambda_layer.config import CompressionConfig
+from lambda_layer.package import archive, size
+from lambda_layer.package.compression import Policy
+
+
+def _layer(root: Path) -> Path:
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'pkg' / '__init__.py').write_text('x = 1\n' * 1000)
+    (root / 'pkg' / 'data.txt').write_text('data\n' * 1000)
+    (root / 'pkg-1.0.dist-info').mkdir()
+    (root / 'pkg-1.0.dist-info' / 'RECORD').write_text(
+        'pkg/__init__.py,sha256=x,6000\n'
+        'pkg-1.0.dist-info/RECORD,,\n'
+    )
+    (root / 'pkg-1.0.dist-info' / 'top_level.txt').write_text('pkg\n')
+    (root / 'other.py').write_text('y = 2\n')
+    return root
+
+
+def test_owners(tmp_path):
+    owners = size.Owners.read(_layer(tmp_path))
+    assert owners.owner('pkg/__init__.py') == 'pkg'
+    assert owners.owner('pkg/__pycache__/__init__.cpython-38.pyc') == 'pkg'
+    assert owners.owner('pkg/data.txt') == 'pkg'
+    assert owners.owner('other.py') == 'other'
+
+
+def test_analyze(tmp_path):
+    report = size.analyze(_layer(tmp_path))
+    assert [package.name for package in report.packages] == ['pkg', 'other']
+    assert report.packages[0].files == 4
+    assert report.size == sum(
+        path.stat().st_size for path in tmp_path.rglob('*') if path.is_file()
+    )
+    assert report.compressed < report.size
+    assert 'total' in size.table(report, limit=1024)
+    # Files the layer's compression rules store aren't any smaller.
+    stored = size.analyze(tmp_path, policy=Policy(
+        CompressionConfig(store=('**',)), level=6
+    ))
+    assert stored.compressed == stored.size
+
+
+def test_analyze_archive_matches(tmp_path):
+    root = _layer(tmp_path / 'python')
+    report = size.analyze(root)
+    built = archive.create(root, tmp_path / 'layer.zip')
+    archived = size.analyze_archive(built)
+    assert [
+        (package.name, package.files, package.size)
+        for package in archived.packages
+    ] == [
+        (package.name, package.files, package.size)
+        for package in report.packages
+    ]
+
+
+def test_check(tmp_path):
+    report = size.analyze(_layer(tmp_path))
+    size.check(report, limit=None)
+    with pytest.raises(size.SizeLimitError):
+        size.check(report, limit=100)
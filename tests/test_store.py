@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from lambda_layer.package.store import Distribution, PackageStore
+
+_ITEM = {
+    'metadata': {'name': 'PyYAML', 'version': '6.0.1'},
+    'download_info': {
+        'url': 'https://files.example/PyYAML-6.0.1-cp312-cp312-'
+               'manylinux_2_17_x86_64.whl',
+        'archive_info': {'hashes': {'sha256': 'ab' * 32}}
+    }
+}
+
+
+def test_from_report():
+    distribution = Distribution.from_report(_ITEM, built_for='cpython-312')
+    assert distribution.key == (
+        f"pyyaml-6.0.1-cp312-cp312-manylinux_2_17_x86_64-{'ab' * 8}"
+    )
+    assert distribution.filename.endswith('x86_64.whl')
+    # Source distributions are kept by what they're built for.
+    sdist = Distribution.from_report({
+        **_ITEM,
+        'download_info': {
+            'url': 'https://files.example/PyYAML-6.0.1.tar.gz',
+            'archive_info': {'hash': f"sha256={'cd' * 32}"}
+        }
+    }, built_for='cpython-312-x86_64')
+    assert sdist.tag == 'cpython-312-x86_64'
+    assert sdist.sha256 == 'cd' * 32
+    # There's no way to tell one local directory from the next.
+    assert Distribution.from_report({
+        **_ITEM, 'download_info': {'url': 'file:///src/pyyaml', 'dir_info': {}}
+    }, built_for='cpython-312') is None
+
+
+def test_link(tmp_path):
+    store = PackageStore(tmp_path / 'store')
+    distributions = [
+        Distribution.from_report(
+            {**_ITEM, 'metadata': {'name': name, 'version': '1.0'}},
+            built_for='cpython-312'
+        )
+        for name in ('ns-a', 'ns-b')
+    ]
+    assert store.missing(distributions) == distributions
+    for distribution in distributions:
+        tree = store.staging(distribution)
+        (tree / 'ns' / distribution.name).mkdir(parents=True)
+        (tree / 'ns' / distribution.name / 'mod.py').write_text('x = 1')
+        store.add(distribution, tree)
+    assert store.missing(distributions) == []
+    root = tmp_path / 'python'
+    assert store.link(distributions, root) == (2, 0)
+    # Both distributions share the namespace package, and the files are the
+    # very same files as the ones in the store.
+    linked = root / 'ns' / 'ns_a' / 'mod.py'
+    assert linked.read_text() == 'x = 1'
+    assert linked.stat().st_nlink == 2
+    assert store.clear() == 2
+    assert store.missing(distributions) == distributions
+
+
+def test_prune(tmp_path):
+    store = PackageStore(tmp_path / 'store', max_size=0)
+    for idx, name in enumerate(('old', 'new')):
+        entry = store.path / name
+        entry.mkdir(parents=True)
+        (entry / 'mod.py').write_text('x' * 10)
+        os.utime(str(entry), (idx, idx))
+    # (Abandoned staging directories are cleaned up, too.)
+    staging = store.path / '.stale.abc'
+    staging.mkdir()
+    os.utime(str(staging), (0, 0))
+    # The least-recently used distributions go first.
+    assert store.prune(max_size=10) == 1
+    # (The lock file stays.)
+    assert sorted(path.name for path in store.path.iterdir()) == [
+        '.lock', 'new'
+    ]
+    assert store.prune() == 1
+    assert [path.name for path in store.path.iterdir()] == ['.lock']
+
+
+def test_lock(tmp_path):
+    store = PackageStore(tmp_path / 'store', max_size=0)
+    distribution = Distribution.from_report(_ITEM, built_for='cpython-312')
+    entry = store.path / distribution.key
+    entry.mkdir(parents=True)
+    (entry / 'mod.py').write_text('x = 1')
+    removed = []
+    pruning = threading.Thread(target=lambda: removed.append(store.prune()))
+    with store.lock():
+        # A build that's using the store keeps its distributions there...
+        assert store.prune(wait=False) == 0
+        pruning.start()
+        time.sleep(0.2)
+        assert not removed and entry.is_dir()
+        # ...until it's linked them.
+        assert store.link([distribution], tmp_path / 'python') == (1, 0)
+    pruning.join(timeout=10)
+    assert removed == [1] and not entry.exists()
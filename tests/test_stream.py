@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import sys
+from lambda_layer.package import stream
+
+_CHATTY = (
+    "import sys\n"
+    "for i in range(5000):\n"
+    "    print(f'out {i}')\n"
+    "    print(f'err {i}', file=sys.stderr)\n"
+    "sys.exit(3)\n"
+)
+
+
+def test_run():
+    forwarded = []
+    returncode, output = stream.run(
+        [sys.executable, '-c', _CHATTY],
+        forward=forwarded.append,
+        tail=10
+    )
+    assert returncode == 3
+    assert len(forwarded) == 10000
+    # Each stream comes through in order.
+    assert [
+        line.text for line in forwarded if line.stream == stream.STDERR
+    ] == [f"err {i}" for i in range(5000)]
+    # Only the last few lines are kept, and from the right stream.
+    assert output.stdout.split('\n') == [
+        f"out {i}" for i in range(4990, 5000)
+    ]
+    assert output.stderr.split('\n') == [
+        f"err {i}" for i in range(4990, 5000)
+    ]
+
+
+def test_format_line():
+    line = stream.Line(
+        stream=stream.STDOUT, text='hello', time=datetime(2020, 1, 20, 9, 5)
+    )
+    assert stream.format_line(line, 'install') == '09:05:00 install | hello'
+    assert stream.format_line(line) == '09:05:00 hello'
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import shutil
+import subprocess
+import pytest
+from lambda_layer.package import size, strip
+
+
+@pytest.mark.skipif(
+    not (shutil.which('cc') and shutil.which('strip')),
+    reason='needs a C compiler and strip'
+)
+def test_strip(tmp_path):
+    source = tmp_path / 'ext.c'
+    source.write_text('int answer(void) { return 42; }\n')
+    ext = tmp_path / 'pkg' / 'ext.cpython-38-x86_64-linux-gnu.so'
+    ext.parent.mkdir()
+    subprocess.run(
+        ['cc', '-g', '-shared', '-fPIC', '-o', str(ext), str(source)],
+        check=True
+    )
+    (tmp_path / 'pkg' / 'fake.so').write_bytes(b'not really')
+    assert strip.shared_objects(tmp_path) == [ext]
+    results = strip.strip(tmp_path)
+    assert len(results) == 1
+    assert results[0].error is None
+    assert results[0].saved > 0
+    assert ext.stat().st_size == results[0].after
+    # Savings are reported for the distribution that owns the files.
+    dist_info = tmp_path / 'my_dist-1.0.dist-info'
+    dist_info.mkdir()
+    (dist_info / 'top_level.txt').write_text('pkg\n')
+    assert strip.savings(
+        tmp_path, results, size.Owners.read(tmp_path).owner
+    ) == {'my_dist': results[0].saved}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import targets
+
+_LAYER = LayerConfig(name='api', version='1.0', packages=('pyyaml',))
+
+
+def test_expand():
+    assert targets.expand(_LAYER) == (_LAYER,)
+    layers = targets.expand(_LAYER._replace(
+        platforms=('x86_64', 'arm64'), pythons=('3.11', '3.12')
+    ))
+    assert [targets.archive_name(layer) for layer in layers] == [
+        'api-1.0-py3.11-x86_64.zip',
+        'api-1.0-py3.11-arm64.zip',
+        'api-1.0-py3.12-x86_64.zip',
+        'api-1.0-py3.12-arm64.zip'
+    ]
+    assert targets.label(layers[-1]) == 'api-py3.12-arm64'
+    assert targets.target(layers[-1]) == targets.Target('3.12', 'arm64')
+    # A layer for a single target is already expanded.
+    assert targets.expand(layers[-1]) == (layers[-1],)
+    with pytest.raises(ValueError):
+        targets.expand(_LAYER._replace(platforms=('sparc',)))
+
+
+def test_host_target():
+    assert targets.target(_LAYER) is None
+    assert targets.archive_name(_LAYER) == 'api-1.0.zip'
+    # Whatever isn't listed comes from the interpreter we're running.
+    target = targets.target(_LAYER._replace(platforms=('arm64',)))
+    assert target == targets.host()._replace(platform='arm64')
+    assert target.native()
+    # (Native code built for the other architecture won't load here.)
+    assert not targets.host().foreign()
+    assert targets.host()._replace(
+        platform='x86_64' if targets.host().platform == 'arm64' else 'arm64'
+    ).foreign()
+
+
+def test_pip_options():
+    al2 = targets.Target('3.11', 'arm64').platforms()
+    assert al2[0] == 'manylinux_2_26_aarch64'
+    assert al2[-2:] == ['manylinux_2_17_aarch64', 'manylinux2014_aarch64']
+    al2023 = targets.Target('3.12', 'x86_64').platforms()
+    assert al2023[0] == 'manylinux_2_34_x86_64'
+    assert al2023[-1] == 'manylinux1_x86_64'
+    options = targets.Target('3.12', 'x86_64').pip_options()
+    assert options[:2] == ['--platform', 'manylinux_2_34_x86_64']
+    assert options[-5:] == [
+        '--python-version', '3.12', '--implementation', 'cp',
+        '--only-binary=:all:'
+    ]
+    assert targets.Target('3.12', 'x86_64').cache_tag == 'cpython-312'
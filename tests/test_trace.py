@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from contextvars import copy_context
+import sys
+import time
+from lambda_layer.package import trace
+from lambda_layer.package.bash import run
+
+
+@trace.traced('work')
+def _work():
+    trace.annotate(files=3)
+    return run([sys.executable, '-c', 'print("hi")'], silent=True)
+
+
+def test_spans():
+    trace.collect()
+    assert _work().stdout == 'hi'
+    process, stage = trace.collect()
+    # The process finishes (and is recorded) inside the stage.
+    assert (process.name, process.category) == ('command', trace.PROCESS)
+    assert process.args['returncode'] == 0
+    assert (stage.name, stage.category) == ('work', trace.STAGE)
+    assert stage.args == {'files': 3}
+    assert stage.start <= process.start
+    assert stage.wall >= process.wall > 0
+    # The child's CPU time counts too.
+    assert stage.cpu >= process.cpu > 0
+    assert stage.peak_rss > 0
+    assert trace.collect() == ()
+
+
+def test_chrome_and_summary():
+    trace.collect()
+    with trace.span('install', files=2):
+        pass
+    _work()
+    layers = {'api': trace.collect(), 'worker': ()}
+    events = trace.chrome(layers)['traceEvents']
+    assert [
+        (event['ph'], event['pid'], event['name']) for event in events
+    ] == [
+        ('M', 1, 'process_name'),
+        ('X', 1, 'install'),
+        ('X', 1, 'command'),
+        ('X', 1, 'work'),
+        ('M', 2, 'process_name')
+    ]
+    assert events[1]['ts'] == 0
+    summary = trace.summary(layers)
+    assert sorted(summary['api']['stages']) == ['install', 'work']
+    assert summary['api']['stages']['install']['files'] == 2
+    assert summary['worker'] == {'wall_s': 0, 'stages': {}}
+
+
+def test_isolated():
+    def _isolated():
+        trace.isolate()
+        with trace.span('install'):
+            pass
+        return trace.collect()
+
+    # A context that shares the process with other builds only knows how
+    # long things took.
+    spans = copy_context().run(_isolated)
+    assert spans[0].wall >= 0 and spans[0].cpu is None
+    assert trace.summary({'api': spans})['api']['stages']['install'] == {
+        'count': 1, 'wall_s': round(spans[0].wall, 6), 'files': 0
+    }
+    event = trace.chrome({'api': spans})['traceEvents'][1]
+    assert 'cpu_s' not in event['args']
+
+
+def test_nested():
+    trace.collect()
+    with trace.span('install'):
+        with trace.span('resolve'):
+            time.sleep(0.01)
+    resolve, install = trace.collect()
+    assert resolve.nested and not install.nested
+    # The layer's time isn't counted twice.
+    summary = trace.summary({'api': (resolve, install)})['api']
+    assert summary['wall_s'] == round(install.wall, 6)
+    assert summary['stages']['resolve']['wall_s'] == round(resolve.wall, 6)
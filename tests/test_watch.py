@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from lambda_layer.config import Config
+from lambda_layer.package import watch
+
+_CONFIG = '''
+[[layers]]
+name = "api"
+version = "1.0"
+packages = ["-r {requirements}"]
+
+[[layers]]
+name = "jobs"
+version = "1.0"
+packages = ["six"]
+'''
+
+
+def test_poll(tmp_path):
+    configf = tmp_path / 'layers.toml'
+    requirements = tmp_path / 'requirements.txt'
+    requirements.write_text('six\n')
+    configf.write_text(_CONFIG.format(requirements=requirements))
+    watcher = watch.Watcher(
+        configf, load=lambda: Config.loadf(configf).layers, interval=0.01
+    )
+
+    def _names():
+        layers = watcher.poll()
+        return None if layers is None else [layer.name for layer in layers]
+
+    # Everything is built the first time around, and nothing after that
+    # (until something changes).
+    assert _names() == ['api', 'jobs']
+    assert _names() == []  # (The requirements file is watched now.)
+    assert _names() is None
+    configf.write_text(
+        _CONFIG.format(requirements=requirements).replace('six', 'attrs')
+    )
+    assert _names() == ['jobs']
+    requirements.write_text('six\nattrs\n')
+    assert _names() == ['api']
+    # A configuration that won't load is reported (and the last good one is
+    # kept).
+    configf.write_text('[[layers]\n')
+    failed = []
+    built = []
+    watcher.watch(build=built.append, failed=failed.append, runs=2)
+    assert len(failed) == 1 and not built
+    assert set(watcher.snapshot.layers) == {'api', 'jobs'}
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from lambda_layer.config import LayerConfig
+from lambda_layer.package import wheelhouse
+
+
+def test_fill(tmp_path, monkeypatch, wheel):
+    index = tmp_path / 'index'
+    index.mkdir()
+    wheel(index, 'pkga')
+    wheel(index, 'pkgb', requires='pkga')
+    wheel(index, 'pkgc')
+    # (pip finds everything in the local "index".)
+    monkeypatch.setenv('PIP_NO_INDEX', '1')
+    monkeypatch.setenv('PIP_FIND_LINKS', str(index))
+    # Both layers need `pkga`, and they're downloaded at the same time.
+    layers = [
+        LayerConfig('api', '1.0', ('pkga',)),
+        LayerConfig('jobs', '1.0', ('pkgb', 'pkgc')),
+        LayerConfig('empty', '1.0', ())
+    ]
+    _wheelhouse = wheelhouse.fill(
+        tmp_path / 'wheelhouse', layers, jobs=2, silent=True
+    )
+    assert sorted(path.name for path in _wheelhouse.iterdir()) == [
+        '.downloads',
+        'pkga-1.0-py3-none-any.whl',
+        'pkgb-1.0-py3-none-any.whl',
+        'pkgc-1.0-py3-none-any.whl'
+    ]
+    # (There's nothing to build.)
+    assert not list((_wheelhouse / '.downloads').iterdir())
+    assert wheelhouse.built(_wheelhouse) == {}
+    # Filling it again finds everything in the wheelhouse itself.
+    for path in index.iterdir():
+        path.unlink()
+    wheelhouse.fill(_wheelhouse, layers, silent=True)
+    assert len(list(_wheelhouse.glob('*.whl'))) == 3